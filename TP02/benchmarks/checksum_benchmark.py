@@ -0,0 +1,67 @@
+"""
+    Micro-benchmark do cálculo do checksum de quadros DCCNET.
+
+    Compara o laço original (2 em 2 bytes com ``int.from_bytes``) com o módulo
+    ``utils.checksum`` para quadros cheios e para a troca do bit de id.
+
+    Execução (a partir da pasta TP02):
+        python -m benchmarks.checksum_benchmark
+"""
+
+import os
+import timeit
+from struct import pack, unpack
+
+from utils import constants
+from utils.checksum import internet_checksum, update_checksum
+
+def legacy_checksum(frame):
+    """ Cópia do laço usado anteriormente por ``BaseNode.compute_checksum`` """
+
+    aux_frame = frame
+    if len(frame) % 2 != 0:
+        aux_frame += b'\x00'
+
+    chksum = 0
+    for i in range(0, len(aux_frame), 2):
+        chksum += int.from_bytes(aux_frame[i:i+2], byteorder='big')
+
+    while (chksum >> 16) != 0:
+        chksum = (chksum >> 16) + (chksum & 0xffff)
+
+    return ~chksum & 0xffff
+
+def flip_id_full(frame):
+    """ Troca o bit de id e soma o quadro inteiro novamente """
+
+    frame = frame[:12] + bytes([frame[12] ^ 1]) + frame[13:]
+    frame = frame[:10] + b'\x00\x00' + frame[12:]
+    return internet_checksum(frame)
+
+def flip_id_incremental(frame):
+    """ Troca o bit de id atualizando o checksum de forma incremental """
+
+    chksum, old_word = unpack('!HH', frame[10:14])
+    return update_checksum(chksum, old_word, old_word ^ 0x0100)
+
+def bench(label, func, arg, number):
+    seconds = min(timeit.repeat(lambda: func(arg), number=number, repeat=3)) / number
+    print('{:<40} {:>12.2f} us/quadro'.format(label, seconds * 1e6))
+    return seconds
+
+if __name__ == '__main__':
+    for length in (1, 1024, constants.MAX_LENGTH):
+        payload = os.urandom(length)
+        frame = pack(constants.HEADER_FORMAT, constants.SYNC, constants.SYNC, length, 0, 0, 0) + payload
+        assert legacy_checksum(frame) == internet_checksum(frame)
+
+        number = 20 if length > 1024 else 2000
+        print('quadro com {} bytes de dados'.format(length))
+        legacy = bench('  laço 2 em 2 bytes', legacy_checksum, frame, number)
+        vectorized = bench('  int.from_bytes do buffer inteiro', internet_checksum, frame, number)
+        print('  speedup: {:.1f}x'.format(legacy / vectorized))
+
+        frame = frame[:10] + pack('!H', internet_checksum(frame)) + frame[12:]
+        full = bench('  troca de id (soma completa)', flip_id_full, frame, number)
+        incremental = bench('  troca de id (RFC 1624)', flip_id_incremental, frame, number)
+        print('  speedup: {:.1f}x\n'.format(full / incremental))
@@ -0,0 +1,65 @@
+"""
+    Benchmark da codificação base16 dos quadros DCCNET.
+
+    Compara o caminho original (``b16encode`` a cada envio, inclusive retransmissões,
+    e ``b16decode`` em três pedaços de 16, 12 e 2*length bytes seguido da soma do
+    checksum) com o ``utils.codec`` (quadro codificado uma única vez e decodificado
+    de uma vez a partir de uma memoryview, com o checksum verificado na mesma chamada).
+
+    Execução (a partir da pasta TP02):
+        python -m benchmarks.codec_benchmark
+"""
+
+import os
+import timeit
+from base64 import b16encode as encode16
+from base64 import b16decode as decode16
+
+from utils import constants
+from utils.checksum import verify_checksum
+from utils.codec import encode, decode_verified
+from utils.frame_source import build_frame
+
+# Quantas vezes cada quadro é enviado (1 envio + retransmissões)
+TRANSMISSIONS = 3
+
+def legacy_send(frame):
+    for _ in range(TRANSMISSIONS):
+        encode16(frame)
+
+def cached_send(frame):
+    # As retransmissões reutilizam o quadro já codificado
+    encoded = encode(frame)
+    return [encoded] * TRANSMISSIONS
+
+def legacy_receive(encoded):
+    header = decode16(encoded[:16])
+    header += decode16(encoded[16:28])
+    frame = header + decode16(encoded[28:])
+    return verify_checksum(frame)
+
+def codec_receive(view):
+    return decode_verified(view) is not None
+
+def bench(label, func, arg, number):
+    seconds = min(timeit.repeat(lambda: func(arg), number=number, repeat=5)) / number
+    print('  {:<44} {:>10.2f} us/quadro'.format(label, seconds * 1e6))
+    return seconds
+
+if __name__ == '__main__':
+    for length in (64, 1024, constants.MAX_LENGTH):
+        frame = build_frame(0, constants.FLAG_DATA, os.urandom(length))
+        encoded = encode16(frame)
+        assert encode(frame) == encoded
+
+        number = 50 if length > 1024 else 5000
+        print('quadro com {} bytes de dados ({} envios por quadro)'.format(length, TRANSMISSIONS))
+
+        legacy = bench('envio: b16encode a cada envio', legacy_send, frame, number)
+        cached = bench('envio: codificação única', cached_send, frame, number)
+        print('  speedup: {:.1f}x'.format(legacy / cached))
+
+        legacy = bench('recebimento: b16decode em pedaços + checksum', legacy_receive, encoded, number)
+        view = memoryview(bytearray(encoded))
+        single = bench('recebimento: decode_verified da memoryview', codec_receive, view, number)
+        print('  speedup: {:.1f}x\n'.format(legacy / single))
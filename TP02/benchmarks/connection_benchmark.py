@@ -0,0 +1,279 @@
+"""
+    Benchmark (e teste aleatório) do núcleo do protocolo sem entrada e saída.
+
+    Duas ``DccnetConnection`` (ver utils/connection.py) trocam arquivos inteiramente em
+    memória: não há sockets, threads nem espera, o relógio é simulado e avança direto
+    para o próximo evento (chegada de um quadro no enlace ou temporizador de uma das
+    pontas). O enlace simulado tem atraso fixo e pode descartar, corromper (um bit
+    invertido), duplicar e atrasar (reordenar) quadros, com uma semente fixa, então
+    cada execução é reproduzível. Quando uma ponta fecha a conexão, a outra recebe o fim
+    do fluxo depois que os quadros em trânsito chegam, como no TCP.
+
+    O modo normal mede quantos quadros por segundo (de CPU) o núcleo processa em cada
+    configuração, sem o custo dos sockets. Com ``--fuzz N`` são executadas N trocas com
+    configurações e perdas sorteadas, verificando que os dois arquivos chegam íntegros e
+    que as duas pontas fecham a conexão. O pare-e-espere (ids de 1 bit) não tolera duplicatas nem
+    reordenação no enlace, então nele só há descarte e corrupção. A corrupção atinge
+    qualquer byte do quadro, inclusive o campo length (ver ``FrameReceiver.later_frame``).
+
+    Execução (a partir da pasta TP02):
+        python -m benchmarks.connection_benchmark
+        python -m benchmarks.connection_benchmark --size 16 --max-length 65535
+        python -m benchmarks.connection_benchmark --fuzz 200 --seed 1
+"""
+
+import os
+import sys
+import heapq
+import random
+import argparse
+import tempfile
+import time
+
+from utils import constants
+from utils.compression import compressor, decompressor
+from utils.connection import DATA, DccnetConnection
+from utils.fec import FecDecoder
+from utils.frame_source import FrameSource
+from utils.options import complete_options
+from utils.piggyback import TRAILER_RESERVE
+
+# Atraso do enlace simulado (em segundos) e limite do tempo simulado de uma troca
+LINK_DELAY = 0.005
+MAX_SIMULATED_SECONDS = 3600
+
+# Margem somada ao próximo evento, de forma que o temporizador já esteja vencido
+EPSILON = 1e-9
+
+class LossyLink:
+    """ Um sentido do enlace simulado: os quadros chegam depois de ``delay`` segundos (ou mais, caso reordenados) """
+
+    def __init__(self, rng, delay=LINK_DELAY, drop=0.0, corrupt=0.0, duplicate=0.0, reorder=0.0):
+        self.rng = rng
+        self.delay = delay
+        self.drop = drop
+        self.corrupt = corrupt
+        self.duplicate = duplicate
+        self.reorder = reorder
+
+        # Quadros em trânsito: (instante de chegada, ordem de envio, bytes)
+        self.queue = []
+        self.sent = 0
+
+    def send(self, now, data):
+        if self.rng.random() < self.drop:
+            return
+
+        copies = 2 if self.rng.random() < self.duplicate else 1
+        for _ in range(copies):
+            frame = bytearray(data)
+            if self.rng.random() < self.corrupt:
+                frame[self.rng.randrange(len(frame))] ^= 1 << self.rng.randrange(8)
+
+            arrival = now + self.delay
+            if self.rng.random() < self.reorder:
+                arrival += self.rng.random() * 4 * self.delay
+
+            heapq.heappush(self.queue, (arrival, self.sent, bytes(frame)))
+            self.sent += 1
+
+    def next_arrival(self):
+        return self.queue[0][0] if self.queue else None
+
+    def deliver(self, now):
+        """ Retorna os quadros que já chegaram até o instante now """
+
+        frames = []
+        while self.queue and self.queue[0][0] <= now:
+            frames.append(heapq.heappop(self.queue)[2])
+
+        return frames
+
+class Peer:
+    """ Uma ponta da troca: a conexão com as opções dadas (aplicadas como em ``BaseNode.apply_options``) e os dados recebidos """
+
+    def __init__(self, path, options, max_length):
+        self.options = complete_options(options)
+        self.frames = FrameSource(path, max_length)
+
+        if self.options['window'] > 1:
+            self.frames.set_id_space(constants.ID_SPACE)
+        if self.options['piggyback']:
+            self.frames.set_max_length(min(max_length, constants.MAX_LENGTH - TRAILER_RESERVE))
+        if self.options['binary']:
+            self.frames.set_binary(True)
+
+        decompress = None
+        if self.options['compression']:
+            self.frames.set_compression(compressor(self.options['compression']), self.options['compression'])
+            decompress = decompressor(self.options['compression'])
+
+        fec_decoder = None
+        if self.options['fec']:
+            self.frames.set_fec(self.options['fec'])
+            fec_decoder = FecDecoder(self.options['fec'], self.options['window'])
+
+        self.connection = DccnetConnection(self.frames, self.options, fec_decoder=fec_decoder, decompress=decompress)
+        self.received = bytearray()
+
+    def send(self, now, link):
+        self.connection.pump(now)
+        self.connection.handle_timeout(now)
+        for idx, segments in self.connection.data_to_send():
+            link.send(now, b''.join(segments))
+
+    def receive(self, now, link):
+        for data in link.deliver(now):
+            # Depois de fechada a ponta não lê mais nada
+            if self.connection.closed:
+                continue
+
+            for kind, frame in self.connection.receive_data(data, now):
+                if kind == DATA:
+                    self.received += memoryview(frame)[14:]
+
+def exchange(path_a, path_b, options, max_length, rng, **loss):
+    """
+        Executa uma troca completa entre duas pontas, retornando (ponta a, ponta b, tempo
+        simulado). Gera ``RuntimeError`` caso as pontas não fechem a conexão a tempo.
+    """
+
+    a, b = Peer(path_a, options, max_length), Peer(path_b, options, max_length)
+    a_to_b, b_to_a = LossyLink(rng, **loss), LossyLink(rng, **loss)
+
+    now = 0.0
+    while not (a.connection.closed and b.connection.closed):
+        a.send(now, a_to_b)
+        b.send(now, b_to_a)
+
+        # A outra ponta recebe o fim do fluxo depois dos quadros em trânsito de quem fechou
+        for peer, link, other in ((a, a_to_b, b), (b, b_to_a, a)):
+            if peer.connection.closed and not link.queue and not other.connection.closed:
+                other.connection.receive_eof()
+
+        events = [a_to_b.next_arrival(), b_to_a.next_arrival(), a.connection.next_deadline(),
+                  b.connection.next_deadline()]
+        # Uma conexão aberta sempre tem um temporizador, então sem eventos as duas fecharam
+        events = [event for event in events if event is not None]
+        if not events:
+            break
+
+        now = max(now, min(events)) + EPSILON
+        if now > MAX_SIMULATED_SECONDS:
+            raise RuntimeError('a troca não terminou em {} segundos simulados'.format(MAX_SIMULATED_SECONDS))
+
+        b.receive(now, a_to_b)
+        a.receive(now, b_to_a)
+
+    a.frames.close()
+    b.frames.close()
+
+    return a, b, now
+
+def random_payload(rng, size):
+    """ Dados aleatórios ou texto compressível, com ``size`` bytes """
+
+    if rng.random() < 0.5:
+        return bytes(rng.getrandbits(8) for _ in range(size))
+
+    words = [b'dccnet', b'frame', b'ack', b'window', b'checksum', b'\n']
+    data = bytearray()
+    while len(data) < size:
+        data += rng.choice(words) + b' '
+
+    return bytes(data[:size])
+
+def random_config(rng):
+    """ Sorteia as opções, o tamanho dos quadros e as perdas de uma troca """
+
+    window = rng.choice([1, 2, 4, 16, 64])
+    options = {'window': window, 'binary': rng.random() < 0.5}
+    if rng.random() < 0.3:
+        options['compression'] = {'method': 'zlib', 'level': 1}
+    if window > 1:
+        options['piggyback'] = rng.random() < 0.5
+        if rng.random() < 0.4:
+            options['fec'] = rng.randint(2, 8)
+
+    loss = {'drop': rng.uniform(0, 0.2), 'corrupt': rng.uniform(0, 0.2)}
+    if window > 1:
+        loss.update(duplicate=rng.uniform(0, 0.1), reorder=rng.uniform(0, 0.1))
+
+    return options, rng.choice([16, 256, 1024, constants.MAX_LENGTH]), loss
+
+def write_file(directory, name, data):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as outfile:
+        outfile.write(data)
+
+    return path
+
+def fuzz(count, seed):
+    """ Executa ``count`` trocas sorteadas, retornando se todas terminaram com os dados íntegros """
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for i in range(count):
+            rng = random.Random(seed + i)
+            options, max_length, loss = random_config(rng)
+            # Até algumas centenas de quadros por ponta: com quadros pequenos e muitas perdas o
+            # backoff do RTO (sem amostras novas pela regra de Karn) deixa a troca muito longa
+            largest = min(64 * 2**10, 256 * max_length)
+            data_a = random_payload(rng, rng.choice([0, 1, rng.randrange(1, largest)]))
+            data_b = random_payload(rng, rng.choice([0, 1, rng.randrange(1, largest)]))
+
+            path_a = write_file(directory, 'a', data_a)
+            path_b = write_file(directory, 'b', data_b)
+
+            try:
+                a, b, simulated = exchange(path_a, path_b, options, max_length, rng, **loss)
+                error = None
+                if bytes(b.received) != data_a or bytes(a.received) != data_b:
+                    error = 'dados recebidos diferentes dos enviados'
+            except RuntimeError as exc:
+                error = str(exc)
+
+            if error is not None:
+                failures += 1
+                print('semente {}: {} (opções {}, max_length {}, perdas {})'.format(
+                    seed + i, error, options, max_length, loss))
+
+    print('{} trocas, {} falhas'.format(count, failures))
+    return failures == 0
+
+def benchmark(size, max_length, seed):
+    configs = [
+        ('pare-e-espere', {'window': 1}, {}),
+        ('janela 16', {'window': 16}, {}),
+        ('janela 64 + carona + binário', {'window': 64, 'piggyback': True, 'binary': True}, {}),
+        ('janela 64 + carona + binário, 5% de perdas', {'window': 64, 'piggyback': True, 'binary': True},
+         {'drop': 0.05, 'corrupt': 0.05}),
+        ('janela 64 + binário + FEC 8, 5% de perdas', {'window': 64, 'binary': True, 'fec': 8},
+         {'drop': 0.05, 'corrupt': 0.05}),
+    ]
+
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_file(directory, 'input', random_payload(rng, size))
+
+        for label, options, loss in configs:
+            started = time.process_time()
+            a, b, simulated = exchange(path, path, options, max_length, random.Random(seed), **loss)
+            seconds = time.process_time() - started
+
+            frames = a.connection.metrics.frames_sent + b.connection.metrics.frames_sent
+            print('{:<45} {:>9.0f} quadros/s  {:>7.1f} MiB/s  ({:.2f} s simulados)'.format(
+                label, frames / seconds, 2 * size / seconds / 2**20, simulated))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark e teste aleatório do núcleo do protocolo em memória.')
+    parser.add_argument('--size', type=int, default=4, help='tamanho do arquivo de cada ponta em MiB')
+    parser.add_argument('--max-length', type=int, default=1024, help='maior tamanho dos dados de um quadro')
+    parser.add_argument('--fuzz', type=int, metavar='N', help='executa N trocas sorteadas verificando os dados')
+    parser.add_argument('--seed', type=int, default=0, help='semente do enlace e dos sorteios')
+    args = parser.parse_args()
+
+    if args.fuzz is not None:
+        sys.exit(0 if fuzz(args.fuzz, args.seed) else 1)
+
+    benchmark(args.size * 2**20, args.max_length, args.seed)
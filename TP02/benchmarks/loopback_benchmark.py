@@ -0,0 +1,350 @@
+"""
+    Benchmark de ponta a ponta do DCCNET no loopback.
+
+    Para cada tamanho de arquivo um ``Server`` e um ``Client`` são executados em
+    processos separados, transferindo dados aleatórios em uma direção (apenas o
+    cliente envia) ou nas duas. Para cada transferência são reportados o goodput,
+    os quadros enviados por segundo, as retransmissões, o tempo de CPU por MiB
+    transferido e as estimativas de RTT das duas pontas.
+
+    Os resultados são escritos em um arquivo JSON, de forma que mudanças no
+    enquadramento, no checksum ou na janela possam ser comparadas entre execuções.
+    O tempo de cada sessão inclui o encerramento (o ACK final e a espera de LINGER_RTOS RTOs,
+    interrompida quando a outra ponta fecha o socket).
+
+    Com as opções de enlace (``--drop``, ``--corrupt``, ``--delay``...) as pontas se
+    comunicam através de um ``LinkEmulator``, o que permite medir o goodput em função
+    da taxa de erros. As estatísticas do emulador também são incluídas nos resultados.
+
+    Com ``--compress`` os quadros são comprimidos, e são reportados a razão de compressão
+    e o tempo de CPU gasto comprimindo e descomprimindo. Como dados aleatórios não são
+    compressíveis, ``--payload text`` gera arquivos de log sintéticos. Com ``--fec`` também
+    são reportados os quadros reconstruídos a partir dos quadros de paridade.
+
+    Execução (a partir da pasta TP02):
+        python -m benchmarks.loopback_benchmark
+        python -m benchmarks.loopback_benchmark --sizes 1K,1M,1G -w 32 -o resultados.json
+        python -m benchmarks.loopback_benchmark --sizes 16M --drop 0.01 --corrupt 0.01 --seed 7
+        python -m benchmarks.loopback_benchmark --sizes 64M --payload text --compress zlib -w 16
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import filecmp
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import multiprocessing
+
+from utils import constants
+from utils.client import Client
+from utils.compression import METHODS
+from utils.emulator import LinkEmulator
+from utils.server import Server
+
+UNITS = {'K': 2**10, 'M': 2**20, 'G': 2**30}
+
+DEFAULT_SIZES = '1K,64K,1M,16M,256M,1G'
+
+# Parâmetros do emulador de enlace que podem ser passados na linha de comando
+LINK_OPTIONS = ('delay', 'jitter', 'bandwidth', 'drop', 'duplicate', 'reorder', 'corrupt', 'header_bias', 'digit_error')
+
+# Tempo máximo (em segundos) que esperamos por uma transferência
+CASE_TIMEOUT = 3600
+
+def parse_size(text):
+    """ Função para converter tamanhos como 64K, 1M ou 1G em bytes """
+
+    text = text.strip().upper().rstrip('B').rstrip('I')
+    if text and text[-1] in UNITS:
+        return int(text[:-1]) * UNITS[text[-1]]
+
+    return int(text)
+
+def format_size(size):
+    for unit in ('G', 'M', 'K'):
+        if size >= UNITS[unit] and size % UNITS[unit] == 0:
+            return '{}{}iB'.format(size // UNITS[unit], unit)
+
+    return '{}B'.format(size)
+
+# Palavras e níveis usados nas linhas dos arquivos de log sintéticos (--payload text)
+LOG_WORDS = ('request', 'served', 'user', 'cache', 'miss', 'hit', 'timeout', 'retry', 'connection',
+             'opened', 'closed', 'frame', 'ack', 'window', 'checksum', 'session')
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARN', 'ERROR')
+
+def log_chunk(rng, size):
+    """ Função que retorna aproximadamente size bytes de linhas de log sintéticas """
+
+    lines, length = [], 0
+    while length < size:
+        line = '2026-01-01T{:02d}:{:02d}:{:02d}.{:06d} {:<5} [worker-{}] {} id={}\n'.format(
+               rng.randrange(24), rng.randrange(60), rng.randrange(60), rng.randrange(10**6),
+               rng.choice(LOG_LEVELS), rng.randrange(16), ' '.join(rng.choice(LOG_WORDS) for _ in range(6)),
+               rng.randrange(10**8))
+        lines.append(line)
+        length += len(line)
+
+    return ''.join(lines).encode()
+
+def generate_payload(path, size, kind='random', chunk=2**20):
+    """ Função para gerar um arquivo com size bytes aleatórios (ou de log sintético, caso kind seja 'text') """
+
+    rng = random.Random(size)
+    with open(path, 'wb') as outfile:
+        remaining = size
+        while remaining > 0:
+            n_bytes = min(chunk, remaining)
+            outfile.write(os.urandom(n_bytes) if kind == 'random' else log_chunk(rng, n_bytes)[:n_bytes])
+            remaining -= chunk
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def node_stats(node, begin, cpu_begin):
+    """ Função que resume as medidas de uma ponta após a transferência """
+
+    samples = list(node.rtt.samples)
+    sizer = node.sizer
+    metrics = node.collect_metrics()
+
+    return {
+        'start': begin,
+        'end': time.monotonic(),
+        'cpu_seconds': time.process_time() - cpu_begin,
+        'frames_sent': metrics.frames_sent,
+        'frames_received': metrics.frames_received,
+        'retransmissions': metrics.retransmissions,
+        'timeouts': metrics.timeouts,
+        'ack_frames_sent': metrics.ack_frames_sent,
+        'piggybacked_acks': metrics.piggybacked_acks,
+        'checksum_failures': metrics.checksum_failures,
+        'invalid_headers': metrics.invalid_headers,
+        'skipped_bytes': metrics.resync_bytes_skipped,
+        'compressed_frames': metrics.compressed_frames,
+        'compression_input_bytes': metrics.compression_input_bytes,
+        'compression_output_bytes': metrics.compression_output_bytes,
+        'compression_cpu_seconds': metrics.compression_cpu_seconds + metrics.decompression_cpu_seconds,
+        'parity_frames_sent': metrics.parity_frames_sent,
+        'recovered_frames': metrics.recovered_frames,
+        'window': node.options['window'],
+        'piggyback': node.options['piggyback'],
+        'binary': node.options['binary'],
+        'compression': node.options['compression'],
+        'fec': node.options['fec'],
+        'frame_length': sizer.length if sizer is not None else node.send_frames.max_length,
+        'frame_shrinks': sizer.shrinks if sizer is not None else 0,
+        'frame_grows': sizer.grows if sizer is not None else 0,
+        'srtt': node.rtt.srtt,
+        'rto': node.rtt.rto,
+        'rtt_median': statistics.median(samples) if samples else None,
+        'rtt_max': max(samples) if samples else None,
+        'histograms': metrics.snapshot()['histograms'],
+    }
+
+def run_server(port, input_file, output_file, options, ready, results):
+    node = Server(port, input_file, output_file, **options)
+    ready.set()
+
+    cpu_begin, begin = time.process_time(), time.monotonic()
+    node.run()
+    results.put(('server', node_stats(node, begin, cpu_begin)))
+
+def run_client(port, input_file, output_file, options, results):
+    cpu_begin, begin = time.process_time(), time.monotonic()
+    node = Client('127.0.0.1', port, input_file, output_file, **options)
+    node.run()
+    results.put(('client', node_stats(node, begin, cpu_begin)))
+
+def run_emulator(port, target_port, link, ready, results):
+    emulator = LinkEmulator(port, '127.0.0.1', target_port, **link)
+    ready.set()
+
+    emulator.serve(1)
+    results.put(('link', emulator.connections[0]))
+
+def run_case(workdir, size, direction, options, link=None, kind='random'):
+    """ Executa uma transferência (através do emulador de enlace, caso link seja dado) e retorna as medidas da sessão """
+
+    client_in = os.path.join(workdir, 'payload-{}'.format(size))
+    server_in = client_in if direction == 'both' else os.path.join(workdir, 'empty')
+    client_out = os.path.join(workdir, 'client.out')
+    server_out = os.path.join(workdir, 'server.out')
+
+    if not os.path.exists(client_in):
+        generate_payload(client_in, size, kind)
+    if not os.path.exists(server_in):
+        generate_payload(server_in, 0)
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = []
+
+    def start(target, *args):
+        ready = context.Event()
+        process = context.Process(target=target, args=args + (ready, results))
+        process.start()
+        processes.append(process)
+        if not ready.wait(10):
+            process.terminate()
+            raise RuntimeError('o processo {} não iniciou'.format(target.__name__))
+
+    port = client_port = free_port()
+    start(run_server, port, server_in, server_out, options)
+
+    if link is not None:
+        client_port = free_port()
+        start(run_emulator, client_port, port, link)
+
+    client = context.Process(target=run_client, args=(client_port, client_in, client_out, options, results))
+    client.start()
+    processes.append(client)
+
+    # Os resultados precisam ser lidos antes do join, para a fila não bloquear os processos
+    nodes, link_stats = {}, None
+    try:
+        for _ in processes:
+            kind, stats = results.get(timeout=CASE_TIMEOUT)
+            if kind == 'link':
+                link_stats = stats
+            else:
+                nodes[kind] = stats
+    finally:
+        for process in processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+
+    ok = filecmp.cmp(client_in, server_out, shallow=False)
+    if direction == 'both':
+        ok = ok and filecmp.cmp(server_in, client_out, shallow=False)
+
+    for path in (client_out, server_out):
+        os.remove(path)
+
+    payload = size * (2 if direction == 'both' else 1)
+    elapsed = max(n['end'] for n in nodes.values()) - min(n['start'] for n in nodes.values())
+    cpu = sum(n['cpu_seconds'] for n in nodes.values())
+    frames = sum(n['frames_sent'] for n in nodes.values())
+    compression_input = sum(n['compression_input_bytes'] for n in nodes.values())
+    compression_output = sum(n['compression_output_bytes'] for n in nodes.values())
+
+    return {
+        'size': size,
+        'direction': direction,
+        'ok': ok,
+        'payload_bytes': payload,
+        'elapsed_seconds': elapsed,
+        'goodput_mib_s': payload / elapsed / 2**20,
+        'frames_sent': frames,
+        'frames_per_second': frames / elapsed,
+        'retransmissions': sum(n['retransmissions'] for n in nodes.values()),
+        'ack_frames_sent': sum(n['ack_frames_sent'] for n in nodes.values()),
+        'recovered_frames': sum(n['recovered_frames'] for n in nodes.values()),
+        'cpu_seconds': cpu,
+        'cpu_seconds_per_mib': cpu / (payload / 2**20) if payload > 0 else None,
+        'compression_ratio': compression_input / compression_output if compression_output > 0 else None,
+        'compression_cpu_seconds': sum(n['compression_cpu_seconds'] for n in nodes.values()),
+        'client': nodes['client'],
+        'server': nodes['server'],
+        'link': link_stats,
+    }
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark do DCCNET no loopback.')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='tamanhos dos arquivos separados por vírgula (padrão: {})'.format(DEFAULT_SIZES))
+    parser.add_argument('--directions', default='one,both',
+                        help='direções da transferência: one (cliente -> servidor) e/ou both')
+    parser.add_argument('--repeat', type=int, default=1, help='execuções de cada caso')
+    parser.add_argument('-w', '--window', type=int, default=1, help='janela pedida pelo cliente')
+    parser.add_argument('--duplex', action='store_true', help='usa threads separadas para envio e recebimento')
+    parser.add_argument('--piggyback', action='store_true', help='pede que os ACKs sejam enviados de carona')
+    parser.add_argument('--binary', action='store_true', help='quadros enviados sem a codificação base16')
+    parser.add_argument('--adaptive', action='store_true', help='tamanho adaptativo dos quadros de dados')
+    parser.add_argument('--min-length', type=int, default=constants.MIN_FRAME_LENGTH,
+                        help='menor tamanho dos dados de um quadro no modo adaptativo')
+    parser.add_argument('--max-length', type=int, default=constants.MAX_LENGTH, help='maior tamanho dos dados de um quadro')
+    parser.add_argument('--compress', choices=sorted(METHODS), default=None, help='comprime os dados de cada quadro')
+    parser.add_argument('--compress-level', type=int, default=constants.COMPRESSION_LEVEL, help='nível da compressão')
+    parser.add_argument('--workers', type=int, default=0, help='processos que preparam os quadros de envio de cada ponta')
+    parser.add_argument('--fec', type=int, default=None, help='um quadro de paridade a cada N quadros (requer -w > 1)')
+    parser.add_argument('--payload', choices=('random', 'text'), default='random',
+                        help='conteúdo dos arquivos: bytes aleatórios ou log sintético (compressível)')
+
+    link = parser.add_argument_group('enlace emulado (ver utils/emulator.py)')
+    link.add_argument('--seed', type=int, default=0, help='semente do emulador de enlace')
+    for name in LINK_OPTIONS:
+        link.add_argument('--' + name.replace('_', '-'), type=float, default=None)
+
+    parser.add_argument('-o', '--output', default='loopback_results.json', help='arquivo JSON com os resultados')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    directions = [direction.strip() for direction in args.directions.split(',')]
+    options = {'window': args.window, 'duplex': args.duplex, 'piggyback': args.piggyback, 'binary': args.binary,
+               'adaptive': args.adaptive, 'min_length': args.min_length, 'max_length': args.max_length,
+               'compression': args.compress, 'compression_level': args.compress_level, 'fec': args.fec,
+               'workers': args.workers}
+
+    # O emulador só é usado caso algum parâmetro do enlace tenha sido dado
+    link = {name: getattr(args, name) for name in LINK_OPTIONS if getattr(args, name) is not None}
+    if link:
+        link['seed'] = args.seed
+    else:
+        link = None
+
+    report = {
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'max_length': constants.MAX_LENGTH,
+        'linger_rtos': constants.LINGER_RTOS,
+        'options': options,
+        'payload': args.payload,
+        'link': link,
+        'results': [],
+    }
+
+    print('{:>8} {:>5} {:>9} {:>10} {:>10} {:>8} {:>8} {:>10} {:>6} {:>8} {:>4}'.format(
+          'tamanho', 'dir', 'tempo(s)', 'MiB/s', 'quadros/s', 'retrans', 'ACKs', 'CPU s/MiB', 'razão', 'compr s', 'ok'))
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            for direction in directions:
+                for _ in range(args.repeat):
+                    result = run_case(workdir, size, direction, options, link, args.payload)
+                    report['results'].append(result)
+
+                    cpu_per_mib, ratio = result['cpu_seconds_per_mib'], result['compression_ratio']
+                    print('{:>8} {:>5} {:>9.2f} {:>10.2f} {:>10.0f} {:>8} {:>8} {:>10} {:>6} {:>8.3f} {:>4}'.format(
+                          format_size(size), direction, result['elapsed_seconds'], result['goodput_mib_s'],
+                          result['frames_per_second'], result['retransmissions'], result['ack_frames_sent'],
+                          '-' if cpu_per_mib is None else '{:.3f}'.format(cpu_per_mib),
+                          '-' if ratio is None else '{:.2f}'.format(ratio), result['compression_cpu_seconds'],
+                          'sim' if result['ok'] else 'NÃO'))
+
+            # Removendo o arquivo gerado para não ocuparmos o disco com todos os tamanhos
+            os.remove(os.path.join(workdir, 'payload-{}'.format(size)))
+
+    with open(args.output, 'w') as outfile:
+        json.dump(report, outfile, indent=2)
+
+    print('resultados escritos em {}'.format(args.output))
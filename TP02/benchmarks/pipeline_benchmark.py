@@ -0,0 +1,78 @@
+"""
+    Benchmark da preparação dos quadros de envio com o pipeline de processos.
+
+    Percorre todos os quadros de um arquivo pela ``FrameSource`` (como o envio faria,
+    descartando cada quadro depois de usado), preparando os quadros na própria thread
+    (0 processos) ou com ``FramePipeline`` de 1 a N processos, em base16 e com a
+    compressão zlib. Sem rede, o resultado é a vazão máxima da preparação dos quadros,
+    que só escala com a quantidade de núcleos da máquina.
+
+    Execução (a partir da pasta TP02):
+        python -m benchmarks.pipeline_benchmark
+        python -m benchmarks.pipeline_benchmark --size 64 --workers 0,2,4,8
+"""
+
+import os
+import time
+import argparse
+import tempfile
+
+from utils import constants
+from utils.compression import compressor
+from utils.frame_source import FrameSource
+from utils.pipeline import FramePipeline
+
+def text_payload(size):
+    """ Log sintético (compressível) com ``size`` bytes """
+
+    line = b'2026-01-01T00:00:00.000000 INFO  [worker-3] request served id=%d\n'
+    data, i = bytearray(), 0
+    while len(data) < size:
+        data += line % i
+        i += 1
+
+    return bytes(data[:size])
+
+def prepare_all(path, workers, compression):
+    frames = FrameSource(path, id_space=constants.ID_SPACE)
+    if compression is not None:
+        frames.set_compression(compressor(compression), compression)
+
+    pipeline = FramePipeline(workers) if workers > 0 else None
+    frames.set_pipeline(pipeline)
+
+    start = time.perf_counter()
+    for idx in range(len(frames)):
+        frames.segments(idx)
+        frames.release(idx + 1)
+    seconds = time.perf_counter() - start
+
+    if pipeline is not None:
+        pipeline.close()
+    frames.close()
+
+    return seconds
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark da preparação dos quadros com o pipeline de processos.')
+    parser.add_argument('--size', type=int, default=32, help='tamanho do arquivo em MiB')
+    parser.add_argument('--workers', default='0,1,2,4', help='quantidades de processos separadas por vírgula')
+    args = parser.parse_args()
+
+    size = args.size * 2**20
+    counts = [int(count) for count in args.workers.split(',')]
+    print('{} núcleos, arquivo de {} MiB'.format(os.cpu_count(), args.size))
+
+    with tempfile.NamedTemporaryFile() as infile:
+        infile.write(text_payload(size))
+        infile.flush()
+
+        for label, compression in (('base16', None), ('base16 + zlib', {'method': 'zlib', 'level': 6})):
+            print(label)
+
+            baseline = None
+            for workers in counts:
+                seconds = prepare_all(infile.name, workers, compression)
+                baseline = baseline or seconds
+                print('  {:>2} processos {:>10.1f} MiB/s  speedup {:.2f}x'.format(
+                    workers, size / seconds / 2**20, baseline / seconds))
@@ -0,0 +1,126 @@
+"""
+    Benchmark do caminho de recebimento de quadros DCCNET.
+
+    Compara a leitura original (``recv`` em pedaços de BUFSZ concatenados com
+    ``buffer += data``) com o ``FrameReceiver`` (``recv_into`` em um buffer
+    pré-alocado). Para cada caminho são reportados o tempo por quadro, o número de
+    chamadas de recv, quantos objetos de buffer foram criados por quadro e o pico de
+    memória temporária alocada por quadro (tracemalloc).
+
+    Execução (a partir da pasta TP02):
+        python -m benchmarks.receive_benchmark
+"""
+
+import os
+import time
+import socket
+import threading
+import tracemalloc
+from struct import unpack
+from base64 import b16encode as encode16
+from base64 import b16decode as decode16
+
+from utils import constants
+from utils.frame_source import build_frame
+from utils.receiver import FrameReceiver
+
+N_FRAMES = 200
+
+class CountingSocket:
+    """ Socket que conta as chamadas de leitura """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.calls = 0
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def recv(self, n_bytes):
+        self.calls += 1
+        return self.sock.recv(n_bytes)
+
+    def recv_into(self, view):
+        self.calls += 1
+        return self.sock.recv_into(view)
+
+class LegacyReceiver:
+    """ Cópia do caminho de recebimento original (``BaseNode.recv_expected_length``) """
+
+    def __init__(self):
+        self.buffers = 0
+
+    def recv_expected_length(self, sock, expected_length):
+        buffer = b''
+        bytes_received = 0
+
+        while bytes_received < expected_length:
+            data = sock.recv(min(expected_length - bytes_received, constants.BUFSZ))
+            if not data:
+                raise RuntimeError()
+
+            # Cada concatenação cria um novo objeto (e copia o buffer inteiro)
+            buffer += data
+            bytes_received = bytes_received + len(data)
+            self.buffers += 1
+
+        return decode16(buffer)
+
+    def next_frame(self, sock):
+        header = self.recv_expected_length(sock, 16)
+        header += self.recv_expected_length(sock, 12)
+        length = unpack(constants.HEADER_FORMAT, header)[2]
+        return header + self.recv_expected_length(sock, 2 * length)
+
+def send_frames(sock, frame, n_frames):
+    encoded = encode16(frame)
+    for _ in range(n_frames):
+        sock.sendall(encoded)
+
+def run(label, receive, frame):
+    writer, reader = socket.socketpair()
+    counting = CountingSocket(reader)
+
+    thread = threading.Thread(target=send_frames, args=(writer, frame, N_FRAMES))
+    thread.start()
+
+    peak = 0
+    tracemalloc.start()
+    begin = time.perf_counter()
+
+    for _ in range(N_FRAMES):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        assert receive(counting) == frame
+        peak += tracemalloc.get_traced_memory()[1] - current
+
+    elapsed = time.perf_counter() - begin
+    tracemalloc.stop()
+
+    thread.join()
+    writer.close()
+    reader.close()
+
+    print('  {:<16} {:>8.1f} us/quadro {:>8.2f} recv/quadro {:>10.1f} KiB pico/quadro'.format(
+          label, elapsed / N_FRAMES * 1e6, counting.calls / N_FRAMES, peak / N_FRAMES / 1024))
+
+    return counting
+
+if __name__ == '__main__':
+    for length in (1024, constants.MAX_LENGTH):
+        frame = build_frame(0, constants.FLAG_DATA, os.urandom(length))
+        print('quadro com {} bytes de dados'.format(length))
+
+        legacy = LegacyReceiver()
+        run('buffer += data', legacy.next_frame, frame)
+        print('  {:<16} {:>8.1f} buffers criados/quadro'.format('', legacy.buffers / N_FRAMES))
+
+        receiver = FrameReceiver()
+        buffer = receiver.buffer
+
+        def next_frame(sock):
+            return receiver.receive(sock, time.monotonic() + constants.TIMEOUT, lambda header: True)
+
+        run('recv_into', next_frame, frame)
+        print('  {:<16} buffer de recebimento {}\n'.format(
+              '', 'reutilizado' if receiver.buffer is buffer else 'realocado'))
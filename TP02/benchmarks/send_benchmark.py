@@ -0,0 +1,90 @@
+"""
+    Benchmark do envio dos quadros DCCNET.
+
+    Compara o caminho original (quadro montado com concatenações de ``bytes``, checksum
+    preenchido com outra cópia, codificado e enviado com ``sendall`` a cada envio,
+    inclusive retransmissões) com o ``FrameSource`` (segmentos de cabeçalho e dados
+    construídos uma única vez e enviados com ``sendmsg``), em base16 e no formato binário.
+    Os quadros são enviados por um ``socketpair`` e lidos por uma thread que só descarta
+    os bytes.
+
+    Execução (a partir da pasta TP02):
+        python -m benchmarks.send_benchmark
+"""
+
+import os
+import socket
+import tempfile
+import threading
+import time
+from struct import pack
+from base64 import b16encode as encode16
+
+from utils import constants
+from utils.checksum import internet_checksum
+from utils.codec import send_segments
+from utils.frame_source import FrameSource
+
+# Quantas vezes cada quadro é enviado (1 envio + retransmissões)
+TRANSMISSIONS = 3
+
+def legacy_frame(id, payload):
+    frame = pack(constants.HEADER_FORMAT, constants.SYNC, constants.SYNC, len(payload), 0, id, constants.FLAG_DATA) + payload
+    chksum = internet_checksum(frame)
+    return frame[:10] + pack('!H', chksum) + frame[12:]
+
+def legacy_send(sock, data, length, binary):
+    for idx, begin in enumerate(range(0, len(data), length)):
+        for _ in range(TRANSMISSIONS):
+            frame = legacy_frame(idx % constants.ID_SPACE, data[begin:begin + length])
+            sock.sendall(frame if binary else encode16(frame))
+
+def segments_send(sock, frames):
+    for idx in range(len(frames) - 1):
+        for _ in range(TRANSMISSIONS):
+            send_segments(sock, frames.segments(idx))
+        frames.release(idx + 1)
+
+def drain(sock):
+    while sock.recv(2**20):
+        pass
+
+def bench(label, send, n_frames):
+    sender, receiver = socket.socketpair()
+    reader = threading.Thread(target=drain, args=(receiver,))
+    reader.start()
+
+    start = time.perf_counter()
+    send(sender)
+    sender.close()
+    reader.join()
+    seconds = (time.perf_counter() - start) / (n_frames * TRANSMISSIONS)
+    receiver.close()
+
+    print('  {:<44} {:>10.2f} us/envio'.format(label, seconds * 1e6))
+    return seconds
+
+if __name__ == '__main__':
+    data = os.urandom(16 * 2**20)
+
+    with tempfile.NamedTemporaryFile() as infile:
+        infile.write(data)
+        infile.flush()
+
+        for length in (1024, constants.MAX_LENGTH):
+            n_frames = -(-len(data) // length)
+
+            for binary in (False, True):
+                print('quadros com {} bytes de dados, {} ({} envios por quadro)'.format(
+                    length, 'binário' if binary else 'base16', TRANSMISSIONS))
+
+                legacy = bench('concatenação + sendall a cada envio',
+                               lambda sock: legacy_send(sock, data, length, binary), n_frames)
+
+                frames = FrameSource(infile.name, length, id_space=constants.ID_SPACE)
+                frames.set_binary(binary)
+                cached = bench('segmentos construídos uma vez + sendmsg',
+                               lambda sock: segments_send(sock, frames), n_frames)
+                frames.close()
+
+                print('  speedup: {:.1f}x\n'.format(legacy / cached))
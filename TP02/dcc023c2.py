@@ -1,12 +1,147 @@
-from sys import argv
-from utils.client import Client
+import os
+import asyncio
+from argparse import ArgumentParser
+
+from utils import constants
+from utils.aio import DccnetServer, connect
+from utils.client import Client, run_striped
+from utils.compression import METHODS
 from utils.server import Server
 
+def parse_arguments():
+    parser = ArgumentParser(description='Ponta DCCNET (ativa com -c, passiva com -s)')
+
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('-s', metavar='PORT', dest='server', help='executa a ponta passiva na porta PORT')
+    mode.add_argument('-c', metavar=('IP', 'PORT'), dest='client', nargs=2, help='conecta na ponta passiva IP:PORT')
+
+    parser.add_argument('input', help='arquivo com os dados a serem enviados')
+    parser.add_argument('output', help='arquivo onde os dados recebidos serão salvos')
+
+    parser.add_argument('-w', '--window', type=int, default=None,
+                        help='tamanho da janela (Selective Repeat). Na ponta ativa é a janela pedida '
+                             '(padrão 1, pare-e-espere), na passiva a maior janela aceita (padrão {})'.format(constants.MAX_WINDOW))
+
+    parser.add_argument('--min-rto', type=float, default=constants.MIN_RTO,
+                        help='menor tempo de retransmissão (em segundos, padrão %(default)s). Valores menores '
+                             'reagem mais rápido a perdas em enlaces de RTT baixo, mas podem retransmitir quadros '
+                             'que ainda estão sendo escritos no socket')
+
+    parser.add_argument('--flush-bytes', type=int, default=2**20,
+                        help='a cada quantos bytes recebidos o arquivo de saída é descarregado (0 para todo quadro)')
+    parser.add_argument('--fsync', action='store_true',
+                        help='força a escrita no disco (fsync) a cada descarga do arquivo de saída')
+
+    parser.add_argument('--piggyback', action='store_true', default=None,
+                        help='pede (ponta ativa) que os ACKs sejam enviados de carona nos quadros de dados. '
+                             'A ponta passiva aceita por padrão; requer janela maior que 1')
+
+    parser.add_argument('--binary', action='store_true', default=None,
+                        help='pede (ponta ativa) que os quadros sejam enviados sem a codificação base16, '
+                             'ocupando metade dos bytes na rede. A ponta passiva aceita por padrão')
+
+    parser.add_argument('--adaptive', action='store_true',
+                        help='escolhe o tamanho dos dados de cada quadro conforme os erros observados no enlace')
+    parser.add_argument('--min-length', type=int, default=constants.MIN_FRAME_LENGTH,
+                        help='menor tamanho dos dados de um quadro no modo adaptativo (padrão %(default)s)')
+    parser.add_argument('--max-length', type=int, default=constants.MAX_LENGTH,
+                        help='maior tamanho dos dados de um quadro (padrão %(default)s)')
+
+    parser.add_argument('--compress', choices=sorted(METHODS), default=None,
+                        help='pede (ponta ativa) que os dados de cada quadro sejam comprimidos com o método dado. '
+                             'A ponta passiva aceita por padrão qualquer método suportado (ou apenas o dado)')
+    parser.add_argument('--compress-level', type=int, default=constants.COMPRESSION_LEVEL,
+                        help='nível da compressão, de 0 a 9 (padrão %(default)s)')
+
+    parser.add_argument('--fec', metavar='N', type=int, default=None,
+                        help='pede (ponta ativa) um quadro de paridade a cada N quadros, para que um quadro perdido '
+                             'ou corrompido em cada grupo seja reconstruído sem retransmissão (custo de 1/N na rede). '
+                             'A ponta passiva aceita por padrão; requer janela maior que 1')
+
+    parser.add_argument('--workers', type=int, default=0,
+                        help='processos que preparam os quadros de dados (compressão, checksum e codificação base16) '
+                             'em lotes, à frente do envio. Com 0 (padrão) os quadros são preparados na thread de envio')
+
+    parser.add_argument('--metrics', metavar='FILE', default=None,
+                        help='escreve periodicamente as métricas da comunicação em FILE')
+    parser.add_argument('--metrics-format', choices=('json', 'prometheus'), default='json',
+                        help='formato do arquivo de métricas (padrão %(default)s)')
+    parser.add_argument('--metrics-interval', type=float, default=constants.METRICS_INTERVAL,
+                        help='intervalo (em segundos) entre as escritas do arquivo de métricas')
+
+    parser.add_argument('--streams', action='store_true', default=None,
+                        help='pede (ponta ativa) que a entrada seja enviada em streams: com a opção a entrada pode '
+                             'ser um diretório (todos os arquivos, enviados ao mesmo tempo no mesmo enlace) e a saída '
+                             'é um diretório com um arquivo por stream. A ponta passiva aceita por padrão')
+
+    parser.add_argument('--stripes', type=int, default=1,
+                        help='divide a transferência em até STRIPES enlaces paralelos, cada um em um processo. '
+                             'Na ponta ativa é a quantidade pedida, na passiva a maior quantidade aceita (padrão 1)')
+
+    parser.add_argument('--resume', action='store_true',
+                        help='retoma uma transferência interrompida: quem recebe mantém um checkpoint em '
+                             '<output>.ckpt e as pontas continuam de onde a outra parou (as duas pontas precisam da opção)')
+
+    parser.add_argument('--duplex', action='store_true',
+                        help='envia e recebe em threads separadas (full-duplex)')
+
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='usa a implementação sobre asyncio. Na ponta passiva várias conexões são '
+                             'atendidas ao mesmo tempo, cada uma salvando em <output>.<sessão>')
+
+    args = parser.parse_args()
+    if args.resume and args.use_async:
+        parser.error('--resume não é suportado com --async')
+    if args.use_async and (args.streams or os.path.isdir(args.input)):
+        parser.error('--streams não é suportado com --async')
+    if args.resume and (args.streams or os.path.isdir(args.input)):
+        parser.error('--resume não é suportado com --streams')
+    if args.fec is not None and args.use_async:
+        parser.error('--fec não é suportado com --async')
+    if args.workers > 0 and args.use_async:
+        parser.error('--workers não é suportado com --async')
+    if args.stripes > 1 and (args.use_async or args.resume or (args.client and (args.streams or os.path.isdir(args.input)))):
+        parser.error('--stripes não é suportado com --async, --resume ou --streams')
+
+    return args
+
 if __name__ == '__main__':
-    node = Server(*argv[2:]) if argv[1] == '-s' else Client(*argv[2:])
+    args = parse_arguments()
+
+    options = {'min_rto': args.min_rto, 'flush_bytes': args.flush_bytes, 'fsync': args.fsync, 'duplex': args.duplex,
+               'adaptive': args.adaptive, 'min_length': args.min_length, 'max_length': args.max_length,
+               'metrics_file': args.metrics, 'metrics_format': args.metrics_format,
+               'metrics_interval': args.metrics_interval, 'resume': args.resume,
+               'compression': args.compress, 'compression_level': args.compress_level}
+    if args.workers > 0:
+        options['workers'] = args.workers
+    if args.window is not None:
+        options['window'] = args.window
+    if args.piggyback is not None:
+        options['piggyback'] = args.piggyback
+    if args.binary is not None:
+        options['binary'] = args.binary
+    if args.streams is not None:
+        options['streams'] = args.streams
+    if args.fec is not None:
+        options['fec'] = args.fec
 
     try:
-        node.run()
+        if args.use_async:
+            del options['duplex'], options['resume']
+            if args.server is not None:
+                asyncio.run(DccnetServer(args.input, args.output, **options).serve('', args.server))
+            else:
+                asyncio.run(connect(*args.client, args.input, args.output, **options))
+
+        else:
+            if args.server is not None:
+                Server(args.server, args.input, args.output, stripes=args.stripes, **options).run()
+            elif args.stripes > 1:
+                run_striped(*args.client, args.input, args.output, args.stripes, **options)
+            else:
+                Client(*args.client, args.input, args.output, **options).run()
+
     except KeyboardInterrupt as interrupt:
         print(interrupt)
-        print('Encerrando antes do término da comunicação')
\ No newline at end of file
+        print('Encerrando antes do término da comunicação')
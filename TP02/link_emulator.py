@@ -0,0 +1,49 @@
+import json
+from argparse import ArgumentParser
+
+from utils.emulator import LinkEmulator
+
+def parse_arguments():
+    parser = ArgumentParser(description='Proxy TCP que emula um enlace ruim entre duas pontas DCCNET')
+
+    parser.add_argument('port', help='porta onde a ponta ativa deve se conectar')
+    parser.add_argument('target_ip', help='IP da ponta passiva')
+    parser.add_argument('target_port', help='porta da ponta passiva')
+
+    parser.add_argument('--seed', type=int, default=0, help='semente do gerador pseudoaleatório')
+    parser.add_argument('--delay', type=float, default=0.0, help='atraso de cada quadro (segundos)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='variação máxima do atraso (segundos)')
+    parser.add_argument('--bandwidth', type=float, default=None, help='banda do enlace (bytes por segundo)')
+    parser.add_argument('--drop', type=float, default=0.0, help='probabilidade de perder um quadro')
+    parser.add_argument('--duplicate', type=float, default=0.0, help='probabilidade de duplicar um quadro')
+    parser.add_argument('--reorder', type=float, default=0.0,
+                        help='probabilidade de entregar um quadro depois do próximo')
+    parser.add_argument('--corrupt', type=float, default=0.0,
+                        help='probabilidade de trocar dígitos base16 de um quadro')
+    parser.add_argument('--flips', type=int, default=1, help='dígitos trocados em cada quadro corrompido')
+    parser.add_argument('--header-bias', type=float, default=0.0,
+                        help='probabilidade de cada troca cair no cabeçalho do quadro')
+    parser.add_argument('--digit-error', type=float, default=0.0,
+                        help='probabilidade de cada dígito base16 ser trocado (erros proporcionais ao tamanho do quadro)')
+    parser.add_argument('--connections', type=int, default=None,
+                        help='encerra depois de atender essa quantidade de conexões')
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_arguments()
+
+    emulator = LinkEmulator(args.port, args.target_ip, args.target_port, seed=args.seed,
+                            delay=args.delay, jitter=args.jitter, bandwidth=args.bandwidth,
+                            drop=args.drop, duplicate=args.duplicate, reorder=args.reorder,
+                            corrupt=args.corrupt, flips=args.flips, header_bias=args.header_bias,
+                            digit_error=args.digit_error)
+
+    try:
+        emulator.serve(args.connections)
+    except KeyboardInterrupt:
+        pass
+
+    # Estatísticas de cada conexão atendida
+    for stats in emulator.connections:
+        print(json.dumps(stats))
@@ -7,6 +7,10 @@ from struct import pack, unpack
 from base64 import b16decode as decode16
 from base64 import b16encode as encode16
 
+from utils.checksum import internet_checksum, ones_complement_sum
+from utils.frame_source import FrameSource
+from utils.rtt import RttEstimator
+
 # TODO: Implementar computação do checksum e trocar quando define um frame
 
 BUFSZ = 2**16
@@ -16,25 +20,12 @@ SYNC = 0xdcc023c2
 SYNC_BYTES = pack('!I', SYNC)
 
 def calculate_checksum(frame):
-    chksum = 0
-    for i in range(0, len(frame), 2):
-        chksum += int.from_bytes(frame[i:i+2], byteorder='big')
-
-    while chksum >> 16:
-        chksum = (chksum >> 16) + (chksum & 0xffff)
-    
-    frame[10:12] = pack('!H', ~chksum & 0xffff)
+    frame[10:12] = b'\x00\x00'
+    frame[10:12] = pack('!H', internet_checksum(frame))
     return frame
 
 def verify_checksum(frame):
-    verify = 0
-    for i in range(0, len(frame), 2):
-        verify += int.from_bytes(frame[i:i+2], byteorder='big')
-
-    while verify >> 16:
-        verify = (verify >> 16) + (verify & 0xffff)
-
-    return (~verify & 0xffff) == 0
+    return ones_complement_sum(frame) == 0xffff
     
 def send_encoded_message(sock, send_buffer):
     sock.sendall(encode16(send_buffer))
@@ -91,46 +82,51 @@ def receive_decoded_message(sock, timeout=1.0):
     return buffer[:frame_length]
 
 def run_client(ip, host, infile, outfile):
-    with open(infile, 'rb') as fin:
-        input_data = fin.read()
+    # Quadros construídos sob demanda a partir do arquivo mapeado em memória
+    frames = FrameSource(infile, MAX_LENGTH)
+    rtt = RttEstimator()
 
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
         sock.connect((ip, int(host)))
 
-        n_frames = len(input_data) // MAX_LENGTH
-        if len(input_data) % MAX_LENGTH != 0:
-            n_frames += 1
+        n_frames = frames.n_data_frames
 
         print('Devo mandar {} frames'.format(n_frames))
 
         # Loop principal para enviar input
         i = 0
+        transmissions = 0
         while i < n_frames:
             print('Enviando frame {}'.format(i))
 
-            # Obtendo os próximos bytes a ser enviados
-            send_buffer = input_data[:MAX_LENGTH]
-
-            header = [SYNC, SYNC, len(send_buffer), 0, i%2, 0]
-            frame = bytearray(pack('!IIHHBB', *header) + send_buffer)
-            frame = calculate_checksum(frame)
-            send_encoded_message(sock, frame)
+            # Obtendo o próximo quadro a ser enviado (já codificado em base16 pela fonte)
+            sock.sendall(frames.encoded(i))
+            sent_at = time.monotonic()
+            transmissions += 1
 
             # Apenas continuamos a mandar dados se recebemos um ACK!
-            recv_buffer = receive_decoded_message(sock, 1.0)
+            recv_buffer = receive_decoded_message(sock, rtt.rto)
             if recv_buffer is None:
+                rtt.backoff()
                 continue
 
             header = unpack('!IIHHBB', recv_buffer[:14])
             if header[5] == 0x80:
                 print('Recebi o ACK!')
-                # Avançando o ponteiro dos dados de entrada
+                # Regra de Karn: apenas quadros enviados uma única vez geram amostras de RTT
+                if transmissions == 1:
+                    rtt.sample(time.monotonic() - sent_at)
+                transmissions = 0
+
+                # Avançando para o próximo quadro (sem copiar o restante da entrada)
                 i += 1
-                input_data = input_data[MAX_LENGTH:]
+                frames.release(i)
     
         # Terminando a conexão
         send_end_frame(sock)
 
+    frames.close()
+
 def run_server(host, infile, outfile):
     last_id = 1
     output_data = b''
@@ -149,8 +145,6 @@ def run_server(host, infile, outfile):
             if recv_buffer is None:
                 continue
 
-            time.sleep(1.0)
-            
             sync1, sync2, length, chksum, id_, flags = unpack('!IIHHBB', recv_buffer[:14])
             if flags == 0x40:
                 print('Encerrando transmissão')
@@ -0,0 +1,409 @@
+"""
+    Implementação do DCCNET sobre asyncio.
+
+    Cada conexão é uma sessão ``DccnetProtocol`` com o seu próprio estado (janelas,
+    estimador de RTT, buffer de recebimento e arquivo de saída). Depois da negociação a
+    sessão é apenas um invólucro do núcleo ``DccnetConnection`` (ver utils/connection.py):
+    os bytes recebidos vão para a conexão, os quadros que ela produz são escritos no
+    transporte e o seu próximo temporizador é agendado no event loop (``call_later``), de
+    forma que um único processo consegue atender centenas de enlaces simultâneos.
+"""
+
+import json
+import time
+import asyncio
+
+from utils import constants
+from utils.codec import encode
+from utils.compression import accepted_methods, compressor, decompressor
+from utils.connection import DATA, HELLO, DccnetConnection
+from utils.frame_source import FrameSource, build_frame
+from utils.metrics import Metrics, MetricsDumper
+from utils.options import DEFAULT_OPTIONS, agree_options, complete_options
+from utils.piggyback import TRAILER_RESERVE
+from utils.receiver import FrameReceiver, INVALID, valid_header
+from utils.rtt import RttEstimator
+from utils.sink import OutputSink
+from utils.sizing import FrameSizer
+
+class DccnetProtocol(asyncio.Protocol):
+    """
+        Sessão DCCNET sobre um transporte do asyncio.
+
+        A ponta ativa (``active=True``) pede a janela ``window`` (e a compressão, caso
+        dada) com um HELLO caso ela seja maior que 1. A ponta passiva espera o primeiro quadro e aceita janelas de
+        até ``window`` quadros. O protocolo na rede é o mesmo de ``BaseNode``.
+
+        ``output_file`` também pode ser uma função que recebe o endereço da outra ponta
+        e retorna o nome do arquivo de saída.
+    """
+
+    def __init__(self, input_file, output_file, active=False, window=1,
+                 flush_bytes=2**20, fsync=False, on_close=None, piggyback=False, adaptive=False,
+                 min_length=constants.MIN_FRAME_LENGTH, max_length=constants.MAX_LENGTH, compression=None,
+                 compression_level=constants.COMPRESSION_LEVEL, binary=False, min_rto=constants.MIN_RTO):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.active = active
+        self.window = min(max(int(window), 1), constants.MAX_WINDOW)
+        self.piggyback = piggyback
+        self.binary = binary
+        self.compression = compression
+        self.compression_level = compression_level
+        self.flush_bytes = flush_bytes
+        self.fsync = fsync
+        self.on_close = on_close
+
+        self.options = dict(DEFAULT_OPTIONS)
+        self.id_space = 2
+
+        self.transport = None
+        self.connection = None
+        self.writable = True
+
+        # Quadros da outra ponta recebidos antes da resposta do HELLO (ver ``data_received``)
+        self.pending_frames = []
+
+        self.send_frames = None
+        self.sink = None
+        self.decompress = None
+
+        self.rtt = RttEstimator(min_rto=min_rto)
+        self.receiver = FrameReceiver()
+
+        # Métricas da sessão (ver utils/metrics.py)
+        self.metrics = Metrics({'role': 'client' if active else 'server'})
+
+        # Tamanho adaptativo dos quadros de dados (ver utils/sizing.py)
+        self.sizer = FrameSizer(min_length, max_length) if adaptive else None
+        self.max_length = min(max(int(max_length), 1), constants.MAX_LENGTH)
+
+        # Temporizadores agendados no event loop (o da conexão é o próximo instante em que
+        # ela precisa retransmitir, enviar os ACKs pendentes ou terminar o encerramento)
+        self.timer = None
+        self.hello_timer = None
+        self.hello_attempts = 0
+
+    ###### EVENTOS DO TRANSPORTE ######
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.loop = asyncio.get_running_loop()
+
+        # O arquivo de saída pode depender da outra ponta (sessões de um servidor)
+        if callable(self.output_file):
+            self.output_file = self.output_file(transport.get_extra_info('peername'))
+
+        self.send_frames = FrameSource(self.input_file, self.max_length, sizer=self.sizer)
+        self.sink = OutputSink(self.output_file, self.flush_bytes, self.fsync)
+
+        # A ponta ativa negocia as opções (caso precise) e a passiva espera o primeiro quadro
+        if self.active:
+            if self.window > 1 or self.binary or self.compression:
+                self.send_hello()
+            else:
+                self.start()
+
+    def data_received(self, data):
+        self.receiver.feed(data)
+
+        # Antes do início só processamos os quadros da negociação: o HELLO, ou o primeiro
+        # quadro de uma ponta que não negocia opções (que já é processado pela conexão)
+        while self.connection is None and self.transport is not None:
+            frame = self.receiver.poll(self.valid_header)
+            if frame is None:
+                return
+
+            if frame is INVALID:
+                if self.sizer is not None:
+                    self.sizer.shrink()
+                continue
+
+            self.metrics.frames_received += 1
+            if frame[13] == constants.FLAG_HELLO:
+                self.handle_hello(frame)
+                continue
+
+            # A resposta do nosso HELLO pode chegar depois dos primeiros quadros da outra
+            # ponta (reordenados pelo enlace), então esperamos por ela até o temporizador do
+            # HELLO. Na ponta passiva o quadro indica uma ponta que não negocia opções
+            self.pending_frames.append(frame)
+            if self.hello_timer is None:
+                self.start()
+
+        if self.transport is None:
+            return
+
+        self.handle_events(self.connection.process(time.monotonic()))
+        self.flush()
+
+    def pause_writing(self):
+        self.writable = False
+
+    def resume_writing(self):
+        self.writable = True
+        if self.connection is not None:
+            self.flush()
+
+    def connection_lost(self, exc):
+        for timer in (self.timer, self.hello_timer):
+            if timer is not None:
+                timer.cancel()
+
+        if self.connection is not None:
+            self.connection.receive_eof()
+
+        self.transport = None
+        self.sink.close()
+        self.send_frames.close()
+
+        if self.on_close is not None:
+            self.on_close(self)
+
+    ###### NEGOCIAÇÃO ######
+
+    def send_hello(self, options=None):
+        """ Envia um HELLO (pedido da ponta ativa ou resposta da passiva) """
+
+        if options is None:
+            options = {'window': self.window, 'piggyback': self.piggyback, 'binary': self.binary}
+            if self.compression:
+                options['compression'] = {'method': self.compression, 'level': self.compression_level}
+            self.hello_attempts += 1
+            self.hello_timer = self.loop.call_later(self.rtt.rto, self.on_hello_timeout)
+
+        payload = json.dumps(options).encode()
+        self.transport.write(encode(build_frame(0, constants.FLAG_HELLO, payload)))
+
+    def on_hello_timeout(self):
+        self.hello_timer = None
+        self.rtt.backoff()
+
+        # Após algumas tentativas (ou caso a outra ponta já tenha enviado outros quadros
+        # sem responder) assumimos que ela não negocia opções
+        if self.hello_attempts < constants.HELLO_RETRIES and not self.pending_frames:
+            self.send_hello()
+        else:
+            self.start()
+
+    def apply_options(self, options):
+        self.options = complete_options(options)
+        if self.options['window'] > 1:
+            self.id_space = constants.ID_SPACE
+            self.send_frames.set_id_space(self.id_space)
+
+        if self.options['piggyback']:
+            self.send_frames.set_max_length(min(self.max_length, constants.MAX_LENGTH - TRAILER_RESERVE))
+
+        if self.options['binary']:
+            self.send_frames.set_binary(True)
+
+        if self.options['compression']:
+            self.send_frames.set_compression(compressor(self.options['compression']))
+            self.decompress = decompressor(self.options['compression'])
+
+    def start(self):
+        """ Inicia a transferência com as opções acordadas """
+
+        if self.hello_timer is not None:
+            self.hello_timer.cancel()
+            self.hello_timer = None
+
+        self.connection = DccnetConnection(self.send_frames, self.options, self.id_space, self.rtt, self.metrics,
+                                           self.receiver, self.sizer, decompress=self.decompress)
+
+        frames, self.pending_frames = self.pending_frames, []
+        for frame in frames:
+            self.handle_events(self.connection.receive_frame(frame, time.monotonic()))
+
+        self.flush()
+
+    ###### ENVIO ######
+
+    def flush(self):
+        """
+            Escreve os quadros produzidos pela conexão (com os quadros novos, caso o
+            transporte aceite) e agenda o próximo temporizador, ou fecha o transporte.
+        """
+
+        if self.writable:
+            self.connection.pump(time.monotonic())
+
+        for idx, segments in self.connection.data_to_send():
+            self.transport.writelines(segments)
+            self.connection.frame_sent(idx, time.monotonic())
+
+        # Depois do encerramento o transporte termina de enviar o que falta e fecha o socket
+        if self.connection.closed:
+            self.transport.close()
+        else:
+            self.arm_timer()
+
+    def arm_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        deadline = self.connection.next_deadline()
+        if deadline is not None:
+            self.timer = self.loop.call_later(max(deadline - time.monotonic(), 0), self.on_timeout)
+
+    def on_timeout(self):
+        self.timer = None
+
+        # Um quadro parado no meio pode ter o length corrompido (ver ``FrameReceiver.expire``)
+        self.receiver.expire(time.monotonic())
+        self.handle_events(self.connection.process(time.monotonic()))
+
+        self.connection.handle_timeout(time.monotonic())
+        self.flush()
+
+    ###### RECEBIMENTO ######
+
+    def valid_header(self, header):
+        return valid_header(header, self.id_space, self.options['piggyback'], self.decompress is not None)
+
+    def handle_events(self, events):
+        """ Processa os eventos da conexão: dados entregues em ordem e HELLOs """
+
+        for kind, frame in events:
+            if kind == DATA:
+                self.write_payload(frame)
+            elif kind == HELLO:
+                self.handle_hello(frame)
+
+    def write_payload(self, frame):
+        """ Escreve os dados de um quadro entregue (já descomprimidos pela conexão) """
+
+        self.sink.write(memoryview(frame)[14:])
+
+    def collect_metrics(self):
+        """ Atualiza (e retorna) as métricas obtidas dos demais componentes da sessão """
+
+        metrics = self.metrics
+        metrics.checksum_failures = self.receiver.checksum_failures
+        metrics.invalid_headers = self.receiver.invalid_headers
+        metrics.resync_bytes_skipped = self.receiver.skipped_bytes
+        metrics.bytes_written = self.sink.bytes_written if self.sink is not None else 0
+
+        metrics.rto_seconds = self.rtt.rto
+        metrics.srtt_seconds = self.rtt.srtt
+        if self.send_frames is not None:
+            metrics.compressed_frames = self.send_frames.compressed_frames
+            metrics.compression_input_bytes = self.send_frames.raw_bytes
+            metrics.compression_output_bytes = self.send_frames.payload_bytes
+            metrics.compression_cpu_seconds = self.send_frames.compress_seconds
+
+        metrics.frame_length_bytes = self.send_frames.frame_length() if self.send_frames is not None else None
+        metrics.window_frames = self.options['window']
+
+        return metrics
+
+    def handle_hello(self, frame):
+        requested = json.loads(frame[14:])
+
+        # A ponta ativa recebe a resposta com as opções acordadas (duplicatas são ignoradas)
+        if self.active:
+            if self.connection is None:
+                self.apply_options(requested)
+                self.start()
+            return
+
+        # A ponta passiva responde todo HELLO, já que a resposta anterior pode ter se perdido
+        options = agree_options(requested, {'window': self.window, 'piggyback': self.piggyback, 'binary': self.binary,
+                                            'compression': accepted_methods(self.compression)})
+        self.send_hello(options)
+        if self.connection is None:
+            self.apply_options(options)
+            self.start()
+
+class DccnetServer:
+    """
+        Servidor DCCNET sobre asyncio que atende várias sessões simultâneas em um único
+        event loop. Todas as sessões enviam o mesmo arquivo de entrada e cada sessão
+        escreve os dados recebidos em um arquivo de saída próprio.
+
+        O nome do arquivo de saída pode conter os campos ``{session}``, ``{host}`` e
+        ``{port}``. Caso não contenha, o número da sessão é acrescentado ao final do nome.
+    """
+
+    def __init__(self, input_file, output_file, metrics_file=None, metrics_format='json',
+                 metrics_interval=constants.METRICS_INTERVAL, **options):
+        self.input_file = input_file
+        self.output_file = output_file
+        self.options = options
+        self.options.setdefault('window', constants.MAX_WINDOW)
+        self.options.setdefault('piggyback', True)
+        self.options.setdefault('binary', True)
+
+        self.n_sessions = 0
+        self.sessions = set()
+
+        # Métricas somadas de todas as sessões (as das sessões encerradas são acumuladas em closed_metrics)
+        self.closed_metrics = Metrics({'role': 'server'})
+        self.dumper = None
+        if metrics_file is not None:
+            self.dumper = MetricsDumper(self.collect_metrics, metrics_file, metrics_format, metrics_interval)
+
+    def session_output_file(self, peer):
+        """ Retorna o arquivo de saída de uma nova sessão com a ponta ``peer`` """
+
+        self.n_sessions += 1
+        if '{' in self.output_file:
+            return self.output_file.format(session=self.n_sessions, host=peer[0], port=peer[1])
+
+        return '{}.{}'.format(self.output_file, self.n_sessions)
+
+    def create_session(self):
+        session = DccnetProtocol(self.input_file, self.session_output_file, on_close=self.close_session, **self.options)
+        self.sessions.add(session)
+        return session
+
+    def close_session(self, session):
+        self.sessions.discard(session)
+        self.closed_metrics.merge(session.collect_metrics())
+
+    def collect_metrics(self):
+        """ Retorna as métricas somadas de todas as sessões (encerradas e ativas) """
+
+        metrics = Metrics({'role': 'server'})
+        metrics.merge(self.closed_metrics)
+        for session in self.sessions:
+            metrics.merge(session.collect_metrics())
+
+        return metrics
+
+    async def serve(self, host, port):
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(self.create_session, host, int(port), reuse_address=True)
+
+        if self.dumper is not None:
+            self.dumper.schedule(loop)
+
+        async with server:
+            await server.serve_forever()
+
+async def connect(ip, port, input_file, output_file, metrics_file=None, metrics_format='json',
+                  metrics_interval=constants.METRICS_INTERVAL, **options):
+    """ Conecta em uma ponta passiva e executa uma sessão DCCNET até o seu encerramento """
+
+    loop = asyncio.get_running_loop()
+    closed = loop.create_future()
+
+    def on_close(session):
+        if not closed.done():
+            closed.set_result(session)
+
+    transport, session = await loop.create_connection(
+        lambda: DccnetProtocol(input_file, output_file, active=True, on_close=on_close, **options), ip, int(port))
+
+    dumper = None
+    if metrics_file is not None:
+        dumper = MetricsDumper(session.collect_metrics, metrics_file, metrics_format, metrics_interval)
+        dumper.schedule(loop)
+
+    await closed
+    if dumper is not None:
+        dumper.dump()
+
+    return session
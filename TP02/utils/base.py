@@ -1,10 +1,26 @@
+import os
+import json
+import time
 import socket
-import select
-from struct import pack, unpack
-from base64 import b16encode as encode16
-from base64 import b16decode as decode16
 
 from utils import constants
+from utils.codec import encode, send_segments
+from utils.checkpoint import Checkpoint
+from utils.compression import compressor, decompressor
+from utils.connection import DATA, HELLO, DccnetConnection
+from utils.duplex import DuplexEngine
+from utils.fec import FecDecoder
+from utils.frame_source import FrameSource, build_frame
+from utils.metrics import Metrics, MetricsDumper
+from utils.options import DEFAULT_OPTIONS, complete_options
+from utils.pipeline import FramePipeline
+from utils.piggyback import TRAILER_RESERVE
+from utils.receiver import FrameReceiver, valid_header
+from utils.rtt import RttEstimator
+from utils.sink import OutputSink
+from utils.sizing import FrameSizer
+from utils.streams import StreamSink, StreamSource, split_stream
+from utils.striping import stripe_range
 
 class BaseNode:
     """
@@ -12,198 +28,348 @@ class BaseNode:
         a ponta ativa quanto para a ponta passiva.
     """
 
-    def __init__(self, input_file, output_file):
-        # Criando quadros de envio
-        with open(input_file, 'rb') as infile:
-            self.send_frames = self.create_frames(infile.read())
-
-        # Definindo lista de quadros de saída
-        self.recv_frames = []
+    def __init__(self, input_file, output_file, window=1, min_rto=constants.MIN_RTO, flush_bytes=2**20, fsync=False,
+                 duplex=False, piggyback=False, adaptive=False, min_length=constants.MIN_FRAME_LENGTH,
+                 max_length=constants.MAX_LENGTH, metrics_file=None, metrics_format='json',
+                 metrics_interval=constants.METRICS_INTERVAL, resume=False, compression=None,
+                 compression_level=constants.COMPRESSION_LEVEL, binary=False, streams=False, stripes=1,
+                 stripe_index=0, fec=None, workers=0):
+        # Tamanho adaptativo dos quadros de dados, entre min_length e max_length bytes
+        # (sem o modo adaptativo todos os quadros têm max_length bytes)
+        self.sizer = FrameSizer(min_length, max_length) if adaptive else None
+
+        # Criando a fonte dos quadros de envio (construídos sob demanda). Um diretório
+        # só pode ser enviado em streams (ver utils/streams.py)
+        self.input_file = input_file
+        self.max_length = min(max(int(max_length), 1), constants.MAX_LENGTH)
+        self.send_frames = self.open_source(os.path.isdir(input_file))
+
+        # Opções de comunicação. O modo padrão (janela 1) é o pare-e-espere original,
+        # as demais opções precisam ser negociadas com a outra ponta (quadro de HELLO)
+        self.window = min(max(int(window), 1), constants.MAX_WINDOW)
+        self.piggyback = piggyback
+        self.binary = binary
+        self.compression = compression
+        self.compression_level = compression_level
+        self.streams = streams or os.path.isdir(input_file)
+        self.fec = fec
+        self.options = dict(DEFAULT_OPTIONS)
+        self.id_space = 2
+
+        # Define se o envio e o recebimento rodam em threads separadas (DuplexEngine)
+        self.duplex = duplex
+
+        # Estimador de RTT que define o tempo de retransmissão (``self.rtt.rto``), que
+        # nunca fica abaixo de min_rto segundos
+        self.rtt = RttEstimator(min_rto=min_rto)
+
+        # Buffer onde procuramos os quadros recebidos da outra ponta
+        self.receiver = FrameReceiver()
+
+        # Quadros recebidos durante a negociação que ainda devem ser processados
+        self.pending_frames = []
+
+        # Processos que preparam os quadros de dados durante a comunicação (0 para que os
+        # quadros sejam preparados na própria thread de envio, ver utils/pipeline.py)
+        self.workers = max(int(workers), 0)
+
+        # Definindo o arquivo de saída (os dados são escritos conforme chegam)
         self.output_file = output_file
+        self.flush_bytes = flush_bytes
+        self.fsync = fsync
+        self.sink = None
+
+        # Função de descompressão dos quadros recebidos (caso a compressão seja negociada)
+        self.decompress = None
+
+        # Reconstrução dos quadros recebidos a partir das paridades (caso a FEC seja negociada)
+        self.fec_decoder = None
 
-        # Variáveis de controle para o envio e recebimento dos quadros
-        self.send_idx = 0
-        self.last_id = 1
-        self.last_chksum = -1
+        # Retomada de transferências interrompidas (ver utils/checkpoint.py): posição do
+        # arquivo de saída onde os dados recebidos continuam e checkpoint do recebimento
+        self.resume = resume
+        self.recv_offset = 0
+        self.checkpoint = None
+
+        # Transferência dividida em vários enlaces (ver utils/striping.py): quantidade de
+        # enlaces (pedida pela ponta ativa ou aceita pela passiva), o enlace desta ponta e
+        # o enlace e a quantidade acordados
+        self.stripes = max(int(stripes), 1)
+        self.stripe_index = stripe_index
+        self.stripe = None
 
         # Variáveis de controle para comunicação
         self.close_node = False
+
+        # Métricas da comunicação, escritas periodicamente em metrics_file (caso dado)
+        self.metrics = Metrics()
+        self.metrics_file = metrics_file
+        self.metrics_format = metrics_format
+        self.metrics_interval = metrics_interval
         
         # Criando socket
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
     def __del__(self):
         self.socket.close()
+        self.send_frames.close()
 
-    def create_frames(self, data):
-        """
-            Método auxiliar para criarmos os quadros com os dados de envio.
-            Esse método também irá criar o quadro de END, marcando o fim da comunicação.
-        """
+    def open_source(self, streams=False):
+        """ Método que cria a fonte dos quadros de envio (com a entrada em streams, caso pedido) """
 
-        # Computando quantos quadros são necessários para o envio completo dos dados
-        n_frames = (len(data) // constants.MAX_LENGTH)
-        if len(data) % constants.MAX_LENGTH != 0:
-            n_frames += 1
-        
-        frames = []
-        for i in range(n_frames):
-            begin = i * constants.MAX_LENGTH
-            end = begin + constants.MAX_LENGTH
-
-            buffer = data[begin:end]
-            header = [constants.SYNC, constants.SYNC, len(buffer), 0, (i%2), 0]
-            print(header)
-            
-            frame = pack(constants.HEADER_FORMAT, *header) + buffer
-            frame = self.fill_checksum_field(frame)
-            frames.append(frame)
-
-        # Criando o quadro de END que demarca o fim de comunicação
-        header = [constants.SYNC, constants.SYNC, 0, 0, (i+1)%2, 0x40]
-        print(header)
-        frame = pack(constants.HEADER_FORMAT, *header)
-        frame = self.fill_checksum_field(frame)
-        frames.append(frame)
-
-        return frames
-
-    def compute_checksum(self, frame):
-        """ Método auxiliar para computar o checksum de um quadro """
-
-        # Usaremos um frame auxiliar para computar o checksum
-        # Se o quadro tiver tamanho ímpar nós precisamos inserir um byte 0 no final
-        aux_frame = frame
-        if len(frame) % 2 != 0:
-            aux_frame += b'\x00'
-
-        # Somando 2 em 2 bytes
-        chksum = 0
-        for i in range(0, len(aux_frame), 2):
-            chksum += int.from_bytes(aux_frame[i:i+2], byteorder='big')
-
-        # Tratando de carry on
-        while (chksum >> 16) != 0:
-            chksum = (chksum >> 16) + (chksum & 0xffff)
-
-        # Retornando o valor do checksum
-        return ~chksum & 0xffff
-
-    def fill_checksum_field(self, frame):
-        """ 
-            Método para preencher o campo checksum de um quadro, 
-            retornando o quadro completo.
-        """
+        source = StreamSource if streams else FrameSource
+        return source(self.input_file, self.max_length, sizer=self.sizer)
+
+    def send_hello_frame(self, sock, options):
+        """ Método para enviar um quadro de HELLO com as opções de comunicação (sempre em base16) """
 
-        chksum = self.compute_checksum(frame)
-        return frame[:10] + pack('!H', chksum) + frame[12:]
+        payload = json.dumps(options).encode()
+        sock.sendall(encode(build_frame(0, constants.FLAG_HELLO, payload)))
 
-    def verify_frame_integrity(self, frame):
-        """ Método para verificar a integridade do quadro (campo checksum). """
+    def apply_options(self, options):
+        """ Método para aplicar as opções de comunicação acordadas com a outra ponta """
 
-        return self.compute_checksum(frame) == 0
+        self.options = complete_options(options)
 
-    def send_data_frame(self, sock):
-        """ Método auxiliar para enviarmos um quadro de dados para a rede. """
+        # Com streams a entrada (um diretório ou um único arquivo) é enviada em streams
+        if self.options['streams'] and not isinstance(self.send_frames, StreamSource):
+            self.send_frames.close()
+            self.send_frames = self.open_source(True)
 
-        frame = self.send_frames[self.send_idx]
-        sock.sendall(encode16(frame))
+        if self.options['window'] > 1:
+            self.id_space = constants.ID_SPACE
+            self.send_frames.set_id_space(self.id_space)
 
-    def send_ack_frame(self, sock, id):
-        """ Método para criar e enviar um quadro ACK para a rede """
+        # Os quadros de dados deixam espaço para os ACKs de carona
+        if self.options['piggyback']:
+            self.send_frames.set_max_length(min(self.send_frames.max_length, constants.MAX_LENGTH - TRAILER_RESERVE))
 
-        frame = [constants.SYNC, constants.SYNC, 0, 0, id, 0x80]
-        frame = pack(constants.HEADER_FORMAT, *frame)
-        frame = self.fill_checksum_field(frame)
+        # A partir de agora os nossos quadros vão para a rede sem a codificação base16
+        if self.options['binary']:
+            self.send_frames.set_binary(True)
 
-        sock.sendall(encode16(frame))
+        if self.options['compression']:
+            self.send_frames.set_compression(compressor(self.options['compression']), self.options['compression'])
+            self.decompress = decompressor(self.options['compression'])
 
-    def recv_expected_length(self, sock, expected_length, timeout=1.0):
+        if self.options['fec']:
+            self.send_frames.set_fec(self.options['fec'])
+            self.fec_decoder = FecDecoder(self.options['fec'], self.options['window'])
+
+    def apply_resume(self, send_offset, recv_offset, peer_source):
+        """
+            Método para aplicar a retomada acordada: os nossos quadros de dados começam em
+            send_offset e os dados recebidos da outra ponta (cuja entrada é identificada
+            por peer_source) são escritos a partir de recv_offset.
         """
-            Método auxiliar para lermos uma quantidade esperada de bytes (em base16)
-            de um recv. Esse método irá retornar os bytes decodificados, ou seja,
-            aplicando decode16.
 
-            O método pode gerar uma excessão ``socket.timeout`` ou ``RuntimeError`` indicando
-            um timeout no recv e um erro na comunicação, respectivamente.
+        self.send_frames.seek(send_offset)
+        self.recv_offset = recv_offset
+        self.checkpoint = Checkpoint(self.output_file, peer_source)
+
+    def apply_stripe(self, index, count, recv_offset):
         """
+            Método para aplicar a divisão acordada: enviamos apenas o trecho index (de count)
+            da entrada, e os dados recebidos são escritos a partir de recv_offset (o início
+            do trecho da outra ponta) sem truncar o arquivo de saída.
+        """
+
+        self.send_frames.seek(*stripe_range(self.send_frames.size, index, count))
+        self.recv_offset = recv_offset
+        self.stripe = (index, count)
 
-        buffer = b''
-        bytes_received = 0
+        # Cada enlace tem as suas métricas
+        self.metrics.labels['stripe'] = index
+        if self.metrics_file is not None:
+            self.metrics_file = '{}.{}'.format(self.metrics_file, index)
 
-        while bytes_received < expected_length:
-            # Iremos esperar 1 segundo até dar timeout
-            ready = select.select([sock], [], [], timeout)
-            if not ready[0]:
-                raise socket.timeout()
-                
-            data = sock.recv(min(expected_length - bytes_received, constants.BUFSZ))
-            if not data:
-                raise RuntimeError()
+    def valid_header(self, header):
+        """ Método para verificar se os campos de um cabeçalho recebido são válidos. """
 
-            buffer += data
-            bytes_received = bytes_received + len(data)
+        return valid_header(header, self.id_space, self.options['piggyback'], self.decompress is not None,
+                            self.options['streams'], self.fec_decoder is not None)
 
-        return decode16(buffer)
+    def write_payload(self, frame):
+        """
+            Método para escrever no arquivo de saída os dados de um quadro aceito (já
+            descomprimidos pela conexão). Os quadros de streams vão para o arquivo do seu stream.
+        """
+
+        payload = memoryview(frame)[14:]
+        stream = None
+        if frame[13] & constants.FLAG_STREAM:
+            stream, kind, payload = split_stream(payload)
 
-    def search_frame(self, sock, last_chksum, last_id):
+        if stream is not None:
+            self.sink.receive(stream, kind, payload)
+        elif len(payload) > 0:
+            self.sink.write(payload)
+
+    def search_frame(self, sock, timeout=None):
         """
-            Método que irá procurar e retornar um quadro válido.
+            Método que irá procurar e retornar um quadro válido, esperando até ``timeout``
+            segundos (por padrão o RTO atual).
 
             Caso isso não seja possível, devido à algum erro presente no quadro,
-            iremos retornar None.
+            iremos retornar None. O método pode gerar uma exceção ``socket.timeout``
+            ou ``RuntimeError`` indicando um timeout e um erro na comunicação, respectivamente.
         """
 
-        # Procurando uma sequência de sincronização
-        # Em base16 a sequência terá 2*8 = 16 bytes
-        header = self.recv_expected_length(sock, 16)
-        while header != constants.SYNC_BYTES:
-            print(header)
-            input()
-            header = self.recv_expected_length(sock, 16)
-
-        print('\nencontrei começo do quadro!')
-
-        # Obtendo restante do cabeçalho do quadro
-        # Em base16 o restante do cabeçalho terá 2*6 = 12 bytes
-        header += self.recv_expected_length(sock, 12)
-        header = unpack(constants.HEADER_FORMAT, header)
-
-        # Caso o campo id não seja 0 ou 1 teremos um erro
-        if header[4] not in (0, 1):
-            print('campo id incorreto!')
-            return None
-
-        # Caso o campo flag não seja 0x00, 0x40 ou 0x80 teremos um erro
-        if header[5] not in (0x00, 0x40, 0x80):
-            print('campo flag incorreto!')
-            return None
-
-        # Caso o campo length seja diferente de 0 mas temos um ACK ou END
-        # significa que recebemos um quadro errado!
-        if header[2] != 0 and (header[5] == 0x80 or header[5] == 0x40):
-            print('campo length incorreto!')
-            return None
-
-        # Caso o campo length seja 0 mas não temos um ACK ou END
-        # significa que recebemos um quadro errado!
-        if header[2] == 0 and (header[5] != 0x40 and header[5] != 0x80):
-            print('campo de length incorreto!')
-            return None
-
-        # Obtendo os dados do quadro
-        # Em base16 teremos 2*length bytes de dados
-        data = self.recv_expected_length(sock, 2*header[2])
-
-        # Verificando integridade do quadro
-        frame = pack(constants.HEADER_FORMAT, *header) + data
-        if self.verify_frame_integrity(frame) == False:
-            print('checksum inválido!')
-            return None
+        if timeout is None:
+            timeout = self.rtt.rto
+
+        # Procurando a próxima sequência de sincronização (em qualquer posição do
+        # buffer) e obtendo o quadro que começa nela. Caso o quadro seja inválido
+        # descartamos apenas a sincronização, de forma que a próxima busca comece
+        # logo após ela
+        frame = self.receiver.receive(sock, time.monotonic() + timeout, self.valid_header)
+        if frame is not None:
+            self.metrics.frames_received += 1
+
+        # Um quadro inválido indica erros no enlace, então os nossos quadros também diminuem
+        elif self.sizer is not None:
+            self.sizer.shrink()
 
         return frame
 
+    def collect_metrics(self):
+        """ Método que atualiza (e retorna) as métricas obtidas dos demais componentes do nó """
+
+        metrics = self.metrics
+        metrics.checksum_failures = self.receiver.checksum_failures
+        metrics.invalid_headers = self.receiver.invalid_headers
+        metrics.resync_bytes_skipped = self.receiver.skipped_bytes
+        metrics.bytes_written = self.sink.bytes_written if self.sink is not None else 0
+
+        metrics.rto_seconds = self.rtt.rto
+        metrics.srtt_seconds = self.rtt.srtt
+        metrics.compressed_frames = self.send_frames.compressed_frames
+        metrics.compression_input_bytes = self.send_frames.raw_bytes
+        metrics.compression_output_bytes = self.send_frames.payload_bytes
+        metrics.compression_cpu_seconds = self.send_frames.compress_seconds
+        if isinstance(self.send_frames, StreamSource):
+            metrics.streams_sent = self.send_frames.completed_streams
+        if isinstance(self.sink, StreamSink):
+            metrics.streams_received = self.sink.completed_streams
+
+        if self.fec_decoder is not None:
+            metrics.recovered_frames = self.fec_decoder.recovered_frames
+
+        metrics.frame_length_bytes = self.send_frames.frame_length()
+        metrics.window_frames = self.options['window']
+
+        return metrics
+
+    def handle_hello(self, sock, frame):
+        """
+            Método chamado ao recebermos um HELLO durante a comunicação. Por padrão o
+            quadro é ignorado (é uma resposta duplicada de uma negociação já concluída).
+        """
+
+        pass
+
+    def open_connection(self):
+        """ Método que cria o núcleo do protocolo (ver utils/connection.py) com as opções acordadas """
+
+        return DccnetConnection(self.send_frames, self.options, self.id_space, self.rtt, self.metrics, self.receiver,
+                                self.sizer, self.fec_decoder, self.decompress)
+
+    def handle_events(self, sock, events):
+        """ Método para processar os eventos da conexão: dados entregues em ordem e HELLOs """
+
+        for kind, frame in events:
+            if kind == DATA:
+                self.write_payload(frame)
+            elif kind == HELLO:
+                self.handle_hello(sock, frame)
+
+    def run_connection(self, sock, connection):
+        """
+            Método para executar a comunicação sobre o socket bloqueante (em qualquer janela:
+            o pare-e-espere é a janela de 1 quadro com ids de 1 bit).
+
+            A cada volta enviamos os quadros novos que cabem na janela e as retransmissões e
+            esperamos a outra ponta até o próximo temporizador da conexão, até que ela seja
+            fechada pelo encerramento (ver utils/connection.py) ou pela outra ponta.
+        """
+
+        # Quadros que já estavam no buffer (recebidos junto com a negociação)
+        self.handle_events(sock, connection.process(time.monotonic()))
+
+        while True:
+            now = time.monotonic()
+            connection.pump(now)
+            connection.handle_timeout(now)
+
+            # A outra ponta pode fechar o socket enquanto ainda confirmamos as suas retransmissões
+            try:
+                for idx, segments in connection.data_to_send():
+                    send_segments(sock, segments)
+                    connection.frame_sent(idx, time.monotonic())
+
+                if connection.closed:
+                    break
+
+                self.receiver.fill(sock, connection.next_deadline())
+            except socket.timeout:
+                # O quadro que estava chegando pode ter sido descartado (ver ``FrameReceiver.expire``),
+                # e os quadros depois dele já estão no buffer
+                pass
+            except (RuntimeError, OSError):
+                self.close_node = True
+                connection.receive_eof()
+                break
+
+            self.handle_events(sock, connection.process(time.monotonic()))
+
+    def transfer(self, sock):
+        """ Método para executar a comunicação no modo acordado, salvando os dados recebidos. """
+
+        if isinstance(self.send_frames, StreamSource) and not self.options['streams']:
+            raise RuntimeError('a entrada é um diretório, mas a outra ponta não aceitou streams')
+
+        # Os dados recebidos são escritos no arquivo de saída conforme são aceitos (com
+        # streams, cada stream em um arquivo dentro do diretório de saída)
+        if self.options['streams']:
+            self.sink = StreamSink(self.output_file, self.flush_bytes, self.fsync)
+        else:
+            self.sink = OutputSink(self.output_file, self.flush_bytes, self.fsync, self.recv_offset, self.checkpoint,
+                                   truncate=self.stripe is None)
+
+        # Os quadros de dados passam a ser preparados à frente do envio por outros processos
+        pipeline = None
+        if self.workers > 0 and not self.options['streams']:
+            pipeline = FramePipeline(self.workers)
+            self.send_frames.set_pipeline(pipeline)
+
+        dumper = None
+        if self.metrics_file is not None:
+            dumper = MetricsDumper(self.collect_metrics, self.metrics_file, self.metrics_format, self.metrics_interval)
+            dumper.start()
+
+        # Os quadros recebidos durante a negociação são os primeiros processados pela conexão
+        connection = self.open_connection()
+        frames, self.pending_frames = self.pending_frames, []
+        for frame in frames:
+            self.handle_events(sock, connection.receive_frame(frame, time.monotonic()))
+
+        try:
+            if self.duplex:
+                DuplexEngine(self, sock, connection).run()
+            else:
+                self.run_connection(sock, connection)
+        finally:
+            # O socket é fechado logo após o encerramento, de forma que a outra ponta (caso
+            # esteja esperando depois do ACK final) também termine
+            sock.close()
+            self.sink.close()
+            if dumper is not None:
+                dumper.stop()
+            if pipeline is not None:
+                self.send_frames.set_pipeline(None)
+                pipeline.close()
+
     def run(self):
         """ Método para executar a lógica principal de comunicação. """
 
-        raise NotImplementedError()
\ No newline at end of file
+        raise NotImplementedError()
@@ -0,0 +1,116 @@
+"""
+    Retomada de transferências interrompidas (opção ``resume``).
+
+    Cada ponta que recebe dados mantém, ao lado do arquivo de saída, um checkpoint
+    (``<saída>.ckpt``) com a identificação do arquivo enviado pela outra ponta e quantos
+    bytes dele já estão escritos com segurança no arquivo de saída. O checkpoint é
+    atualizado a cada descarga do arquivo de saída (ver utils/sink.py), sempre depois
+    dos dados, então ele nunca indica mais bytes do que o arquivo possui.
+
+    Ao reconectar, as pontas trocam esses valores no HELLO:
+
+        ponta ativa:  {'source': identificação da sua entrada,
+                       'received': checkpoint do que já recebeu da passiva (ou None)}
+        ponta passiva: {'source': identificação da sua entrada,
+                        'passive_offset': de onde a passiva continua enviando,
+                        'active_offset': de onde a ativa continua enviando}
+
+    Um checkpoint só é aceito caso a identificação guardada seja a da entrada atual da
+    outra ponta; caso contrário a direção correspondente recomeça do início. Quem envia
+    apenas move a sua fonte de quadros para a posição acordada (``FrameSource.seek``) e
+    quem recebe continua escrevendo a partir dela, então uma transferência interrompida
+    custa apenas os dados que faltavam.
+"""
+
+import os
+import json
+import hashlib
+
+from utils import constants
+
+def describe_source(input_file):
+    """
+        Retorna a identificação de um arquivo de entrada: o tamanho e um resumo do tamanho,
+        da data de modificação e de alguns trechos espalhados pelo arquivo (sem lê-lo inteiro).
+    """
+
+    with open(input_file, 'rb') as infile:
+        stat = os.fstat(infile.fileno())
+        size = stat.st_size
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update('{}:{}'.format(size, stat.st_mtime_ns).encode())
+
+        # Trechos igualmente espaçados, incluindo o começo e o final do arquivo
+        n_samples = constants.FINGERPRINT_SAMPLES
+        last = max(size - constants.FINGERPRINT_BLOCK, 0)
+        for i in range(n_samples):
+            infile.seek(last * i // (n_samples - 1))
+            digest.update(infile.read(constants.FINGERPRINT_BLOCK))
+
+    return {'size': size, 'digest': digest.hexdigest()}
+
+def load_checkpoint(output_file):
+    """
+        Retorna o checkpoint do arquivo de saída (``{'source': ..., 'offset': ...}``), ou None
+        caso ele não exista ou não seja consistente com o arquivo de saída.
+    """
+
+    try:
+        with open(output_file + constants.CHECKPOINT_SUFFIX) as infile:
+            checkpoint = json.load(infile)
+        size = os.path.getsize(output_file)
+    except (OSError, ValueError):
+        return None
+
+    # O arquivo de saída precisa conter todos os bytes indicados pelo checkpoint
+    offset = checkpoint.get('offset') if isinstance(checkpoint, dict) else None
+    if not isinstance(offset, int) or offset < 0 or offset > size:
+        return None
+
+    return checkpoint
+
+def valid_offset(checkpoint, source):
+    """ Retorna a posição de um checkpoint caso ele seja da entrada ``source`` (ou 0) """
+
+    if not isinstance(checkpoint, dict) or checkpoint.get('source') != source:
+        return 0
+
+    offset = checkpoint.get('offset')
+    if not isinstance(offset, int) or offset < 0:
+        return 0
+
+    return min(offset, source['size'])
+
+def resume_request(input_file, output_file):
+    """ Retorna o pedido de retomada enviado pela ponta ativa no HELLO """
+
+    return {'source': describe_source(input_file), 'received': load_checkpoint(output_file)}
+
+def resume_reply(request, input_file, output_file):
+    """ Retorna a resposta da ponta passiva a um pedido de retomada, com a posição de cada direção """
+
+    source = describe_source(input_file)
+
+    return {
+        'source': source,
+        'passive_offset': valid_offset(request.get('received'), source),
+        'active_offset': valid_offset(load_checkpoint(output_file), request.get('source')),
+    }
+
+class Checkpoint:
+    """ Checkpoint do recebimento de um arquivo de saída, com a identificação ``source`` da entrada da outra ponta """
+
+    def __init__(self, output_file, source):
+        self.path = output_file + constants.CHECKPOINT_SUFFIX
+        self.source = source
+
+    def save(self, offset):
+        """ Método para registrar que os ``offset`` bytes iniciais do arquivo de saída estão escritos """
+
+        # Escrevendo em um arquivo temporário e trocando de uma vez, para que um
+        # processo interrompido nunca deixe um checkpoint pela metade
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as outfile:
+            json.dump({'source': self.source, 'offset': offset}, outfile)
+        os.replace(temporary, self.path)
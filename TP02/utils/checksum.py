@@ -0,0 +1,114 @@
+"""
+    Módulo com o cálculo do checksum da Internet (RFC 1071) usado pelo DCCNET.
+
+    A soma em complemento de um das palavras de 16 bits é feita de uma só vez
+    sobre o buffer inteiro: como 2^16 = 1 (mod 0xffff), interpretar o buffer como
+    um único inteiro big-endian e reduzi-lo módulo 0xffff resulta na mesma soma
+    que percorrer o quadro de 2 em 2 bytes, mas com todo o trabalho feito em C.
+
+    O módulo também oferece a atualização incremental do checksum (RFC 1624),
+    útil quando apenas campos do cabeçalho mudam (por exemplo o bit de id).
+"""
+
+from struct import pack
+
+# Posição do campo checksum dentro do cabeçalho do quadro
+CHECKSUM_OFFSET = 10
+
+def ones_complement_sum(buffer):
+    """
+        Retorna a soma em complemento de um (já com os carries tratados) das
+        palavras de 16 bits big-endian do buffer. Buffers de tamanho ímpar são
+        tratados como se tivessem um byte 0 no final, sem realizar cópias.
+    """
+
+    view = memoryview(buffer)
+    total = int.from_bytes(view, byteorder='big')
+
+    # Um byte extra no final equivale a deslocar o inteiro 8 bits para a esquerda
+    if len(view) % 2 != 0:
+        total <<= 8
+
+    # Apenas um buffer totalmente nulo possui soma 0, os demais múltiplos
+    # de 0xffff correspondem ao "zero negativo" 0xffff
+    if total == 0:
+        return 0
+
+    total %= 0xffff
+    return total if total != 0 else 0xffff
+
+def internet_checksum(buffer):
+    """ Retorna o checksum da Internet de um buffer (bytes, bytearray ou memoryview). """
+
+    return ~ones_complement_sum(buffer) & 0xffff
+
+def update_checksum(chksum, old_word, new_word):
+    """
+        Atualiza incrementalmente um checksum quando uma palavra de 16 bits
+        do quadro muda de ``old_word`` para ``new_word`` (RFC 1624, eq. 3):
+
+            HC' = ~(~HC + ~m + m')
+    """
+
+    total = (~chksum & 0xffff) + (~old_word & 0xffff) + new_word
+    while (total >> 16) != 0:
+        total = (total >> 16) + (total & 0xffff)
+
+    return ~total & 0xffff
+
+def append_checksum(chksum, offset, data):
+    """
+        Atualiza incrementalmente um checksum quando os bytes ``data`` são acrescentados
+        ao final de um quadro que possuía ``offset`` bytes.
+    """
+
+    # Em uma posição ímpar o primeiro byte novo completa a última palavra do quadro
+    # (que tinha um byte 0 implícito), o que equivale a somar os dados precedidos de 0
+    if offset % 2 != 0:
+        data = b'\x00' + bytes(data)
+
+    total = (~chksum & 0xffff) + ones_complement_sum(data)
+    while (total >> 16) != 0:
+        total = (total >> 16) + (total & 0xffff)
+
+    return ~total & 0xffff
+
+def fill_checksum(frame):
+    """
+        Preenche, no próprio buffer, o campo checksum de um quadro mutável
+        (bytearray) e retorna o valor calculado.
+    """
+
+    frame[CHECKSUM_OFFSET:CHECKSUM_OFFSET+2] = b'\x00\x00'
+    chksum = internet_checksum(frame)
+    frame[CHECKSUM_OFFSET:CHECKSUM_OFFSET+2] = pack('!H', chksum)
+
+    return chksum
+
+def fill_header_checksum(header, *payloads):
+    """
+        Preenche, no próprio buffer, o campo checksum do cabeçalho (bytearray, de tamanho
+        par) de um quadro cujos dados estão em outros buffers (na ordem em que são enviados,
+        todos de tamanho par menos o último), sem concatená-los. Retorna o valor calculado.
+    """
+
+    header[CHECKSUM_OFFSET:CHECKSUM_OFFSET+2] = b'\x00\x00'
+
+    # Como os trechos anteriores têm tamanho par, cada trecho começa em uma palavra nova
+    # e as somas podem ser combinadas diretamente
+    total = ones_complement_sum(header) + sum(ones_complement_sum(payload) for payload in payloads)
+    while (total >> 16) != 0:
+        total = (total >> 16) + (total & 0xffff)
+
+    chksum = ~total & 0xffff
+    header[CHECKSUM_OFFSET:CHECKSUM_OFFSET+2] = pack('!H', chksum)
+
+    return chksum
+
+def verify_checksum(frame):
+    """
+        Verifica se o checksum presente no quadro é válido, ou seja, se a soma
+        em complemento de um do quadro completo é 0xffff.
+    """
+
+    return ones_complement_sum(frame) == 0xffff
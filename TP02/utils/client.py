@@ -1,120 +1,161 @@
+import json
+import time
 import socket
+import multiprocessing
 from struct import unpack
 
 from utils import constants
 from utils.base import BaseNode
+from utils.checkpoint import resume_request
+from utils.striping import peer_offset, stripe_request, wait_count
 
 class Client(BaseNode):
     """ Classe para modelar a ponta ativa da comunicação. """
 
-    def __init__(self, ip, host, input_file, output_file):
-        super().__init__(input_file, output_file)
+    def __init__(self, ip, host, input_file, output_file, **options):
+        super().__init__(input_file, output_file, **options)
+        self.metrics.labels['role'] = 'client'
         
         # Conectando com o servidor (ponta passiva)
         self.socket.connect((ip, int(host)))
 
-    def run(self):
-        # print('Devemos enviar {} quadros'.format(len(self.send_frames)))
+    def request_options(self, sock):
+        """
+            Método para negociar as opções de comunicação com a ponta passiva.
+
+            Enviamos um HELLO com as opções desejadas e esperamos o HELLO de resposta
+            com as opções acordadas. Caso a outra ponta envie outros quadros sem a resposta
+            (ou não responda), assumimos que ela usa apenas o modo pare-e-espere.
+        """
+
+        # No modo padrão (sem nenhuma outra opção) não há nada para negociar
+        if self.window == 1 and not (self.binary or self.compression or self.resume or self.streams or self.stripes > 1):
+            return
+
+        options = {'window': self.window, 'piggyback': self.piggyback, 'binary': self.binary}
+        if self.streams:
+            options['streams'] = True
+        if self.fec:
+            options['fec'] = int(self.fec)
+        if self.compression:
+            options['compression'] = {'method': self.compression, 'level': self.compression_level}
+        if self.resume:
+            options['resume'] = resume_request(self.input_file, self.output_file)
+        if self.stripes > 1:
+            options['stripe'] = stripe_request(self.stripe_index, self.stripes, self.send_frames.size)
+
+        for _ in range(constants.HELLO_RETRIES):
+            self.send_hello_frame(sock, options)
 
-        # Laço para enviarmos e receber alguns dados da outra ponta
-        while True:
-            # Enviando o quadro de dados atual
-            # print('enviando quadro', self.send_idx)
-            self.send_data_frame(self.socket)
-
-            # Recebendo algo da outra ponta
             try:
-                frame = self.search_frame(self.socket, self.last_chksum, self.last_id)
+                frame = self.search_frame(sock)
             except socket.timeout:
-                # print('timeout!')
+                self.rtt.backoff()
                 continue
-            except RuntimeError:
-                # print('erro na conexão, encerrando...')
-                self.close_node = True
-                break
 
-            # Verificando se conseguimos encontrar um quadro válido
             if frame is None:
                 continue
-            
-            # Extraíndo o cabeçalho do quadro recebido
+
+            # A outra ponta já começou a enviar dados: ou ela não negocia opções, ou a
+            # resposta chegou depois dos seus primeiros quadros (reordenados pelo enlace,
+            # por exemplo o END de uma ponta sem dados), então ainda esperamos por ela
             header = unpack(constants.HEADER_FORMAT, frame[:14])
-            # print('recebi quadro com header:', header)
-
-            # Verificando se recebemos um quadro de confirmação
-            if header[5] == 0x80 and (self.send_idx % 2) == header[4]:
-                # print('recebi um ACK do quadro {}, mandando próximo quadro'.format(self.send_idx))
-                
-                # Se estamos no último quadro (END) não iremos mais mandar dados
-                self.send_idx += 1
-                if self.send_idx == len(self.send_frames):
-                    # print('recebi meu ACK do END')
+            if header[5] != constants.FLAG_HELLO:
+                self.pending_frames.append(frame)
+                frame = self.wait_reply(sock, options)
+                if frame is None:
+                    return
+
+            self.apply_options(json.loads(frame[14:]))
+
+            # Continuamos enviando de onde a outra ponta parou de receber (e vice-versa)
+            resume = self.options['resume']
+            if self.resume and resume:
+                self.apply_resume(resume['active_offset'], resume['passive_offset'], resume['source'])
+
+            # Enviamos apenas o nosso trecho de uma transferência dividida
+            stripe = self.options['stripe']
+            if stripe:
+                self.apply_stripe(stripe['index'], stripe['count'], peer_offset(stripe))
+            return
+
+    def wait_reply(self, sock, options):
+        """
+            Método que espera o HELLO de resposta depois que a outra ponta começou a enviar
+            dados, guardando os quadros recebidos até lá. A resposta pode ter se perdido, então
+            a cada RTO sem ela o nosso HELLO é reenviado (até ``HELLO_RETRIES`` vezes). Retorna o
+            HELLO, ou None caso ele não chegue (a outra ponta usa apenas o modo pare-e-espere).
+        """
+
+        for attempt in range(constants.HELLO_RETRIES):
+            # Sem backoff: uma ponta que só usa o pare-e-espere nunca responde, e a espera
+            # total fica limitada a ``HELLO_RETRIES`` RTOs
+            if attempt > 0:
+                self.send_hello_frame(sock, options)
+
+            deadline = time.monotonic() + self.rtt.rto
+            while time.monotonic() < deadline:
+                try:
+                    frame = self.search_frame(sock, deadline - time.monotonic())
+                except socket.timeout:
                     break
 
-            # Verificando se recebemos um quadro duplicado
-            elif header[3] == self.last_chksum and header[4] == self.last_id:
-                # print('recebemos um quadro duplicado! enviando ack')
-                self.send_ack_frame(self.socket, self.last_id)
-
-            # Se nenhuma condição for satisfeita, então teremos um quadro com dados!
-            else:
-                # Caso o id seja igual (i.e quadro repetido) mas com checksum diferente
-                # significa que recebemos um quadro com algum erro!
-                if header[3] != self.last_chksum and header[4] == self.last_id:
+                if frame is None:
                     continue
 
-                # Iremos salvar o quadro e enviar um quadro de confirmação
-                self.last_chksum, self.last_id = header[3], header[4]
-                self.recv_frames.append(frame)
+                header = unpack(constants.HEADER_FORMAT, frame[:14])
+                if header[5] == constants.FLAG_HELLO:
+                    return frame
 
-                # print('recebi dado... enviando ack!')
-                self.send_ack_frame(self.socket, header[4])
+                self.pending_frames.append(frame)
 
-        # Executando loop para verificar se precisamos receber mais alguma coisa
-        while not self.close_node:
-            try:
-                frame = self.search_frame(self.socket, self.last_chksum, self.last_id)
-            except socket.timeout:
-                # print('timeout, posso finalizar!')
-                self.close_node = True
-                continue
-            except RuntimeError:
-                # print('erro na conexão, encerrando...')
-                break
+        return None
 
-            # Verificando se conseguimos encontrar um quadro válido
-            if frame is None:
-                continue
+    def run(self, results=None):
+        """
+            Executa a comunicação. Em uma transferência dividida, a quantidade de enlaces
+            acordada é informada na fila ``results`` (caso dada) logo após a negociação.
+        """
 
-            # Extraíndo o cabeçalho do quadro recebido
-            header = unpack(constants.HEADER_FORMAT, frame[:14])
+        self.request_options(self.socket)
+        if results is not None:
+            results.put(self.stripe[1] if self.stripe else 1)
 
-            # Caso recebermos um quadro de ACK podemos desconsiderar
-            # uma vez que já enviamos todos os dados necessários.
-            if header[5] == 0x80:
-                continue
+        # Apenas o primeiro enlace pode levar o arquivo inteiro
+        if self.stripe_index > 0 and self.stripe is None:
+            raise RuntimeError('a outra ponta não aceitou a transferência dividida')
 
-            # Verificando se recebemos um quadro duplicado
-            elif header[3] == self.last_chksum and header[4] == self.last_id:
-                # print('recebemos um quadro duplicado! enviando ack')
-                # print(header)
-                self.send_ack_frame(self.socket, self.last_id)
-
-            # Se nenhuma condição for satisfeita, então teremos um quadro com dados!
-            # Iremos salvar o quadro e enviar um quadro de confirmação
-            else:
-                # Caso o id seja igual (i.e quadro repetido) mas com checksum diferente
-                # significa que recebemos um quadro com algum erro!
-                if header[3] != self.last_chksum and header[4] == self.last_id:
-                    continue
+        self.transfer(self.socket)
+
+def run_stripe(ip, host, input_file, output_file, index, count, options, results=None):
+    """ Função executada pelo processo de cada enlace de uma transferência dividida """
+
+    Client(ip, host, input_file, output_file, stripes=count, stripe_index=index, **options).run(results)
+
+def run_striped(ip, host, input_file, output_file, stripes, **options):
+    """
+        Executa uma transferência dividida em até ``stripes`` enlaces (ver utils/striping.py),
+        cada um em um processo próprio. O primeiro enlace negocia a quantidade de enlaces e
+        os demais são abertos em seguida.
+    """
+
+    # Os enlaces escrevem os seus trechos no mesmo arquivo de saída, sem truncá-lo
+    open(output_file, 'wb').close()
+
+    results = multiprocessing.Queue()
+    first = multiprocessing.Process(target=run_stripe, args=(ip, host, input_file, output_file, 0, stripes, options, results))
+    first.start()
+    count = wait_count(results, first)
 
-                self.last_chksum, self.last_id = header[3], header[4]
-                self.recv_frames.append(frame)
+    workers = [first]
+    for index in range(1, count):
+        worker = multiprocessing.Process(target=run_stripe, args=(ip, host, input_file, output_file, index, count, options))
+        worker.start()
+        workers.append(worker)
 
-                # print('enviando ack!')
-                self.send_ack_frame(self.socket, header[4])
+    for worker in workers:
+        worker.join()
 
-        # Escrevendo os dados recebidos pela outra ponta e encerrando
-        with open(self.output_file, 'wb') as outfile:
-            data = b''.join([frame[14:] for frame in self.recv_frames])
-            outfile.write(data)
\ No newline at end of file
+    failed = [index for index, worker in enumerate(workers) if worker.exitcode != 0]
+    if failed:
+        raise RuntimeError('enlaces terminados com erro: {}'.format(failed))
@@ -0,0 +1,76 @@
+"""
+    Codificação base16 dos quadros DCCNET.
+
+    Os quadros são enviados em base16 maiúsculo (como ``base64.b16encode``), mas a
+    decodificação aceita dígitos maiúsculos e minúsculos. A decodificação é feita
+    diretamente a partir de memoryviews do buffer de recebimento, sem cópias
+    intermediárias, e pode verificar o checksum do quadro na mesma chamada.
+
+    Com a opção ``binary`` negociada, os quadros vão para a rede sem codificação (com o
+    mesmo cabeçalho, checksum e sincronização), ocupando metade dos bytes. As funções
+    ``wire_encoder`` e ``wire_decoder`` escolhem a conversão de cada formato.
+
+    Os quadros de dados são enviados em segmentos (cabeçalho, dados e, caso existam, os
+    ACKs de carona) com ``send_segments``, que usa ``sendmsg`` (scatter-gather) para que
+    os segmentos não precisem ser concatenados antes do envio.
+"""
+
+from binascii import hexlify, unhexlify
+
+from utils import constants
+from utils.checksum import verify_checksum
+
+# Sequência de sincronização (SYNC SYNC) em base16, nas duas grafias aceitas
+HEX_SYNC = hexlify(constants.SYNC_BYTES).upper()
+HEX_SYNC_LOWER = HEX_SYNC.lower()
+
+def encode(frame):
+    """ Retorna o quadro codificado em base16 (maiúsculo) """
+
+    return hexlify(frame).upper()
+
+def decode(view):
+    """
+        Retorna os bytes decodificados de um trecho em base16 (maiúsculo ou minúsculo).
+        Gera ``binascii.Error`` caso o trecho possua dígitos inválidos.
+    """
+
+    return unhexlify(view)
+
+def wire_encoder(binary=False):
+    """ Retorna a função que prepara um quadro para a rede (base16 ou binário) """
+
+    return bytes if binary else encode
+
+def wire_decoder(binary=False):
+    """ Retorna a função que obtém os bytes de um quadro (ou trecho) recebido da rede """
+
+    return bytes if binary else decode
+
+def send_segments(sock, segments):
+    """
+        Envia os segmentos de um quadro com uma única chamada de sistema (``sendmsg``),
+        sem concatená-los. Caso o envio seja parcial, o restante é enviado com ``sendall``.
+    """
+
+    if not hasattr(sock, 'sendmsg'):
+        sock.sendall(b''.join(segments))
+        return
+
+    sent = sock.sendmsg(segments)
+    for segment in segments:
+        if sent >= len(segment):
+            sent -= len(segment)
+            continue
+
+        sock.sendall(memoryview(segment)[sent:])
+        sent = 0
+
+def decode_verified(view):
+    """
+        Decodifica um quadro e verifica o seu checksum, retornando None caso ele seja
+        inválido. Gera ``binascii.Error`` caso o trecho possua dígitos inválidos.
+    """
+
+    frame = unhexlify(view)
+    return frame if verify_checksum(frame) else None
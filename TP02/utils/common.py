@@ -5,6 +5,17 @@ from base64 import b16encode as encode16
 from base64 import b16decode as decode16
 
 from utils import constants
+from utils.checksum import fill_checksum, verify_checksum
+
+def compute_checksum(frame):
+    """ Retorna uma cópia do quadro com o campo checksum preenchido. """
+
+    frame = bytearray(frame)
+    fill_checksum(frame)
+    return bytes(frame)
+
+def verify_frame_integrity(frame):
+    return verify_checksum(frame)
 
 def create_frames(data):
     n_frames = (len(data) // constants.MAX_LENGTH)
@@ -0,0 +1,103 @@
+"""
+    Compressão dos dados de cada quadro (opção ``compression``).
+
+    A ponta ativa pede um método (``zlib`` ou ``lzma``) e um nível no HELLO, e a
+    passiva aceita caso suporte o método. Cada quadro de dados é comprimido de forma
+    independente (retransmissões e quadros fora de ordem não dependem dos demais), e
+    apenas quando isso diminui o quadro: nesse caso o bit ``FLAG_COMPRESSED`` é marcado
+    no campo flags e o campo length indica o tamanho dos dados comprimidos.
+
+    Os formatos são os "crus" (deflate sem o cabeçalho do zlib e LZMA2 sem o contêiner
+    xz), já que o checksum do quadro já protege os dados.
+
+    Os dados de um quadro nunca passam de ``MAX_LENGTH`` bytes antes da compressão, então a
+    descompressão para nesse limite: dados que descomprimem além dele (ou que não formam
+    um fluxo comprimido completo e válido) geram ``ValueError``, e o quadro é descartado
+    por quem recebe em vez de ser escrito (ver ``DccnetConnection.receive_data_frame``).
+"""
+
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+from utils import constants
+
+def check_decompressed(payload, limit, complete):
+    """ Gera ``ValueError`` caso os dados descomprimidos passem do limite ou o fluxo comprimido esteja incompleto """
+
+    if len(payload) > limit:
+        raise ValueError('os dados comprimidos passam de {} bytes'.format(limit))
+    if not complete:
+        raise ValueError('fluxo comprimido incompleto')
+
+def zlib_compressor(level):
+    def compress(data):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+
+    return compress
+
+def zlib_decompress(data, limit=constants.MAX_LENGTH):
+    decompressor = zlib.decompressobj(-15)
+    try:
+        payload = decompressor.decompress(data, limit + 1)
+    except zlib.error as exc:
+        raise ValueError('dados comprimidos inválidos: {}'.format(exc)) from exc
+
+    check_decompressed(payload, limit, decompressor.eof and not decompressor.unused_data)
+    return payload
+
+def lzma_compressor(level):
+    # O dicionário não precisa ser maior que um quadro
+    filters = [{'id': lzma.FILTER_LZMA2, 'preset': level, 'dict_size': constants.LZMA_DICT_SIZE}]
+
+    def compress(data):
+        return lzma.compress(data, format=lzma.FORMAT_RAW, filters=filters)
+
+    return compress
+
+def lzma_decompress(data, limit=constants.MAX_LENGTH):
+    filters = [{'id': lzma.FILTER_LZMA2, 'dict_size': constants.LZMA_DICT_SIZE}]
+    decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=filters)
+    try:
+        payload = decompressor.decompress(data, limit + 1)
+    except lzma.LZMAError as exc:
+        raise ValueError('dados comprimidos inválidos: {}'.format(exc)) from exc
+
+    check_decompressed(payload, limit, decompressor.eof and not decompressor.unused_data)
+    return payload
+
+# Métodos suportados: nome -> (função que cria o compressor de um nível, descompressor)
+METHODS = {'zlib': (zlib_compressor, zlib_decompress)}
+if lzma is not None:
+    METHODS['lzma'] = (lzma_compressor, lzma_decompress)
+
+def compressor(options):
+    """ Retorna a função de compressão das opções acordadas ({'method': ..., 'level': ...}) """
+
+    return METHODS[options['method']][0](options['level'])
+
+def decompressor(options):
+    """ Retorna a função de descompressão das opções acordadas """
+
+    return METHODS[options['method']][1]
+
+def accepted_methods(method=None):
+    """ Retorna os métodos aceitos por uma ponta passiva (todos os suportados, caso nenhum seja dado) """
+
+    return [method] if method else list(METHODS)
+
+def agree_compression(requested, accepted):
+    """
+        Retorna a compressão acordada a partir do pedido da ponta ativa e da lista de
+        métodos aceitos pela ponta passiva, ou None caso ela não seja usada.
+    """
+
+    if not isinstance(requested, dict) or requested.get('method') not in accepted or requested['method'] not in METHODS:
+        return None
+
+    level = min(max(int(requested.get('level', constants.COMPRESSION_LEVEL)), 0), 9)
+    return {'method': requested['method'], 'level': level}
@@ -0,0 +1,418 @@
+"""
+    Núcleo do protocolo DCCNET sem entrada e saída (sans-IO).
+
+    ``DccnetConnection`` guarda todo o estado da transferência depois da negociação: as
+    janelas de envio e recebimento (o pare-e-espere é a janela 1 com ids de 1 bit, ver
+    utils/window.py), a detecção de duplicatas, o processamento dos ACKs e do END, os
+    ACKs de carona, a reconstrução pela FEC, a descompressão dos dados recebidos, os
+    temporizadores de retransmissão e as métricas. A conexão não lê nem escreve em sockets
+    e não consulta o relógio (apenas mede o tempo de CPU da descompressão para as
+    métricas):
+
+        - os bytes recebidos entram por ``receive_data`` (ou são lidos pelo transporte
+          direto no ``FrameReceiver`` da conexão e processados com ``process``);
+        - o instante atual é passado em cada chamada, e ``next_deadline`` diz até quando
+          o transporte pode esperar antes de chamar ``handle_timeout``;
+        - os quadros a serem enviados saem por ``data_to_send`` (cada um como uma tupla de
+          segmentos, ver ``send_segments`` em utils/codec.py), e o transporte avisa com
+          ``frame_sent`` quando cada quadro de dados terminou de ser escrito;
+        - os quadros entregues em ordem saem como eventos ``(DATA, quadro)``, já com os
+          dados descomprimidos (sem o bit ``FLAG_COMPRESSED``), e os HELLOs
+          recebidos durante a comunicação como ``(HELLO, quadro)``;
+        - quando ``closed`` fica verdadeiro o transporte pode fechar o socket, e o fim do
+          fluxo vindo da outra ponta é informado com ``receive_eof``.
+
+    O encerramento é explícito: cada ponta envia o seu END depois dos seus dados e ele é
+    confirmado como qualquer outro quadro. A ponta que termina ao receber o ACK do seu END
+    (o END da outra ponta já foi recebido e confirmado) fecha a conexão na hora. A ponta
+    que termina ao confirmar o END da outra ponta (o ACK final) espera ainda ``LINGER_RTOS``
+    RTOs para confirmar uma retransmissão do END caso esse ACK se perca, e fecha antes
+    disso caso a outra ponta feche o socket. Como uma ponta só fecha depois de receber o
+    END da outra, o fim do fluxo depois do END recebido também encerra a comunicação sem
+    erro. Uma ponta que fica ``PEER_TIMEOUT`` segundos sem enviar nenhum quadro válido é
+    considerada desaparecida e a conexão também é fechada.
+
+    Os transportes são invólucros finos sobre a conexão: ``BaseNode.run_connection``
+    (socket bloqueante), ``DuplexEngine`` (threads de envio e recebimento, ver
+    utils/duplex.py) e ``DccnetProtocol`` (asyncio, ver utils/aio.py). Sem sockets nem
+    temporizadores reais a conexão também pode ser exercitada inteiramente em memória
+    (ver benchmarks/connection_benchmark.py).
+"""
+
+import time
+
+from utils import constants
+from utils.codec import wire_encoder
+from utils.frame_source import build_frame, set_frame_id
+from utils.metrics import Metrics
+from utils.piggyback import AckQueue, ack_frame, attach_acks, split_acks
+from utils.receiver import INVALID, FrameReceiver, valid_header
+from utils.rtt import RttEstimator
+from utils.window import SendWindow, RecvWindow
+
+# Tipos dos eventos retornados pela conexão
+DATA, HELLO = range(2)
+
+class DccnetConnection:
+    """
+        Estado de uma transferência DCCNET com as opções acordadas ``options`` (ver
+        utils/options.py), enviando os quadros da fonte ``frames``. Os demais componentes
+        (estimador de RTT, métricas, buffer de recebimento, tamanho adaptativo, FEC e a
+        função de descompressão) podem ser compartilhados com o nó que negociou as opções.
+    """
+
+    def __init__(self, frames, options, id_space=None, rtt=None, metrics=None, receiver=None, sizer=None,
+                 fec_decoder=None, decompress=None):
+        self.frames = frames
+        self.options = options
+        self.id_space = id_space if id_space is not None else (constants.ID_SPACE if options['window'] > 1 else 2)
+
+        self.rtt = rtt if rtt is not None else RttEstimator()
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.receiver = receiver if receiver is not None else FrameReceiver()
+        self.sizer = sizer
+        self.fec_decoder = fec_decoder
+        self.decompress = decompress
+
+        self.send_window = SendWindow(frames, options['window'], self.id_space)
+        self.recv_window = RecvWindow(options['window'], self.id_space)
+        self.recv_done = False
+
+        # Encerramento (ver o início do arquivo): se a conexão foi fechada, até quando
+        # esperamos depois do ACK final e o instante do último quadro recebido (ou do
+        # primeiro envio, antes que a outra ponta envie algo)
+        self.closed = False
+        self.linger_deadline = None
+        self.last_received = None
+
+        # ACKs esperando para pegar carona nos quadros de dados (caso negociado)
+        self.acks = AckQueue(options['window'] // 2) if options['piggyback'] else None
+
+        # Quadros de ACK (já codificados), indexados pelo id. Os quadros são obtidos a partir
+        # do quadro com id 0 atualizando o checksum de forma incremental
+        self.wire_encode = wire_encoder(options['binary'])
+        self.ack_template = build_frame(0, constants.FLAG_ACK)
+        self.ack_frames = {}
+
+        # Quadros a serem enviados pelo transporte: (posição do quadro de dados, ou None para
+        # ACKs e paridades, tupla de segmentos)
+        self.outgoing = []
+
+    @property
+    def send_done(self):
+        """ Se todos os nossos quadros (incluindo o END) foram confirmados """
+
+        return self.send_window.done()
+
+    @property
+    def done(self):
+        """ Se as duas direções terminaram (ainda podemos precisar confirmar retransmissões da outra ponta) """
+
+        return self.send_window.done() and self.recv_done
+
+    def receive_eof(self):
+        """ Informa que a outra ponta fechou o socket, retornando se os seus dados chegaram por completo """
+
+        self.closed = True
+        return self.recv_done
+
+    def valid_header(self, header):
+        return valid_header(header, self.id_space, self.options['piggyback'], bool(self.options['compression']),
+                            self.options['streams'], self.fec_decoder is not None)
+
+    ###### ENVIO ######
+
+    def data_to_send(self):
+        """
+            Retorna (e esvazia) a lista dos quadros a serem enviados, cada um como (posição,
+            tupla de segmentos), onde a posição é None para os quadros que não são de dados.
+        """
+
+        outgoing, self.outgoing = self.outgoing, []
+        return outgoing
+
+    def frame_sent(self, idx, now):
+        """
+            Informa que o quadro de posição idx terminou de ser escrito no socket. O
+            temporizador do quadro começa no instante em que ele foi colocado na saída, mas
+            a escrita de uma janela inteira pode bloquear, e os quadros do final da janela
+            seriam retransmitidos (ou gerariam amostras de RTT) antes da hora.
+        """
+
+        if idx is not None:
+            self.send_window.restart(idx, now)
+
+    def can_send(self):
+        """ Retorna se um quadro novo cabe na janela de envio """
+
+        return self.send_window.can_send()
+
+    def pump(self, now):
+        """ Coloca na saída os quadros novos que cabem na janela (os ACKs pendentes vão de carona no primeiro) """
+
+        while self.send_window.can_send():
+            self.send_frame(self.send_window.next_idx, now)
+
+    def send_frame(self, idx, now, retransmission=False):
+        """ Coloca na saída o quadro de posição idx da fonte, contabilizando as retransmissões """
+
+        segments = self.frames.segments(idx)
+        ids = self.acks and self.acks.take()
+        if ids:
+            segments = attach_acks(segments, ids, self.options['binary'])
+            self.metrics.piggybacked_acks += len(ids)
+
+        self.outgoing.append((idx, segments))
+        self.send_window.mark_sent(idx, now)
+        if self.last_received is None:
+            self.last_received = now
+
+        self.metrics.frames_sent += 1
+        if retransmission:
+            self.metrics.retransmissions += 1
+
+        # A paridade de um grupo segue o primeiro envio do seu último quadro
+        elif self.frames.closes_group(idx):
+            self.outgoing.append((None, self.frames.parity_segments(idx)))
+            self.metrics.parity_frames_sent += 1
+
+    def next_deadline(self):
+        """
+            Retorna o instante do próximo temporizador (retransmissão, ACKs pendentes, fim da
+            espera depois do ACK final ou prazo de silêncio da outra ponta), ou None caso a
+            conexão esteja fechada ou ainda não tenha começado.
+        """
+
+        if self.closed:
+            return None
+
+        deadlines = [self.send_window.next_deadline(self.rtt.rto), self.acks and self.acks.deadline,
+                     self.linger_deadline, self.silence_deadline()]
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+
+        return min(deadlines) if deadlines else None
+
+    def silence_deadline(self):
+        if self.last_received is None:
+            return None
+
+        return self.last_received + constants.PEER_TIMEOUT
+
+    def handle_timeout(self, now):
+        """
+            Retransmite os quadros cujo temporizador expirou, envia os ACKs que esperaram
+            demais e fecha a conexão quando a espera depois do ACK final (ou o prazo de
+            silêncio da outra ponta) acaba.
+        """
+
+        if self.closed:
+            return
+
+        for deadline in (self.linger_deadline, self.silence_deadline()):
+            if deadline is not None and now >= deadline:
+                self.closed = True
+                return
+
+        # Um único backoff por evento de timeout
+        expired = self.send_window.expired(now, self.rtt.rto)
+        if expired:
+            self.on_timeout()
+
+        for idx in expired:
+            self.send_frame(idx, now, True)
+
+        if self.acks and self.acks.due(now):
+            self.flush_acks()
+
+    def send_ack(self, id):
+        """ Coloca na saída um quadro de ACK """
+
+        if id not in self.ack_frames:
+            self.ack_frames[id] = self.wire_encode(set_frame_id(self.ack_template, id))
+
+        self.outgoing.append((None, (self.ack_frames[id],)))
+        self.metrics.ack_frames_sent += 1
+
+    def ack(self, id, now):
+        """ Confirma um quadro recebido, de carona caso negociado e ainda existam quadros nossos a enviar """
+
+        if self.acks is None or self.send_window.done():
+            self.send_ack(id)
+        else:
+            self.acks.add(id, now)
+
+    def flush_acks(self):
+        """ Coloca na saída os ACKs pendentes que não pegaram carona (em um único quadro) """
+
+        ids = self.acks.take() if self.acks else []
+        if len(ids) == 1:
+            self.send_ack(ids[0])
+        elif ids:
+            self.outgoing.append((None, (ack_frame(ids, self.options['binary']),)))
+            self.metrics.ack_frames_sent += 1
+
+    def on_timeout(self):
+        """ Método chamado a cada evento de timeout (antes das retransmissões) """
+
+        self.metrics.timeouts += 1
+        self.rtt.backoff()
+        if self.sizer is not None:
+            self.sizer.shrink()
+
+    def on_acked(self, sample, latency):
+        """
+            Método chamado quando um quadro é confirmado, com a amostra de RTT (None caso o
+            quadro tenha sido retransmitido) e o tempo desde o seu primeiro envio.
+        """
+
+        self.metrics.frame_latency_seconds.observe(latency)
+        if sample is None:
+            return
+
+        self.metrics.rtt_seconds.observe(sample)
+        self.rtt.sample(sample)
+        if self.sizer is not None:
+            self.sizer.success()
+
+    ###### RECEBIMENTO ######
+
+    def receive_data(self, data, now):
+        """ Acrescenta os bytes recebidos da outra ponta ao buffer e os processa, retornando os eventos """
+
+        self.receiver.feed(data)
+        return self.process(now)
+
+    def process(self, now):
+        """ Processa os quadros completos que já estão no buffer de recebimento, retornando os eventos """
+
+        events = []
+        while True:
+            frame = self.receiver.poll(self.valid_header)
+            if frame is None:
+                break
+
+            # Um quadro inválido indica erros no enlace, então os nossos quadros também diminuem
+            if frame is INVALID:
+                if self.sizer is not None:
+                    self.sizer.shrink()
+                continue
+
+            self.metrics.frames_received += 1
+            self.receive_frame(frame, now, events)
+
+        return events
+
+    def receive_frame(self, frame, now, events=None):
+        """ Processa um quadro válido (já decodificado), retornando a lista de eventos ``events`` """
+
+        if events is None:
+            events = []
+
+        self.last_received = now
+        if frame[13] == constants.FLAG_HELLO:
+            events.append((HELLO, frame))
+            return events
+
+        # Processando os ACKs (sozinhos ou de carona em um quadro de dados)
+        frame, acked = split_acks(frame)
+        send_done = self.send_window.done()
+        for id in acked:
+            result = self.send_window.ack(id, now)
+            if result is not None:
+                self.on_acked(*result)
+
+        recv_done = self.recv_done
+        if frame is not None:
+            self.receive_data_frame(frame, now, events)
+
+        # Não há mais quadros de dados para levar os ACKs pendentes
+        if self.acks and self.send_window.done():
+            self.flush_acks()
+
+        if self.done and not self.closed:
+            self.closing(now, not send_done, not recv_done, frame is not None)
+
+        return events
+
+    def closing(self, now, send_finished, recv_finished, received_data):
+        """
+            Método chamado a cada quadro recebido depois que as duas direções terminaram.
+            ``send_finished`` e ``recv_finished`` indicam se o quadro terminou o envio (ACK
+            do nosso END) ou o recebimento (END da outra ponta).
+        """
+
+        # O END da outra ponta já tinha sido confirmado: ela tem tudo o que precisa
+        if send_finished and not recv_finished:
+            self.closed = True
+
+        # Acabamos de enviar o ACK final (ou de confirmar novamente uma retransmissão do
+        # END, caso ele tenha se perdido): esperamos um pouco antes de fechar
+        elif recv_finished or received_data:
+            self.linger_deadline = now + constants.LINGER_RTOS * self.rtt.rto
+
+    def receive_data_frame(self, frame, now, events):
+        """
+            Processa um quadro de dados, END ou de paridade: o quadro é guardado na janela de
+            recebimento e confirmado (inclusive as duplicatas, já que o nosso ACK anterior
+            pode ter se perdido), e os quadros que podem ser entregues em ordem viram eventos.
+            Os quadros reconstruídos pela FEC são processados da mesma forma. Um quadro
+            comprimido cujos dados não podem ser descomprimidos é descartado sem ACK.
+        """
+
+        frames = [frame]
+        while frames:
+            frame = frames.pop()
+
+            if frame[13] == constants.FLAG_PARITY:
+                recovered = self.fec_decoder.parity(frame, self.recv_window.base)
+            else:
+                # A janela guarda o quadro descomprimido, e a FEC o quadro como foi enviado
+                plain = frame
+                if frame[13] & constants.FLAG_COMPRESSED:
+                    plain = self.decompressed(frame)
+                    if plain is None:
+                        continue
+
+                id = frame[12]
+                idx = self.recv_window.position(id)
+                result = self.recv_window.receive(id, plain)
+                if result == RecvWindow.OUT_OF_WINDOW:
+                    continue
+
+                self.ack(id, now)
+                recovered = []
+                if result == RecvWindow.NEW and self.fec_decoder is not None:
+                    recovered = self.fec_decoder.add(idx, frame, self.recv_window.base)
+
+                for delivered in self.recv_window.deliver():
+                    if delivered[13] & constants.FLAG_END:
+                        self.recv_done = True
+                    else:
+                        events.append((DATA, delivered))
+
+            frames += [build_frame(idx % self.id_space, flags, payload) for idx, flags, payload in recovered]
+
+    def decompressed(self, frame):
+        """
+            Retorna o quadro com os dados descomprimidos (e sem o bit ``FLAG_COMPRESSED``), ou
+            None caso os dados comprimidos sejam inválidos ou descomprimam além do tamanho de
+            um quadro. Assim como um quadro corrompido, ele não é confirmado e a outra ponta
+            o retransmite.
+        """
+
+        start = 14
+        if frame[13] & constants.FLAG_STREAM:
+            start += constants.STREAM_PREFIX_LENGTH
+
+        started = time.thread_time()
+        try:
+            payload = self.decompress(memoryview(frame)[start:])
+        except ValueError:
+            self.metrics.decompression_failures += 1
+            return None
+        finally:
+            self.metrics.decompression_cpu_seconds += time.thread_time() - started
+
+        header = bytearray(frame[:start])
+        header[13] &= ~constants.FLAG_COMPRESSED & 0xFF
+        return bytes(header) + payload
@@ -1,7 +1,97 @@
 BUFSZ = 4096
+RECV_BUFFER_SIZE = 2**19
 MAX_LENGTH = 2**16 - 1
 
 SYNC = 0xdcc023c2
 SYNC_BYTES = b'\xdc\xc0\x23\xc2\xdc\xc0\x23\xc2'
 
-HEADER_FORMAT = '!IIHHBB'
\ No newline at end of file
+HEADER_FORMAT = '!IIHHBB'
+
+# Valores do campo flags
+FLAG_DATA = 0x00
+FLAG_ACK = 0x80
+FLAG_END = 0x40
+FLAG_HELLO = 0x20
+
+# Bit de flags que indica que o quadro carrega ACKs de carona (negociado no HELLO)
+FLAG_PIGGYBACK = 0x10
+
+# Bit de flags que indica que os dados do quadro estão comprimidos (negociado no HELLO)
+FLAG_COMPRESSED = 0x08
+
+# Bit de flags que indica um quadro de um stream (negociado no HELLO): os dados começam
+# com o prefixo STREAM_FORMAT (id do stream, tipo do quadro), ver utils/streams.py
+FLAG_STREAM = 0x04
+STREAM_FORMAT = '!HH'
+STREAM_PREFIX_LENGTH = 4
+
+# Bit de flags do quadro de paridade (FEC, negociado no HELLO): os dados começam com o
+# prefixo FEC_FORMAT (posição do primeiro quadro do grupo, quantidade de quadros), ver utils/fec.py
+FLAG_PARITY = 0x02
+FEC_FORMAT = '!IB'
+FEC_PREFIX_LENGTH = 5
+
+# Espaço que os quadros de dados deixam livre para que a paridade (prefixo e os campos
+# length e flags de cada bloco) caiba em um quadro, e o maior grupo de quadros de uma paridade
+FEC_RESERVE = FEC_PREFIX_LENGTH + 3
+MAX_FEC_GROUP = 64
+
+# Tempo (em segundos) de retransmissão inicial, antes de termos amostras de RTT,
+# e tempo máximo de espera pelo restante de um quadro que já começou a chegar
+TIMEOUT = 1.0
+
+# Número de quadros de HELLO enviados antes de assumirmos que a outra ponta
+# não negocia opções (ou seja, usa apenas o modo pare-e-espere original)
+HELLO_RETRIES = 5
+
+# O campo id possui 8 bits, logo no modo de janela deslizante (Selective Repeat)
+# a janela pode ter no máximo metade do espaço de identificadores
+ID_SPACE = 2**8
+MAX_WINDOW = ID_SPACE // 2
+
+# Limites do tempo de retransmissão adaptativo (RTO) e quantas amostras de RTT guardamos.
+# O limite inferior evita retransmissões espúrias quando o RTT medido é muito pequeno (no
+# loopback, uma janela inteira de quadros grandes demora mais que o RTT para ser escrita);
+# a RFC 6298 recomenda 1 s e usamos 200 ms, como o Linux. Valores menores podem ser
+# pedidos com --min-rto
+MIN_RTO = 0.2
+MAX_RTO = 60.0
+RTT_HISTORY = 1024
+
+# Espera (em RTOs) depois do ACK final do encerramento, para confirmarmos novamente o END
+# da outra ponta caso o ACK se perca, e tempo (em segundos) sem receber nenhum quadro após
+# o qual consideramos que a outra ponta desapareceu. A outra ponta retransmite pelo menos a
+# cada MAX_RTO, então o prazo tolera várias retransmissões seguidas perdidas
+LINGER_RTOS = 2
+PEER_TIMEOUT = 10 * MAX_RTO
+
+# Tempo máximo (em segundos) que um ACK espera por um quadro de dados para pegar carona
+# e quantos ACKs no máximo são enviados em um mesmo quadro
+ACK_DELAY = 0.005
+MAX_PIGGYBACK_ACKS = 32
+
+# Limite inferior padrão do tamanho adaptativo dos dados de um quadro e quantos ACKs
+# seguidos sem retransmissão são necessários para dobrar o tamanho
+MIN_FRAME_LENGTH = 512
+FRAME_GROW_AFTER = 8
+
+# Intervalo (em segundos) entre as escritas do arquivo de métricas e limites (em segundos)
+# dos histogramas de RTT e de latência dos quadros
+METRICS_INTERVAL = 1.0
+METRICS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Retomada de transferências: sufixo do checkpoint do arquivo de saída e quantos trechos
+# (e de que tamanho) do arquivo de entrada entram na sua identificação
+CHECKPOINT_SUFFIX = '.ckpt'
+FINGERPRINT_SAMPLES = 16
+FINGERPRINT_BLOCK = 4096
+
+# Nível padrão da compressão dos quadros e tamanho do dicionário do lzma (um quadro)
+COMPRESSION_LEVEL = 6
+LZMA_DICT_SIZE = 2**16
+
+# Quantos arquivos (streams) são enviados ao mesmo tempo no modo de streams
+MAX_OPEN_STREAMS = 8
+
+# Quantos quadros de dados vão em cada lote preparado pelos processos do pipeline de envio
+PIPELINE_BATCH = 8
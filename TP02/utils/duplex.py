@@ -0,0 +1,143 @@
+import time
+import socket
+import threading
+
+from utils.codec import send_segments
+
+class LockedSocket:
+    """
+        Socket compartilhado entre as threads de envio e de recebimento. Os envios são
+        serializados por um lock, para que quadros de threads diferentes não se misturem.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+
+    def sendall(self, data):
+        with self.lock:
+            self.sock.sendall(data)
+
+    def sendmsg(self, buffers):
+        # Os segmentos de um quadro são enviados por completo antes de liberar o lock
+        with self.lock:
+            send_segments(self.sock, buffers)
+
+        return sum(len(buffer) for buffer in buffers)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
+
+class DuplexEngine:
+    """
+        Motor de comunicação full-duplex sobre a conexão sans-IO (ver utils/connection.py).
+
+        O envio dos quadros de dados (e as retransmissões) roda na thread principal,
+        enquanto uma segunda thread recebe os quadros da outra ponta e escreve os dados
+        recebidos. As duas threads compartilham a conexão, protegida por uma ``Condition``,
+        e enviam os quadros que ela produz fora da seção crítica.
+
+        O protocolo na rede é o mesmo dos outros modos: com janela 1 temos o pare-e-espere
+        com bit alternado, e com janelas maiores o Selective Repeat negociado. Com os ACKs
+        de carona, a thread de recebimento apenas enfileira os ACKs na conexão e a thread de
+        envio os coloca no próximo quadro de dados (ou os envia sozinhos quando o prazo vence).
+    """
+
+    def __init__(self, node, sock, connection):
+        self.node = node
+        self.sock = LockedSocket(sock)
+        self.connection = connection
+
+        # Condição sinalizada quando a outra ponta envia algo (ACKs liberam a janela e ACKs
+        # enfileirados mudam os prazos) ou quando a conexão é encerrada
+        self.changed = threading.Condition()
+
+    def run(self):
+        # Os primeiros quadros entram na janela antes das threads começarem, de forma que a
+        # conexão já tenha os seus temporizadores quando a thread de recebimento esperar
+        self.connection.pump(time.monotonic())
+
+        receiver = threading.Thread(target=self.receive_loop, daemon=True)
+        receiver.start()
+
+        self.send_loop()
+        receiver.join()
+
+    def send(self, outgoing):
+        """ Envia os quadros (fora da seção crítica) e depois reinicia os temporizadores dos quadros de dados """
+
+        sent = []
+        for idx, segments in outgoing:
+            send_segments(self.sock, segments)
+            if idx is not None:
+                sent.append((idx, time.monotonic()))
+
+        if sent:
+            with self.changed:
+                for idx, now in sent:
+                    self.connection.frame_sent(idx, now)
+
+    def send_loop(self):
+        """ Laço de envio: mantém a janela cheia e retransmite os quadros cujo temporizador expirou """
+
+        connection = self.connection
+
+        while True:
+            with self.changed:
+                if connection.send_done or connection.closed:
+                    break
+
+                now = time.monotonic()
+                connection.pump(now)
+                connection.handle_timeout(now)
+                outgoing = connection.data_to_send()
+
+            # Enviando fora da seção crítica, para não atrasarmos o processamento dos ACKs
+            try:
+                self.send(outgoing)
+            except OSError:
+                return
+
+            # Esperando a outra ponta ou o próximo temporizador expirar
+            with self.changed:
+                deadline = connection.next_deadline()
+                if deadline is not None and not connection.can_send():
+                    self.changed.wait(max(deadline - time.monotonic(), 0))
+
+    def receive_loop(self):
+        """
+            Laço de recebimento: processa os quadros da outra ponta (ACKs, dados e END) e
+            envia os ACKs que a conexão produz. Depois que todos os nossos quadros foram
+            confirmados (e a thread de envio terminou) este laço também trata os
+            temporizadores da conexão, até que ela seja fechada pelo encerramento.
+        """
+
+        connection, receiver = self.connection, self.node.receiver
+
+        while True:
+            with self.changed:
+                now = time.monotonic()
+                events = connection.process(now)
+                if connection.send_done:
+                    connection.handle_timeout(now)
+
+                outgoing = connection.data_to_send()
+                closed = connection.closed
+                deadline = connection.next_deadline()
+                self.changed.notify_all()
+
+            try:
+                self.send(outgoing)
+                self.node.handle_events(self.sock, events)
+                if closed:
+                    return
+
+                receiver.fill(self.sock, deadline)
+            except socket.timeout:
+                continue
+            except (RuntimeError, OSError):
+                with self.changed:
+                    self.node.close_node = True
+                    connection.receive_eof()
+                    self.changed.notify_all()
+                return
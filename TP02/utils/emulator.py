@@ -0,0 +1,360 @@
+"""
+    Emulador de enlace para testar o DCCNET sem precisar de uma rede ruim de verdade.
+
+    ``LinkEmulator`` é um proxy TCP que fica entre as duas pontas: ele aceita a conexão
+    da ponta ativa, conecta na ponta passiva e repassa os quadros (em base16 ou binário)
+    nas duas direções aplicando atraso, limite de banda, perda, duplicação, reordenação e
+    troca de dígitos (ou bytes, nos quadros binários) dentro dos quadros. Todas as decisões
+    vêm de um gerador pseudoaleatório com semente, de forma que a mesma sequência de
+    quadros sofre sempre os mesmos erros.
+"""
+
+import math
+import time
+import queue
+import random
+import socket
+import threading
+from struct import unpack
+
+from utils import constants
+from utils.codec import HEX_SYNC, HEX_SYNC_LOWER
+from utils.receiver import HEADER_LENGTH, HEX_HEADER_LENGTH
+
+HEX_DIGITS = b'0123456789ABCDEF'
+
+# Quantidade máxima de quadros em trânsito em cada direção do enlace
+QUEUE_SIZE = 256
+
+# Tipos dos trechos separados por ``FrameSplitter``
+RAW, HEX_FRAME, BINARY_FRAME = 'raw', 'hex', 'binary'
+
+class FrameSplitter:
+    """
+        Separa o fluxo recebido de uma ponta em quadros completos, em base16 ou binário
+        (identificados pela sincronização). Os bytes que não fazem parte de um quadro
+        (antes de uma sincronização) são retornados como trechos avulsos, para serem
+        repassados sem alterações.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """ Acrescenta os dados recebidos e retorna a lista de (trecho, tipo) completos """
+
+        self.buffer += data
+        chunks = []
+
+        while True:
+            found = [(p, kind) for p, kind in ((self.buffer.find(HEX_SYNC), HEX_FRAME),
+                                               (self.buffer.find(HEX_SYNC_LOWER), HEX_FRAME),
+                                               (self.buffer.find(constants.SYNC_BYTES), BINARY_FRAME)) if p != -1]
+            pos, kind = min(found, default=(-1, RAW))
+            if pos == -1:
+                # Mantendo o final do buffer, que pode ser o começo de uma sincronização
+                keep = len(HEX_SYNC) - 1
+                if len(self.buffer) > keep:
+                    chunks.append((bytes(self.buffer[:-keep]), RAW))
+                    del self.buffer[:-keep]
+                break
+
+            if pos > 0:
+                chunks.append((bytes(self.buffer[:pos]), RAW))
+                del self.buffer[:pos]
+
+            if kind == BINARY_FRAME:
+                if len(self.buffer) < HEADER_LENGTH:
+                    break
+
+                # O campo length ocupa os bytes 8 e 9 do cabeçalho
+                frame_length = HEADER_LENGTH + unpack('!H', self.buffer[8:10])[0]
+            else:
+                if len(self.buffer) < HEX_HEADER_LENGTH:
+                    break
+
+                # O campo length ocupa os dígitos 16 a 20 do cabeçalho em base16
+                try:
+                    frame_length = HEX_HEADER_LENGTH + 2 * int(self.buffer[16:20], 16)
+                except ValueError:
+                    chunks.append((bytes(self.buffer[:1]), RAW))
+                    del self.buffer[:1]
+                    continue
+
+            if len(self.buffer) < frame_length:
+                break
+
+            chunks.append((bytes(self.buffer[:frame_length]), kind))
+            del self.buffer[:frame_length]
+
+        return chunks
+
+    def flush(self):
+        """ Retorna os bytes restantes (um quadro incompleto no fim da conexão) """
+
+        data, self.buffer = bytes(self.buffer), bytearray()
+        return data
+
+class LinkDirection:
+    """
+        Uma direção do enlace emulado: lê os quadros de ``src``, aplica os erros e os
+        entrega em ``dst`` respeitando o atraso e a banda configurados.
+    """
+
+    def __init__(self, src, dst, rng, emulator):
+        self.src = src
+        self.dst = dst
+        self.rng = rng
+        self.emulator = emulator
+
+        # O atraso variável usa um gerador separado, já que ele também é sorteado para os
+        # trechos avulsos (cuja quantidade depende de como o TCP dividiu os dados)
+        self.jitter_rng = random.Random(rng.random())
+
+        # Quadros a serem entregues, com o instante de entrega
+        self.queue = queue.Queue(QUEUE_SIZE)
+
+        # Instante em que o enlace termina de transmitir o último quadro enfileirado
+        self.busy_until = 0.0
+        self.last_delivery = 0.0
+
+        # Quadro segurado para ser entregue depois do próximo (reordenação)
+        self.held = None
+
+        self.stats = {'frames': 0, 'bytes': 0, 'dropped': 0, 'duplicated': 0,
+                      'reordered': 0, 'corrupted': 0, 'flipped_digits': 0}
+
+    def run(self):
+        writer = threading.Thread(target=self.write_loop, daemon=True)
+        writer.start()
+
+        self.read_loop()
+        writer.join()
+
+    def read_loop(self):
+        splitter = FrameSplitter()
+
+        while True:
+            try:
+                data = self.src.recv(65536)
+            except OSError:
+                data = b''
+
+            if not data:
+                break
+
+            for chunk, kind in splitter.feed(data):
+                if kind == RAW:
+                    self.enqueue(chunk)
+                else:
+                    self.impair(chunk, kind == BINARY_FRAME)
+
+        if self.held is not None:
+            self.enqueue(self.held)
+        self.enqueue(splitter.flush())
+        self.queue.put(None)
+
+    def impair(self, frame, binary=False):
+        """ Aplica os erros configurados a um quadro completo (em base16 ou binário) """
+
+        emulator, rng = self.emulator, self.rng
+        self.stats['frames'] += 1
+
+        if rng.random() < emulator.drop:
+            self.stats['dropped'] += 1
+            return
+
+        if rng.random() < emulator.corrupt:
+            frame = self.corrupt(frame, binary)
+
+        if emulator.digit_error > 0:
+            positions = self.error_positions(len(frame))
+            if positions:
+                frame = self.flip(frame, positions, binary)
+
+        copies = 1
+        if rng.random() < emulator.duplicate:
+            self.stats['duplicated'] += 1
+            copies = 2
+
+        # Segurando o quadro para que ele seja entregue depois do próximo
+        if self.held is None and rng.random() < emulator.reorder:
+            self.stats['reordered'] += 1
+            self.held = frame * copies
+            return
+
+        self.enqueue(frame * copies)
+        if self.held is not None:
+            self.enqueue(self.held)
+            self.held = None
+
+    def corrupt(self, frame, binary=False):
+        """ Troca ``flips`` dígitos (ou bytes) do quadro """
+
+        emulator, rng = self.emulator, self.rng
+        header_length = HEADER_LENGTH if binary else HEX_HEADER_LENGTH
+        positions = []
+
+        for _ in range(emulator.flips):
+            # Uma fração dos erros pode ser direcionada ao cabeçalho (sincronização, id, flags, length...)
+            if rng.random() < emulator.header_bias:
+                positions.append(rng.randrange(min(header_length, len(frame))))
+            else:
+                positions.append(rng.randrange(len(frame)))
+
+        return self.flip(frame, positions, binary)
+
+    def error_positions(self, length):
+        """
+            Sorteia as posições trocadas quando cada dígito é trocado de forma independente
+            com probabilidade ``digit_error``. O intervalo até o próximo erro segue uma
+            distribuição geométrica, então não sorteamos um número por dígito.
+        """
+
+        log_q = math.log(1 - self.emulator.digit_error)
+        positions = []
+        pos = -1
+
+        while True:
+            pos += 1 + int(math.log(1 - self.rng.random()) / log_q)
+            if pos >= length:
+                return positions
+            positions.append(pos)
+
+    def flip(self, frame, positions, binary=False):
+        """ Troca os dígitos das posições dadas por outros dígitos base16 (ou os bytes por outros bytes) """
+
+        frame = bytearray(frame)
+        for pos in positions:
+            if binary:
+                frame[pos] ^= self.rng.randrange(1, 256)
+            else:
+                frame[pos] = self.rng.choice([digit for digit in HEX_DIGITS if digit != frame[pos]])
+            self.stats['flipped_digits'] += 1
+
+        self.stats['corrupted'] += 1
+        return bytes(frame)
+
+    def enqueue(self, data):
+        if not data:
+            return
+
+        # O quadro ocupa o enlace durante len/banda segundos e chega após o atraso de propagação
+        now = time.monotonic()
+        self.busy_until = max(self.busy_until, now)
+        if self.emulator.bandwidth:
+            self.busy_until += len(data) / self.emulator.bandwidth
+
+        delivery = self.busy_until + self.emulator.delay + self.jitter_rng.uniform(0, self.emulator.jitter)
+
+        # O enlace não reordena sozinho: um quadro nunca chega antes do anterior
+        self.last_delivery = max(self.last_delivery, delivery)
+        self.queue.put((self.last_delivery, data))
+
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            delivery, data = item
+            delay = delivery - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            try:
+                self.dst.sendall(data)
+            except OSError:
+                break
+
+            self.stats['bytes'] += len(data)
+
+        # Repassando o fim da conexão para a outra ponta
+        try:
+            self.dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+class LinkEmulator:
+    """
+        Proxy TCP que emula um enlace ruim entre duas pontas DCCNET.
+
+        Parâmetros (aplicados de forma independente em cada direção):
+            delay, jitter: atraso fixo e variação máxima (uniforme) em segundos
+            bandwidth: banda do enlace em bytes por segundo (None para ilimitada)
+            drop, duplicate, reorder: probabilidade de um quadro ser perdido, duplicado ou
+                entregue depois do próximo quadro
+            corrupt: probabilidade de um quadro ter ``flips`` dígitos trocados, sendo que
+                cada troca cai no cabeçalho com probabilidade ``header_bias``
+            digit_error: probabilidade de cada dígito (ou byte, nos quadros binários) ser
+                trocado de forma independente (erros proporcionais ao tamanho do quadro na
+                rede, como em um enlace com ruído)
+            seed: semente do gerador pseudoaleatório
+    """
+
+    def __init__(self, listen_port, target_ip, target_port, seed=0, delay=0.0, jitter=0.0, bandwidth=None,
+                 drop=0.0, duplicate=0.0, reorder=0.0, corrupt=0.0, flips=1, header_bias=0.0, digit_error=0.0):
+        self.target = (target_ip, int(target_port))
+        self.seed = seed
+
+        self.delay = delay
+        self.jitter = jitter
+        self.bandwidth = bandwidth
+        self.drop = drop
+        self.duplicate = duplicate
+        self.reorder = reorder
+        self.corrupt = corrupt
+        self.flips = flips
+        self.header_bias = header_bias
+        self.digit_error = digit_error
+
+        self.n_connections = 0
+        self.connections = []
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(('', int(listen_port)))
+        self.socket.listen()
+
+    def __del__(self):
+        self.socket.close()
+
+    def serve(self, max_connections=None):
+        """ Atende conexões (até ``max_connections``), cada uma em uma thread própria """
+
+        threads = []
+        while max_connections is None or self.n_connections < max_connections:
+            conn, addr = self.socket.accept()
+            self.n_connections += 1
+
+            thread = threading.Thread(target=self.handle, args=(conn, self.n_connections), daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+
+    def handle(self, conn, n_connection):
+        """ Repassa os dados da conexão n_connection nas duas direções até as duas pontas encerrarem """
+
+        target = socket.create_connection(self.target)
+
+        # Cada direção tem o seu próprio gerador, para que as decisões de uma direção
+        # não dependam da quantidade de quadros da outra
+        directions = {}
+        for name, src, dst in (('upstream', conn, target), ('downstream', target, conn)):
+            rng = random.Random('{}-{}-{}'.format(self.seed, n_connection, name))
+            directions[name] = LinkDirection(src, dst, rng, self)
+
+        threads = [threading.Thread(target=direction.run, daemon=True) for direction in directions.values()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        conn.close()
+        target.close()
+
+        stats = {name: direction.stats for name, direction in directions.items()}
+        self.connections.append(stats)
+        return stats
@@ -0,0 +1,141 @@
+"""
+    Correção de erros sem retransmissão (FEC) com quadros de paridade (opção ``fec``).
+
+    Com a opção negociada, quem envia divide os seus quadros em grupos de ``group`` quadros
+    consecutivos (o grupo g tem os quadros g*group até g*group+group-1) e, logo após enviar
+    o último quadro de um grupo pela primeira vez, envia um quadro de paridade (bit
+    ``FLAG_PARITY``) com o XOR dos blocos dos quadros do grupo. O bloco de um quadro é
+    ``pack('!HB', length, flags)`` seguido dos seus dados, completado com zeros até o maior
+    bloco do grupo. Os dados do quadro de paridade são ``pack(FEC_FORMAT, posição do primeiro
+    quadro, quantidade de quadros)`` seguido do XOR dos blocos.
+
+    Quem recebe guarda os blocos dos quadros recentes pela sua posição. Caso exatamente um
+    quadro de um grupo esteja faltando (perdido ou descartado por um checksum incorreto)
+    quando a paridade chega, ou quando chega o penúltimo quadro de um grupo cuja paridade
+    já chegou, o quadro que falta é reconstruído (XOR da paridade com os demais blocos) e
+    processado como se tivesse sido recebido, inclusive confirmado, então o quadro não é
+    retransmitido. Os quadros de paridade não são confirmados nem retransmitidos, e o custo
+    na rede é de um quadro a cada ``group``.
+"""
+
+from struct import pack, unpack_from
+
+from utils import constants
+
+# As posições dos quadros são enviadas módulo 2**32
+POSITION_SPACE = 2**32
+
+def frame_block(flags, payload):
+    """ Retorna o bloco de um quadro (campos length e flags seguidos dos dados) """
+
+    return pack('!HB', len(payload), flags) + payload
+
+def xor_blocks(blocks):
+    """ Retorna o XOR dos blocos (os menores são completados com zeros no final) """
+
+    parity, longest = 0, 0
+    for block in blocks:
+        parity ^= int.from_bytes(block, 'little')
+        longest = max(longest, len(block))
+
+    return parity.to_bytes(longest, 'little')
+
+def parity_payload(start, blocks):
+    """ Retorna os dados do quadro de paridade do grupo que começa na posição start """
+
+    return pack(constants.FEC_FORMAT, start % POSITION_SPACE, len(blocks)) + xor_blocks(blocks)
+
+def agree_fec(requested, accepted, window):
+    """ Retorna o tamanho dos grupos acordado (ou None), já que a paridade só faz sentido com a janela deslizante """
+
+    if not accepted or window <= 1 or not isinstance(requested, int) or requested < 2:
+        return None
+
+    return min(requested, constants.MAX_FEC_GROUP)
+
+class FecDecoder:
+    """
+        Reconstrução dos quadros recebidos a partir dos quadros de paridade. Guarda os
+        blocos dos quadros recebidos (e as paridades que ainda não puderam ser usadas) de
+        uma faixa de posições suficiente para a janela de ``window`` quadros.
+    """
+
+    def __init__(self, group, window):
+        self.group = group
+        self.span = 2 * (window + group)
+
+        # Blocos recebidos e paridades pendentes, indexados pela posição
+        self.blocks = {}
+        self.parities = {}
+        self.newest = 0
+
+        self.recovered_frames = 0
+
+    def add(self, idx, frame, base):
+        """
+            Guarda o bloco de um quadro novo na posição idx (já sem os ACKs de carona),
+            retornando a lista de quadros reconstruídos com ele: (posição, flags, dados).
+        """
+
+        flags = frame[13] & ~constants.FLAG_PIGGYBACK
+        self.blocks[idx] = frame_block(flags, bytes(memoryview(frame)[14:]))
+        self.forget(idx)
+
+        return self.recover(idx - idx % self.group, base)
+
+    def parity(self, frame, base):
+        """ Guarda um quadro de paridade, retornando a lista de quadros reconstruídos com ele """
+
+        start, count = unpack_from(constants.FEC_FORMAT, frame, 14)
+
+        # A posição enviada é módulo 2**32: escolhemos a mais próxima da base da janela
+        start = base + (start - base + POSITION_SPACE // 2) % POSITION_SPACE - POSITION_SPACE // 2
+        if start < self.newest - self.span or count == 0:
+            return []
+
+        self.parities[start] = (count, bytes(memoryview(frame)[14 + constants.FEC_PREFIX_LENGTH:]))
+        self.forget(start)
+
+        return self.recover(start, base)
+
+    def recover(self, start, base):
+        """ Tenta reconstruir o único quadro que falta do grupo que começa em start """
+
+        if start not in self.parities:
+            return []
+
+        count, parity = self.parities[start]
+        members = range(start, start + count)
+
+        # Quadros anteriores à base já foram recebidos, mas o bloco pode já ter sido descartado
+        missing = [idx for idx in members if idx not in self.blocks]
+        if any(idx < base for idx in missing):
+            del self.parities[start]
+            return []
+
+        if len(missing) != 1:
+            if not missing:
+                del self.parities[start]
+            return []
+
+        del self.parities[start]
+        block = xor_blocks([parity] + [self.blocks[idx] for idx in members if idx != missing[0]])
+
+        length, flags = unpack_from('!HB', block)
+        if 3 + length > len(block):
+            return []
+
+        self.recovered_frames += 1
+        return [(missing[0], flags, block[3:3 + length])]
+
+    def forget(self, idx):
+        """ Descarta os blocos e paridades que ficaram para trás da faixa guardada """
+
+        if idx <= self.newest:
+            return
+
+        self.newest = idx
+        oldest = idx - self.span
+        for table in (self.blocks, self.parities):
+            for old in [old for old in table if old < oldest]:
+                del table[old]
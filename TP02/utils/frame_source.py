@@ -0,0 +1,435 @@
+import os
+import mmap
+import time
+from collections import deque
+from struct import pack, pack_into, unpack_from
+
+from utils import constants
+from utils.checksum import fill_header_checksum, update_checksum
+from utils.codec import encode, wire_decoder
+from utils.fec import frame_block, parity_payload
+
+def build_header(id, flags, *payloads):
+    """
+        Função que retorna o cabeçalho (bytearray) do quadro cujos dados são os trechos
+        payloads (enviados em sequência), com o checksum preenchido
+    """
+
+    length = sum(len(payload) for payload in payloads)
+    header = bytearray(pack(constants.HEADER_FORMAT, constants.SYNC, constants.SYNC, length, 0, id, flags))
+    fill_header_checksum(header, *payloads)
+
+    return header
+
+def build_frame(id, flags, payload=b''):
+    """ Função auxiliar para construir um quadro com o checksum preenchido """
+
+    frame = build_header(id, flags, payload)
+    frame += payload
+
+    return bytes(frame)
+
+def set_frame_id(frame, id):
+    """
+        Função que retorna uma cópia de um quadro já checksumado com o campo id trocado. O
+        checksum é atualizado de forma incremental (RFC 1624), sem somar o quadro novamente.
+    """
+
+    frame = bytearray(frame)
+    chksum, old_word = unpack_from('!HH', frame, 10)
+    new_word = (id << 8) | (old_word & 0xff)
+
+    pack_into('!HH', frame, 10, update_checksum(chksum, old_word, new_word), new_word)
+    return bytes(frame)
+
+def map_file(path):
+    """ Função que mapeia um arquivo em memória, retornando (tamanho, mmap, memoryview dos dados) """
+
+    # Não é possível mapear um arquivo vazio, nesse caso usamos um buffer vazio
+    with open(path, 'rb') as infile:
+        size = os.fstat(infile.fileno()).st_size
+        if size == 0:
+            return 0, None, memoryview(b'')
+
+        mapped = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        return size, mapped, memoryview(mapped)
+
+class FrameSource:
+    """
+        Fonte de quadros de envio construídos sob demanda.
+
+        O arquivo de entrada é mapeado em memória (mmap) e apenas uma pequena janela
+        de quadros à frente (look-ahead) fica construída. Dessa forma a transmissão pode
+        começar imediatamente e a memória usada não depende do tamanho do arquivo.
+
+        A fonte se comporta como a antiga lista de quadros: ``len(source)`` retorna o
+        número de quadros (incluindo o quadro de END) e ``source[i]`` retorna o quadro i.
+        O campo id do quadro i é ``i % id_space`` (2 no modo pare-e-espere).
+
+        Os quadros são guardados prontos para a rede (``source.segments(i)``), em base16 ou,
+        com ``set_binary``, sem codificação. Cada quadro é um par de segmentos (cabeçalho e
+        dados) que nunca são concatenados: o checksum é preenchido no próprio cabeçalho e,
+        no formato binário, os dados são uma memoryview do arquivo mapeado. Assim cada
+        quadro é construído uma única vez, e uma retransmissão custa apenas um ``sendmsg``
+        (ver ``send_segments`` em utils/codec.py).
+
+        O trecho do arquivo de cada quadro é definido quando o quadro é construído pela
+        primeira vez: com um ``sizer`` (ver utils/sizing.py) o tamanho dos dados é escolhido
+        quadro a quadro, caso contrário todos os quadros têm ``max_length`` bytes. Assim o
+        número de quadros só é conhecido depois que o último trecho foi definido, e até lá
+        ``len(source)`` é uma estimativa com o tamanho atual (sempre maior que os quadros
+        já definidos).
+
+        Com a compressão negociada (``set_compression``) os dados de cada quadro são
+        comprimidos na construção, e a versão comprimida só é usada caso seja menor.
+
+        Com a FEC negociada (``set_fec``) a fonte também constrói o quadro de paridade de
+        cada grupo de quadros (``parity_segments``, ver utils/fec.py).
+
+        Com um pipeline (``set_pipeline``) os quadros de dados são preparados em lotes por
+        outros processos, à frente do quadro sendo enviado (ver utils/pipeline.py).
+    """
+
+    def __init__(self, input_file, max_length=constants.MAX_LENGTH, lookahead=4, id_space=2, sizer=None):
+        self.max_length = max_length
+        self.lookahead = lookahead
+        self.id_space = id_space
+        self.sizer = sizer
+        self.path = input_file
+        self.size, self.mmap, self.data = self.map_input(input_file)
+
+        # Trechos do arquivo (início, fim) dos quadros de dados já definidos, quantos
+        # quadros foram definidos e até onde o arquivo já foi dividido
+        self.bounds = {}
+        self.n_assigned = 0
+        self.assigned_offset = 0
+
+        # Quadros já construídos (segmentos prontos para a rede), indexados pela sua posição
+        self.frames = {}
+        self.binary = False
+
+        # Função de compressão dos dados (caso negociada), quantos bytes foram comprimidos,
+        # quantos bytes resultaram nos quadros, quantos quadros foram comprimidos e o tempo
+        # de CPU gasto comprimindo
+        self.compress = None
+        self.compression = None
+        self.raw_bytes = 0
+        self.payload_bytes = 0
+        self.compressed_frames = 0
+        self.compress_seconds = 0.0
+
+        # Posição (alinhada à página) até onde o mapeamento já foi devolvido ao sistema
+        self.released_offset = 0
+
+        # Tamanho dos grupos da FEC (caso negociada) e (flags, dados) dos quadros construídos
+        self.fec_group = None
+        self.blocks = {}
+
+        # Processos que preparam os quadros (caso usados), lotes em preparação (posições
+        # e trechos dos quadros, resultado) e até qual posição os quadros já foram enviados
+        # para preparação
+        self.pipeline = None
+        self.batches = deque()
+        self.prepared = 0
+
+    def map_input(self, input_file):
+        """ Método que mapeia a entrada em memória, retornando (tamanho, mmap, memoryview dos dados) """
+
+        return map_file(input_file)
+
+    @property
+    def n_data_frames(self):
+        """ Número de quadros de dados (estimado com o tamanho atual caso o arquivo não tenha sido todo dividido) """
+
+        length = self.frame_length()
+        return self.n_assigned + (self.size - self.assigned_offset + length - 1) // length
+
+    def __len__(self):
+        return self.n_data_frames + 1
+
+    def __getitem__(self, idx):
+        return wire_decoder(self.binary)(self.encoded(idx))
+
+    def segments(self, idx):
+        """ Método que retorna os segmentos do quadro de posição idx prontos para serem enviados """
+
+        if idx < 0 or idx >= len(self):
+            raise IndexError('quadro {} fora da fonte'.format(idx))
+
+        # Com o pipeline o look-ahead são os lotes em preparação, e apenas quadros fora
+        # deles (como o END) são construídos aqui
+        lookahead = self.lookahead
+        if self.pipeline is not None:
+            self.prefetch(idx)
+            self.collect(idx)
+            lookahead = 1
+
+        # Construindo o quadro pedido e os próximos do look-ahead
+        if idx not in self.frames:
+            for i in range(idx, min(idx + lookahead, len(self))):
+                if i not in self.frames:
+                    self.frames[i] = self.build_segments(i)
+
+        return self.frames[idx]
+
+    def prefetch(self, idx):
+        """ Método para manter os lotes de quadros de dados à frente da posição idx em preparação """
+
+        batch, depth = self.pipeline.batch, self.pipeline.depth
+        self.prepared = max(self.prepared, idx)
+
+        while len(self.batches) < depth and self.prepared < idx + batch * depth:
+            self.assign(self.prepared + batch - 1)
+            frames = [(i,) + self.bounds[i] for i in range(self.prepared, self.prepared + batch)
+                      if i in self.bounds and i not in self.frames]
+            if not frames:
+                break
+
+            # Os dados comprimidos voltam quando são enviados como estão ou usados na paridade
+            keep = self.binary or self.fec_group is not None
+            jobs = [(i % self.id_space, begin, end) for i, begin, end in frames]
+            self.batches.append((frames, self.pipeline.submit(self.path, self.binary, self.compression, keep, jobs)))
+            self.prepared = frames[-1][0] + 1
+
+    def collect(self, idx):
+        """ Método que espera os lotes em preparação até o que contém a posição idx, guardando os quadros """
+
+        while idx not in self.frames and self.batches and self.batches[0][0][0][0] <= idx:
+            frames, future = self.batches.popleft()
+            for (i, begin, end), prepared in zip(frames, future.result()):
+                self.frames[i] = self.prepared_segments(i, begin, end, *prepared)
+
+    def prepared_segments(self, idx, begin, end, flags, header, compressed, encoded, raw_length, length, seconds):
+        """ Método que retorna os segmentos de um quadro preparado no pipeline, contabilizando a compressão """
+
+        payload = compressed if compressed is not None else self.data[begin:end]
+
+        if self.compression is not None:
+            self.compress_seconds += seconds
+            self.raw_bytes += raw_length
+            self.payload_bytes += length
+            if flags & constants.FLAG_COMPRESSED:
+                self.compressed_frames += 1
+
+        if self.fec_group is not None:
+            self.blocks[idx] = (flags, (payload,))
+
+        return (header, payload if self.binary else encoded)
+
+    def encoded(self, idx):
+        """ Método que retorna o quadro de posição idx (em base16 ou binário) em um único buffer """
+
+        return b''.join(self.segments(idx))
+
+    def frame_length(self):
+        """ Método que retorna o tamanho dos dados do próximo quadro a ser definido """
+
+        if self.sizer is None:
+            return self.max_length
+
+        return min(self.sizer.length, self.max_length)
+
+    def assign(self, idx):
+        """ Método para definir os trechos do arquivo dos quadros até a posição idx """
+
+        while self.n_assigned <= idx and self.assigned_offset < self.size:
+            end = min(self.assigned_offset + self.frame_length(), self.size)
+            self.bounds[self.n_assigned] = (self.assigned_offset, end)
+            self.n_assigned += 1
+            self.assigned_offset = end
+
+    def build_segments(self, idx):
+        """ Método para construir os segmentos (cabeçalho com o checksum preenchido e dados) do quadro de posição idx """
+
+        self.assign(idx)
+
+        # O último quadro é o END que demarca o fim de comunicação
+        if idx not in self.bounds:
+            return self.frame_segments(idx, constants.FLAG_END)
+
+        begin, end = self.bounds[idx]
+        payload, flags = self.data[begin:end], constants.FLAG_DATA
+        if self.compress is not None:
+            payload, flags = self.compress_payload(payload)
+
+        return self.frame_segments(idx, flags, payload)
+
+    def frame_segments(self, idx, flags, *payloads):
+        """ Método que retorna os segmentos (cabeçalho e trechos dos dados) do quadro de posição idx """
+
+        # Os dados são guardados (sem cópia) para a paridade do grupo
+        if self.fec_group is not None:
+            self.blocks[idx] = (flags, payloads)
+
+        return self.wire_segments(idx % self.id_space, flags, *payloads)
+
+    def wire_segments(self, id, flags, *payloads):
+        """ Método que retorna os segmentos de um quadro no formato da rede """
+
+        header = build_header(id, flags, *payloads)
+
+        # No formato binário os dados não são copiados
+        if self.binary:
+            return (bytes(header),) + payloads
+
+        return (encode(header),) + tuple(encode(payload) for payload in payloads)
+
+    def closes_group(self, idx):
+        """ Método que retorna se o quadro de posição idx (já construído) é o último do seu grupo da FEC """
+
+        return self.fec_group is not None and ((idx + 1) % self.fec_group == 0 or idx == len(self) - 1)
+
+    def parity_segments(self, idx):
+        """ Método que retorna os segmentos do quadro de paridade do grupo do quadro de posição idx """
+
+        start = idx - idx % self.fec_group
+        members = range(start, min(start + self.fec_group, len(self)))
+
+        blocks = []
+        for i in members:
+            if i not in self.blocks:
+                self.segments(i)
+            flags, payloads = self.blocks[i]
+            blocks.append(frame_block(flags, b''.join(payloads)))
+
+        return self.wire_segments(start % self.id_space, constants.FLAG_PARITY, parity_payload(start, blocks))
+
+    def compress_payload(self, payload):
+        """ Método que retorna os dados (comprimidos, caso fiquem menores) e as flags de um quadro de dados """
+
+        started = time.thread_time()
+        compressed = self.compress(payload)
+        self.compress_seconds += time.thread_time() - started
+        self.raw_bytes += len(payload)
+
+        flags = constants.FLAG_DATA
+        if len(compressed) < len(payload):
+            payload, flags = compressed, constants.FLAG_DATA | constants.FLAG_COMPRESSED
+            self.compressed_frames += 1
+
+        self.payload_bytes += len(payload)
+        return payload, flags
+
+    def clear_frames(self):
+        """ Método para descartar os quadros já construídos e os lotes em preparação """
+
+        self.frames.clear()
+        self.clear_batches()
+
+    def clear_batches(self):
+        for frames, future in self.batches:
+            future.cancel()
+        self.batches.clear()
+        self.prepared = 0
+
+    def set_id_space(self, id_space):
+        """ Método para trocar o espaço de identificadores (descartando os quadros já construídos) """
+
+        self.id_space = id_space
+        self.clear_frames()
+
+    def set_binary(self, binary):
+        """ Método para trocar o formato dos quadros na rede (descartando os quadros já construídos) """
+
+        self.binary = binary
+        self.clear_frames()
+
+    def set_compression(self, compress, options=None):
+        """
+            Método para definir a função de compressão dos dados (descartando os quadros já
+            construídos). As opções acordadas (options) permitem que os processos do pipeline
+            criem a mesma função, e sem elas os quadros de dados não usam o pipeline.
+        """
+
+        self.compress = compress
+        self.compression = options
+        self.clear_frames()
+
+    def set_pipeline(self, pipeline):
+        """ Método para definir os processos que preparam os quadros de dados (ou None para prepará-los aqui) """
+
+        self.clear_batches()
+
+        # Sem as opções da compressão os processos não saberiam comprimir os dados
+        if self.compress is not None and self.compression is None:
+            pipeline = None
+        self.pipeline = pipeline
+
+    def set_fec(self, group):
+        """ Método para definir o tamanho dos grupos da FEC (descartando os quadros já construídos) """
+
+        self.fec_group = group
+        self.clear_frames()
+        self.blocks.clear()
+
+        # O quadro de paridade tem o prefixo e os campos length e flags além dos dados
+        self.set_max_length(min(self.max_length, constants.MAX_LENGTH - constants.FEC_RESERVE))
+
+    def set_max_length(self, max_length):
+        """
+            Método para trocar o tamanho máximo dos dados de cada quadro (por exemplo para
+            deixar espaço para os ACKs de carona). Os quadros já definidos não mudam.
+        """
+
+        self.max_length = max_length
+
+    def seek(self, offset, end=None):
+        """
+            Método para que o primeiro quadro de dados comece na posição offset do arquivo
+            (retomada de uma transferência) e, caso dado, o último termine na posição end
+            (um trecho de uma transferência dividida). Deve ser chamado antes de qualquer
+            quadro ser definido.
+        """
+
+        if self.n_assigned > 0 or self.frames:
+            raise ValueError('a fonte já começou a ser dividida em quadros')
+
+        if end is not None:
+            self.size = min(max(int(end), 0), self.size)
+
+        self.assigned_offset = min(max(int(offset), 0), self.size)
+
+        # As páginas anteriores à posição nunca serão lidas
+        self.released_offset = self.assigned_offset - self.assigned_offset % mmap.PAGESIZE
+
+    def release(self, idx):
+        """ Método para descartar os quadros anteriores a idx, que não serão mais enviados """
+
+        # As chaves são copiadas antes, já que no modo full-duplex outra thread pode estar
+        # construindo quadros ao mesmo tempo
+        for i in [i for i in list(self.frames) if i < idx]:
+            del self.frames[i]
+
+        # Os trechos dos quadros confirmados também não são mais necessários
+        for i in [i for i in list(self.bounds) if i < idx]:
+            del self.bounds[i]
+        self.release_blocks(idx)
+
+        # Avisando o sistema que as páginas já enviadas não serão mais lidas, para que
+        # a memória residente do processo não cresça com o tamanho do arquivo
+        offset = self.bounds[idx][0] if idx in self.bounds else self.assigned_offset
+        offset -= offset % mmap.PAGESIZE
+        if self.mmap is not None and hasattr(mmap, 'MADV_DONTNEED') and offset > self.released_offset:
+            self.mmap.madvise(mmap.MADV_DONTNEED, self.released_offset, offset - self.released_offset)
+            self.released_offset = offset
+
+    def release_blocks(self, idx):
+        """ Método para descartar os dados guardados para a paridade dos grupos anteriores ao do quadro idx """
+
+        if self.fec_group is not None:
+            start = idx - idx % self.fec_group
+            for i in [i for i in list(self.blocks) if i < start]:
+                del self.blocks[i]
+
+    def close(self):
+        self.clear_frames()
+        self.blocks.clear()
+        self.bounds.clear()
+        self.data.release()
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:
+                # Algum segmento ainda está em uso (por exemplo no buffer de um transporte
+                # do asyncio); o mapeamento é desfeito quando ele for liberado
+                pass
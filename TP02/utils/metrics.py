@@ -0,0 +1,228 @@
+"""
+    Métricas de uma ponta DCCNET.
+
+    ``Metrics`` guarda contadores, medidores (gauges) e histogramas da comunicação, e
+    pode ser exportado em JSON ou no formato texto do Prometheus. ``MetricsDumper``
+    escreve periodicamente as métricas em um arquivo (de forma atômica, com um arquivo
+    temporário e ``os.replace``), para acompanharmos a saúde do enlace sem depender da
+    saída padrão.
+"""
+
+import os
+import json
+import time
+import bisect
+import threading
+
+from utils import constants
+
+# Contadores: nome -> descrição
+COUNTERS = {
+    'frames_sent': 'Quadros de dados enviados (incluindo retransmissões)',
+    'frames_received': 'Quadros válidos recebidos',
+    'retransmissions': 'Quadros de dados retransmitidos',
+    'timeouts': 'Eventos de timeout de retransmissão',
+    'checksum_failures': 'Quadros descartados por checksum incorreto',
+    'invalid_headers': 'Quadros descartados por cabeçalho inválido',
+    'resync_bytes_skipped': 'Bytes (em base16) descartados procurando a sincronização',
+    'bytes_written': 'Bytes de dados escritos no arquivo de saída',
+    'ack_frames_sent': 'Quadros de ACK enviados',
+    'piggybacked_acks': 'ACKs enviados de carona em quadros de dados',
+    'compressed_frames': 'Quadros de dados enviados comprimidos',
+    'compression_input_bytes': 'Bytes de dados passados à compressão',
+    'compression_output_bytes': 'Bytes de dados nos quadros após a compressão',
+    'compression_cpu_seconds': 'Tempo de CPU gasto comprimindo os quadros',
+    'decompression_cpu_seconds': 'Tempo de CPU gasto descomprimindo os quadros recebidos',
+    'decompression_failures': 'Quadros descartados por dados comprimidos inválidos',
+    'streams_sent': 'Streams (arquivos) enviados e confirmados por completo',
+    'streams_received': 'Streams (arquivos) recebidos por completo',
+    'parity_frames_sent': 'Quadros de paridade (FEC) enviados',
+    'recovered_frames': 'Quadros reconstruídos a partir das paridades, sem retransmissão',
+}
+
+# Medidores: nome -> descrição
+GAUGES = {
+    'rto_seconds': 'Tempo de retransmissão atual',
+    'srtt_seconds': 'RTT suavizado',
+    'frame_length_bytes': 'Tamanho atual dos dados de um quadro',
+    'window_frames': 'Tamanho da janela acordada',
+}
+
+# Histogramas: nome -> descrição
+HISTOGRAMS = {
+    'rtt_seconds': 'Amostras de RTT (quadros não retransmitidos)',
+    'frame_latency_seconds': 'Tempo entre o primeiro envio de um quadro e o seu ACK',
+}
+
+class Histogram:
+    """ Histograma com limites fixos (buckets cumulativos, como no Prometheus) """
+
+    def __init__(self, bounds=constants.METRICS_BUCKETS):
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other):
+        """ Acrescenta as observações de outro histograma com os mesmos limites """
+
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+
+    def cumulative(self):
+        """ Retorna a lista de (limite, quantidade de observações menores ou iguais ao limite) """
+
+        total, buckets = 0, []
+        for bound, count in zip(self.bounds + [float('inf')], self.counts):
+            total += count
+            buckets.append((bound, total))
+
+        return buckets
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': {('+Inf' if bound == float('inf') else repr(bound)): count for bound, count in self.cumulative()},
+        }
+
+class Metrics:
+    """
+        Métricas de uma ponta. Os contadores, medidores e histogramas são atributos
+        (por exemplo ``metrics.frames_sent += 1`` e ``metrics.rtt_seconds.observe(x)``).
+        ``labels`` identifica a ponta nas métricas exportadas (por exemplo o papel).
+    """
+
+    def __init__(self, labels=None, prefix='dccnet'):
+        self.labels = dict(labels or {})
+        self.prefix = prefix
+        self.started_at = time.time()
+
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        for name in GAUGES:
+            setattr(self, name, None)
+        for name in HISTOGRAMS:
+            setattr(self, name, Histogram())
+
+    def merge(self, other):
+        """ Acrescenta os contadores e histogramas de outras métricas (os medidores não são somados) """
+
+        for name in COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name in HISTOGRAMS:
+            getattr(self, name).merge(getattr(other, name))
+
+    def snapshot(self):
+        """ Retorna as métricas atuais em um dicionário """
+
+        return {
+            'timestamp': time.time(),
+            'uptime_seconds': time.time() - self.started_at,
+            'labels': self.labels,
+            'counters': {name: getattr(self, name) for name in COUNTERS},
+            'gauges': {name: getattr(self, name) for name in GAUGES},
+            'histograms': {name: getattr(self, name).to_dict() for name in HISTOGRAMS},
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self):
+        """ Retorna as métricas no formato texto do Prometheus """
+
+        def labels(extra=None):
+            items = dict(self.labels, **(extra or {}))
+            if not items:
+                return ''
+            return '{' + ','.join('{}="{}"'.format(key, value) for key, value in items.items()) + '}'
+
+        lines = []
+        for name, description in COUNTERS.items():
+            metric = '{}_{}_total'.format(self.prefix, name)
+            lines += ['# HELP {} {}'.format(metric, description), '# TYPE {} counter'.format(metric),
+                      '{}{} {}'.format(metric, labels(), getattr(self, name))]
+
+        for name, description in GAUGES.items():
+            if getattr(self, name) is None:
+                continue
+
+            metric = '{}_{}'.format(self.prefix, name)
+            lines += ['# HELP {} {}'.format(metric, description), '# TYPE {} gauge'.format(metric),
+                      '{}{} {}'.format(metric, labels(), getattr(self, name))]
+
+        for name, description in HISTOGRAMS.items():
+            histogram = getattr(self, name)
+            metric = '{}_{}'.format(self.prefix, name)
+            lines += ['# HELP {} {}'.format(metric, description), '# TYPE {} histogram'.format(metric)]
+
+            for bound, count in histogram.cumulative():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('{}_bucket{} {}'.format(metric, labels({'le': le}), count))
+
+            lines += ['{}_sum{} {}'.format(metric, labels(), histogram.sum),
+                      '{}_count{} {}'.format(metric, labels(), histogram.count)]
+
+        return '\n'.join(lines) + '\n'
+
+class MetricsDumper:
+    """
+        Escreve as métricas em ``path`` a cada ``interval`` segundos, em JSON (``format='json'``)
+        ou no formato do Prometheus (``format='prometheus'``), em uma thread própria
+        (``start``/``stop``) ou a partir de um event loop do asyncio (``schedule``).
+        ``collect`` é chamada antes de cada escrita e deve retornar o ``Metrics`` atualizado.
+    """
+
+    FORMATS = ('json', 'prometheus')
+
+    def __init__(self, collect, path, format='json', interval=constants.METRICS_INTERVAL):
+        if format not in self.FORMATS:
+            raise ValueError('formato de métricas desconhecido: {}'.format(format))
+
+        self.collect = collect
+        self.path = path
+        self.format = format
+        self.interval = interval
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """ Encerra a thread, escrevendo as métricas finais """
+
+        self.stopped.set()
+        self.thread.join()
+        self.dump()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.dump()
+
+    def schedule(self, loop):
+        """ Escreve as métricas periodicamente a partir de um event loop do asyncio (sem threads) """
+
+        def tick():
+            self.dump()
+            loop.call_later(self.interval, tick)
+
+        loop.call_later(self.interval, tick)
+
+    def dump(self):
+        metrics = self.collect()
+        text = metrics.to_json() if self.format == 'json' else metrics.to_prometheus()
+
+        # Escrevendo em um arquivo temporário e trocando de uma vez, para que quem lê
+        # o arquivo nunca veja uma escrita pela metade
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as outfile:
+            outfile.write(text)
+        os.replace(temporary, self.path)
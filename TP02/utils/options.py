@@ -0,0 +1,56 @@
+"""
+    Opções de comunicação negociadas no início da comunicação (quadros de HELLO).
+
+    A ponta ativa envia as opções que deseja usar e a ponta passiva responde com as
+    opções acordadas, considerando o que ela própria aceita. Qualquer opção ausente
+    assume o valor padrão, que corresponde ao protocolo original (pare-e-espere).
+
+    Opções:
+        window: tamanho da janela (Selective Repeat caso seja maior que 1)
+        piggyback: ACKs enviados de carona nos quadros de dados (ver utils/piggyback.py)
+        binary: quadros enviados sem a codificação base16 (ver utils/codec.py)
+        compression: método e nível da compressão dos quadros de dados (ver utils/compression.py)
+        fec: tamanho dos grupos de quadros protegidos por um quadro de paridade (ver utils/fec.py)
+        stripe: enlace e quantidade de enlaces de uma transferência dividida em vários
+                enlaces paralelos (ver utils/striping.py)
+        streams: vários arquivos enviados em streams lógicos no mesmo enlace (ver utils/streams.py)
+        resume: posições de onde cada ponta continua enviando, na retomada de uma
+                transferência interrompida (ver utils/checkpoint.py)
+"""
+
+from utils.compression import agree_compression
+from utils.fec import agree_fec
+from utils.striping import agree_stripe
+
+DEFAULT_OPTIONS = {'window': 1, 'piggyback': False, 'binary': False, 'compression': None, 'streams': False,
+                   'fec': None, 'stripe': None, 'resume': None}
+
+def agree_options(requested, accepted):
+    """
+        Retorna as opções acordadas a partir das opções pedidas pela ponta ativa
+        (``requested``) e das opções aceitas pela ponta passiva (``accepted``).
+        A resposta a um pedido de retomada depende dos checkpoints da ponta passiva
+        e é acrescentada por ela (ver ``resume_reply`` em utils/checkpoint.py), assim
+        como a posição do seu trecho em uma transferência dividida (utils/striping.py).
+    """
+
+    window = min(max(int(requested.get('window', 1)), 1), accepted['window'])
+
+    # Os ACKs de carona só fazem sentido com a janela deslizante
+    piggyback = bool(requested.get('piggyback', False) and accepted.get('piggyback', False) and window > 1)
+
+    binary = bool(requested.get('binary', False) and accepted.get('binary', False))
+    compression = agree_compression(requested.get('compression'), accepted.get('compression', ()))
+    streams = bool(requested.get('streams', False) and accepted.get('streams', False))
+    # Os streams não são divididos entre enlaces
+    stripe = None if streams else agree_stripe(requested.get('stripe'), accepted.get('stripes', 1))
+
+    fec = agree_fec(requested.get('fec'), accepted.get('fec', False), window)
+
+    return {'window': window, 'piggyback': piggyback, 'binary': binary, 'compression': compression, 'streams': streams,
+            'fec': fec, 'stripe': stripe}
+
+def complete_options(options):
+    """ Retorna as opções recebidas completadas com os valores padrão das opções ausentes """
+
+    return dict(DEFAULT_OPTIONS, **options)
@@ -0,0 +1,116 @@
+"""
+    ACKs de carona (piggybacking) e ACKs agrupados.
+
+    Quando a opção ``piggyback`` é negociada, os ACKs não são enviados assim que um
+    quadro de dados é aceito: eles esperam (no máximo ``ACK_DELAY`` segundos) pelo
+    próximo quadro de dados da ponta, que os leva de carona. Caso nenhum quadro seja
+    enviado a tempo, os ACKs pendentes são enviados juntos em um único quadro de ACK.
+
+    Um quadro com o bit ``FLAG_PIGGYBACK`` termina com um trecho de ACKs: os ids
+    confirmados (um byte cada) seguidos da quantidade de ids (um byte). O campo length
+    inclui esse trecho, e o checksum cobre o quadro inteiro.
+
+        DATA | PIGGYBACK: quadro de dados (id próprio) + trecho de ACKs
+        END  | PIGGYBACK: quadro de END (id próprio) + trecho de ACKs
+        ACK  | PIGGYBACK: confirma o id do cabeçalho e os ids do trecho de ACKs
+
+    O trecho fica no final do quadro para que os dados continuem alinhados: o quadro
+    de carona é obtido dos segmentos do quadro da ``FrameSource`` trocando apenas o
+    segmento do cabeçalho e acrescentando o segmento do trecho, com o checksum atualizado
+    de forma incremental (os dados não são copiados).
+    Com ``binary`` os quadros estão no formato binário da rede (ver utils/codec.py).
+"""
+
+from struct import pack, unpack
+
+from utils import constants
+from utils.checksum import append_checksum, update_checksum
+from utils.codec import wire_decoder, wire_encoder
+from utils.frame_source import build_frame
+
+# Espaço que os quadros de dados deixam livre para o trecho de ACKs
+TRAILER_RESERVE = constants.MAX_PIGGYBACK_ACKS + 1
+
+def attach_acks(segments, ids, binary=False):
+    """ Retorna os segmentos do quadro ``segments`` (cabeçalho, dados) com os ACKs ``ids`` de carona """
+
+    encode = wire_encoder(binary)
+    header = wire_decoder(binary)(segments[0])
+    length, chksum, id, flags = unpack('!HHBB', header[8:14])
+    trailer = bytes(ids) + bytes([len(ids)])
+
+    # Atualizando o checksum com os novos campos length e flags e com o trecho acrescentado
+    new_flags = flags | constants.FLAG_PIGGYBACK
+    chksum = update_checksum(chksum, length, length + len(trailer))
+    chksum = update_checksum(chksum, (id << 8) | flags, (id << 8) | new_flags)
+    chksum = append_checksum(chksum, 14 + length, trailer)
+
+    header = header[:8] + pack('!HHBB', length + len(trailer), chksum, id, new_flags)
+    return (encode(header),) + tuple(segments[1:]) + (encode(trailer),)
+
+def ack_frame(ids, binary=False):
+    """ Retorna o quadro codificado que confirma todos os ``ids`` """
+
+    encode = wire_encoder(binary)
+    if len(ids) == 1:
+        return encode(build_frame(ids[0], constants.FLAG_ACK))
+
+    return encode(build_frame(ids[0], constants.FLAG_ACK | constants.FLAG_PIGGYBACK,
+                              bytes(ids[1:]) + bytes([len(ids) - 1])))
+
+def split_acks(frame):
+    """
+        Separa um quadro recebido em (quadro sem o trecho de ACKs, ids confirmados).
+        Para um quadro de ACK (simples ou agrupado) o quadro retornado é None, e quadros
+        sem ACKs de carona são retornados sem alterações.
+    """
+
+    flags = frame[13]
+    if flags == constants.FLAG_ACK:
+        return None, [frame[12]]
+
+    if not flags & constants.FLAG_PIGGYBACK:
+        return frame, []
+
+    length = len(frame) - 14
+    n_ids = min(frame[-1], length - 1)
+    ids = list(frame[len(frame)-1-n_ids:len(frame)-1])
+
+    if flags & constants.FLAG_ACK:
+        return None, [frame[12]] + ids
+
+    return memoryview(frame)[:len(frame)-1-n_ids], ids
+
+class AckQueue:
+    """
+        ACKs esperando para pegar carona em um quadro de dados. O primeiro ACK pendente
+        define o instante (``deadline``) em que eles devem ser enviados sozinhos, e a
+        fila também é considerada vencida quando acumula ``limit`` ACKs.
+    """
+
+    def __init__(self, limit, delay=constants.ACK_DELAY):
+        self.limit = min(max(limit, 1), constants.MAX_PIGGYBACK_ACKS)
+        self.delay = delay
+
+        self.ids = []
+        self.deadline = None
+
+    def add(self, id, now):
+        # Um ACK repetido (de uma retransmissão) não precisa ser enviado duas vezes
+        if id in self.ids:
+            return
+
+        if not self.ids:
+            self.deadline = now + self.delay
+        self.ids.append(id)
+
+    def due(self, now):
+        """ Retorna se os ACKs pendentes devem ser enviados sem esperar um quadro de dados """
+
+        return len(self.ids) >= self.limit or (self.deadline is not None and now >= self.deadline)
+
+    def take(self):
+        """ Retorna (e remove da fila) os ACKs pendentes """
+
+        ids, self.ids, self.deadline = self.ids, [], None
+        return ids
@@ -0,0 +1,114 @@
+"""
+    Preparação dos quadros de envio em paralelo (opção ``workers``).
+
+    Construir um quadro de dados é trabalho só de CPU: recortar o trecho do arquivo,
+    comprimir (caso negociado), montar o cabeçalho, calcular o checksum e codificar em
+    base16. Sem o pipeline esse trabalho é feito sob demanda na própria thread que envia
+    e recebe os quadros (ver ``FrameSource.segments``).
+
+    Com ``workers`` processos, a ``FrameSource`` envia lotes de até ``batch`` quadros
+    consecutivos para um ``ProcessPoolExecutor`` e mantém no máximo ``depth`` lotes em
+    preparação à frente do quadro sendo enviado. Cada processo mapeia o arquivo de
+    entrada por conta própria, então apenas as posições dos trechos vão para os
+    processos, e voltam o cabeçalho e os dados prontos para a rede. No formato binário
+    sem compressão os dados não são copiados: os processos calculam apenas o checksum e
+    o quadro continua usando o trecho do arquivo mapeado na ponta.
+
+    Os trechos dos quadros são definidos quando o lote é enviado aos processos, então
+    com o tamanho adaptativo (ver utils/sizing.py) o tamanho escolhido chega aos
+    quadros com o atraso dos lotes em preparação.
+"""
+
+import mmap
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import constants
+from utils.codec import encode
+from utils.compression import compressor
+from utils.frame_source import build_header
+
+# Arquivos mapeados e funções de compressão de cada processo, reaproveitados entre os lotes
+_mapped = {}
+_compressors = {}
+
+def mapped_file(path):
+    """ Retorna uma memoryview do arquivo mapeado em memória (uma vez por processo) """
+
+    if path not in _mapped:
+        with open(path, 'rb') as infile:
+            _mapped[path] = memoryview(mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ))
+
+    return _mapped[path]
+
+def batch_compressor(options):
+    """ Retorna a função de compressão das opções acordadas (uma vez por processo) """
+
+    key = (options['method'], options['level'])
+    if key not in _compressors:
+        _compressors[key] = compressor(options)
+
+    return _compressors[key]
+
+def prepare_frame(data, id, begin, end, binary, compress, keep):
+    """
+        Prepara o quadro de dados do trecho [begin, end) do arquivo, retornando (flags,
+        cabeçalho, dados comprimidos, dados em base16, bytes antes e depois da compressão,
+        tempo de compressão). Os dados comprimidos só são retornados caso keep seja
+        verdadeiro, e os dados em base16 apenas fora do formato binário.
+    """
+
+    payload, flags = data[begin:end], constants.FLAG_DATA
+    compressed, seconds = None, 0.0
+
+    if compress is not None:
+        started = time.thread_time()
+        candidate = compress(payload)
+        seconds = time.thread_time() - started
+
+        if len(candidate) < len(payload):
+            payload, flags = candidate, constants.FLAG_DATA | constants.FLAG_COMPRESSED
+            compressed = candidate if keep else None
+
+    header = build_header(id, flags, payload)
+    if binary:
+        return flags, bytes(header), compressed, None, end - begin, len(payload), seconds
+
+    return flags, encode(header), compressed, encode(payload), end - begin, len(payload), seconds
+
+def prepare_batch(path, binary, compression, keep, frames):
+    """ Prepara um lote de quadros de dados, cada um dado por (id, início, fim) no arquivo ``path`` """
+
+    data = mapped_file(path)
+    compress = batch_compressor(compression) if compression is not None else None
+
+    return [prepare_frame(data, id, begin, end, binary, compress, keep) for id, begin, end in frames]
+
+class FramePipeline:
+    """
+        Processos que preparam os quadros de envio em lotes (ver o início do arquivo):
+        lotes de até ``batch`` quadros, com no máximo ``depth`` lotes em preparação
+        (por padrão dois por processo).
+    """
+
+    def __init__(self, workers, batch=constants.PIPELINE_BATCH, depth=None):
+        # Os processos não são criados com fork, já que a ponta pode ter outras threads
+        # (envio e recebimento no modo full-duplex, escrita das métricas)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+        self.workers = max(int(workers), 1)
+        self.executor = ProcessPoolExecutor(self.workers, mp_context=context)
+        self.batch = max(int(batch), 1)
+        self.depth = depth if depth is not None else 2 * self.workers
+
+    def submit(self, path, binary, compression, keep, frames):
+        """ Método que envia um lote de quadros aos processos, retornando o ``Future`` com o resultado """
+
+        return self.executor.submit(prepare_batch, path, binary, compression, keep, frames)
+
+    def close(self):
+        # Os lotes que ainda não começaram são cancelados e esperamos apenas os que estão
+        # em preparação (sem esperar, um processo que atende um enlace não termina)
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,382 @@
+import time
+import socket
+import select
+import binascii
+from struct import unpack
+
+from utils import constants
+from utils.checksum import verify_checksum
+from utils.codec import HEX_SYNC, HEX_SYNC_LOWER, decode, decode_verified
+
+# Tamanho do cabeçalho em binário e em base16
+HEADER_LENGTH = 14
+HEX_HEADER_LENGTH = 2 * HEADER_LENGTH
+
+# Valor retornado por ``FrameReceiver.poll`` quando o quadro atual é inválido
+INVALID = object()
+
+# Valor retornado por ``FrameReceiver.examine`` quando o cabeçalho do quadro é rejeitado
+INVALID_HEADER = object()
+
+def valid_header(header, id_space, piggyback=False, compression=False, streams=False, fec=False):
+    """
+        Função para verificar se os campos de um cabeçalho recebido são válidos.
+        Com ``piggyback`` também são aceitos os quadros com ACKs de carona, com
+        ``compression`` os quadros de dados comprimidos, com ``streams`` os quadros
+        de dados de um stream e com ``fec`` os quadros de paridade.
+    """
+
+    # Caso o campo id não pertença ao espaço de identificadores teremos um erro
+    # (no modo pare-e-espere o id deve ser 0 ou 1)
+    if header[4] >= id_space:
+        return False
+
+    # Quadros de paridade possuem pelo menos o prefixo com o grupo e o campo length e flags de um bloco
+    if fec and header[5] == constants.FLAG_PARITY:
+        return header[2] >= constants.FEC_RESERVE
+
+    # Quadros de streams são quadros de dados (talvez comprimidos ou com ACKs de carona)
+    # com pelo menos o prefixo que identifica o stream
+    if streams and header[5] & constants.FLAG_STREAM:
+        flags = header[5] & ~constants.FLAG_STREAM
+        if compression:
+            flags &= ~constants.FLAG_COMPRESSED
+        if piggyback:
+            flags &= ~constants.FLAG_PIGGYBACK
+        return flags == constants.FLAG_DATA and header[2] >= constants.STREAM_PREFIX_LENGTH
+
+    # Apenas quadros de dados (com ou sem ACKs de carona) podem estar comprimidos
+    if compression and header[5] & constants.FLAG_COMPRESSED:
+        flags = header[5] & ~constants.FLAG_COMPRESSED
+        if flags == constants.FLAG_DATA or (piggyback and flags == constants.FLAG_DATA | constants.FLAG_PIGGYBACK):
+            return header[2] > 0
+        return False
+
+    # Quadros com ACKs de carona possuem pelo menos o byte com a quantidade de ACKs
+    if piggyback and header[5] & constants.FLAG_PIGGYBACK:
+        flags = header[5] & ~constants.FLAG_PIGGYBACK
+        return flags in (constants.FLAG_DATA, constants.FLAG_END, constants.FLAG_ACK) and header[2] > 0
+
+    # Caso o campo flag não seja 0x00, 0x20, 0x40 ou 0x80 teremos um erro
+    if header[5] not in (constants.FLAG_DATA, constants.FLAG_HELLO, constants.FLAG_END, constants.FLAG_ACK):
+        return False
+
+    # Caso o campo length seja diferente de 0 mas temos um ACK ou END
+    # significa que recebemos um quadro errado!
+    if header[2] != 0 and (header[5] == constants.FLAG_ACK or header[5] == constants.FLAG_END):
+        return False
+
+    # Caso o campo length seja 0 mas não temos um ACK ou END
+    # significa que recebemos um quadro errado!
+    if header[2] == 0 and (header[5] != constants.FLAG_END and header[5] != constants.FLAG_ACK):
+        return False
+
+    return True
+
+class FrameReceiver:
+    """
+        Buffer de recebimento que procura quadros no fluxo vindo da outra ponta.
+
+        Os bytes são lidos com ``recv_into`` diretamente em um bytearray pré-alocado,
+        e os dados válidos ficam entre as posições ``start`` e ``end``. Quando o espaço
+        livre no final acaba, os bytes restantes (no máximo um quadro) são movidos para o
+        começo do buffer, de forma que nenhum byte é copiado mais de uma vez.
+
+        A sequência de sincronização é procurada com ``find`` em qualquer posição do
+        buffer. Bytes que sobram após um quadro são mantidos para o próximo quadro e,
+        caso o tempo de espera acabe no meio de um quadro, a parte já recebida também
+        é mantida. Os quadros são decodificados a partir de memoryviews do buffer.
+
+        O campo length só é protegido pelo checksum quando o quadro inteiro chega, então
+        um length corrompido para mais faria o buffer esperar até 64 KiB de bytes seguintes
+        (em base16, o dobro). O quadro que está chegando é descartado assim que um quadro
+        completo e com o checksum correto começa depois da sua sincronização (por exemplo
+        a sua retransmissão), ou quando nenhum byte chega por ``TIMEOUT`` segundos.
+
+        O formato de cada quadro (base16 ou binário, ver utils/codec.py) é identificado
+        pela sincronização em que ele começa, então os dois formatos podem se misturar no
+        fluxo (por exemplo um HELLO em base16 retransmitido depois da troca para binário).
+    """
+
+    def __init__(self, capacity=constants.RECV_BUFFER_SIZE):
+        # O buffer precisa comportar pelo menos o maior quadro possível
+        capacity = max(capacity, 2 * (HEX_HEADER_LENGTH + 2 * constants.MAX_LENGTH))
+
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+        # Até onde (a partir de start) o restante do buffer já foi examinado procurando um
+        # quadro completo depois do quadro que está chegando, se há um quadro chegando e o
+        # instante em que chegaram os últimos bytes
+        self.scan_offset = 0
+        self.pending = False
+        self.received_at = time.monotonic()
+
+        # Quantidade de bytes descartados procurando a sincronização e de
+        # quadros descartados por cabeçalho inválido e por checksum incorreto
+        self.skipped_bytes = 0
+        self.invalid_headers = 0
+        self.checksum_failures = 0
+
+        # Grafias da sincronização (base16 maiúsculo e minúsculo e binário), começando pela
+        # última encontrada
+        self.sync_patterns = [HEX_SYNC, HEX_SYNC_LOWER, constants.SYNC_BYTES]
+
+    def __len__(self):
+        return self.end - self.start
+
+    def fill(self, sock, deadline):
+        """
+            Método para ler mais dados do socket, esperando até o instante ``deadline``.
+            Pode gerar as exceções ``socket.timeout`` e ``RuntimeError`` (conexão encerrada).
+            Caso o tempo acabe, o quadro que está chegando pode ser descartado (ver ``expire``).
+        """
+
+        ready = select.select([sock], [], [], max(deadline - time.monotonic(), 0))
+        if not ready[0]:
+            self.expire(time.monotonic())
+            raise socket.timeout()
+
+        # Movendo os dados restantes para o começo do buffer caso não haja espaço no final
+        if self.end == len(self.buffer):
+            self.compact()
+
+        n_bytes = sock.recv_into(self.view[self.end:])
+        if n_bytes == 0:
+            raise RuntimeError()
+
+        self.end += n_bytes
+        self.received_at = time.monotonic()
+
+    def expire(self, now):
+        """
+            Método chamado quando a espera por mais dados acaba sem que nada chegue: caso um
+            quadro tenha começado a chegar e nenhum byte tenha chegado há ``TIMEOUT``
+            segundos, o seu length pode estar corrompido e o quadro é descartado.
+        """
+
+        if self.pending and now - self.received_at >= constants.TIMEOUT:
+            self.invalid_headers += 1
+            self.discard_sync()
+
+    def compact(self):
+        """ Método para mover os dados ainda não consumidos para o começo do buffer """
+
+        length = self.end - self.start
+        self.view[:length] = self.view[self.start:self.end]
+        self.start, self.end = 0, length
+
+    def skip(self, n_bytes):
+        """ Método para descartar os n_bytes iniciais do buffer """
+
+        if n_bytes == 0:
+            return
+
+        self.start += n_bytes
+        self.skipped_bytes += n_bytes
+        self.scan_offset = 0
+        self.pending = False
+
+        # Buffer vazio: podemos voltar a escrever no começo sem copiar nada
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def feed(self, data):
+        """
+            Método para acrescentarmos ao buffer dados que já foram lidos por outro meio
+            (por exemplo, entregues por um transporte do asyncio).
+        """
+
+        view = memoryview(data)
+        while len(view) > 0:
+            if self.end == len(self.buffer):
+                self.compact()
+
+            # Caso o buffer esteja cheio, os bytes mais antigos não formam um quadro
+            # completo e podem ser descartados
+            if self.end == len(self.buffer):
+                self.skip(min(len(view), len(self)))
+                self.compact()
+
+            n_bytes = min(len(view), len(self.buffer) - self.end)
+            self.view[self.end:self.end+n_bytes] = view[:n_bytes]
+            self.end += n_bytes
+            view = view[n_bytes:]
+
+        self.received_at = time.monotonic()
+
+    def find_sync(self):
+        """
+            Método que retorna a posição da próxima sincronização no buffer (ou -1) e se ela
+            está em binário. A sincronização pode estar em base16 maiúsculo, minúsculo ou em
+            binário; a grafia encontrada por último é procurada primeiro.
+        """
+
+        pos, found = -1, 0
+        for i, pattern in enumerate(self.sync_patterns):
+            # As demais grafias só são procuradas antes da sincronização já encontrada
+            other = self.buffer.find(pattern, self.start, self.end if pos == -1 else pos)
+            if other != -1:
+                pos, found = other, i
+
+        if found != 0:
+            self.sync_patterns.insert(0, self.sync_patterns.pop(found))
+
+        return pos, self.sync_patterns[0] == constants.SYNC_BYTES
+
+    def next_sync(self, begin):
+        """ Método que retorna a posição da primeira sincronização a partir de begin (ou -1) e se ela está em binário """
+
+        pos, binary = -1, False
+        for pattern in self.sync_patterns:
+            other = self.buffer.find(pattern, begin, self.end if pos == -1 else min(pos + len(pattern), self.end))
+            if other != -1 and (pos == -1 or other < pos):
+                pos, binary = other, pattern == constants.SYNC_BYTES
+
+        return pos, binary
+
+    def examine(self, pos, binary, valid_header):
+        """
+            Método que examina o quadro que começa na sincronização da posição pos, retornando
+            (quadro, tamanho do quadro no buffer). O quadro é o quadro decodificado, None caso
+            ele ainda não tenha chegado por completo, ``INVALID_HEADER`` caso o cabeçalho seja
+            rejeitado por ``valid_header`` (ou tenha um dígito base16 inválido) e ``INVALID``
+            caso os dados tenham um dígito inválido ou o checksum esteja incorreto. O tamanho
+            é 0 enquanto o cabeçalho não chegar.
+        """
+
+        # Em base16 cada byte do quadro ocupa dois bytes no buffer
+        scale = 1 if binary else 2
+        if self.end - pos < scale * HEADER_LENGTH:
+            return None, 0
+
+        header_view = self.view[pos:pos+scale*HEADER_LENGTH]
+        try:
+            header = unpack(constants.HEADER_FORMAT, header_view if binary else decode(header_view))
+        except binascii.Error:
+            header = None
+
+        if header is None or not valid_header(header):
+            return INVALID_HEADER, 0
+
+        frame_length = scale * (HEADER_LENGTH + header[2])
+        if self.end - pos < frame_length:
+            return None, frame_length
+
+        # Decodificando e verificando o checksum do quadro diretamente do buffer
+        frame_view = self.view[pos:pos+frame_length]
+        try:
+            if binary:
+                frame = bytes(frame_view) if verify_checksum(frame_view) else None
+            else:
+                frame = decode_verified(frame_view)
+        except binascii.Error:
+            frame = None
+
+        return (frame if frame is not None else INVALID), frame_length
+
+    def later_frame(self, valid_header):
+        """
+            Método que retorna se um quadro completo e com o checksum correto começa depois
+            da sincronização atual (ver o início da classe). A busca continua de onde parou
+            na chamada anterior: a partir do primeiro quadro que ainda estava chegando, ou do
+            final do buffer.
+        """
+
+        pos, resume = self.start + max(self.scan_offset, 1), None
+        while True:
+            pos, binary = self.next_sync(pos)
+            if pos == -1:
+                break
+
+            frame, frame_length = self.examine(pos, binary, valid_header)
+            if frame is None and resume is None:
+                resume = pos
+            elif frame is not None and frame is not INVALID and frame is not INVALID_HEADER:
+                return True
+
+            pos += 1
+
+        if resume is None:
+            resume = max(self.end - len(HEX_SYNC) + 1, self.start + 1)
+        self.scan_offset = resume - self.start
+
+        return False
+
+    def poll(self, valid_header):
+        """
+            Método que tenta extrair o próximo quadro dos dados que já estão no buffer,
+            sem ler nada do socket. Retornamos o quadro (decodificado), ``INVALID`` caso o
+            quadro que começa na sincronização atual seja inválido (cabeçalho rejeitado por
+            ``valid_header``, dígito base16 inválido, checksum incorreto ou um quadro íntegro
+            depois dele, ver o início da classe) ou None caso ainda não tenhamos recebido o
+            quadro completo.
+        """
+
+        # Procurando a sincronização em qualquer posição do buffer. Caso ela não seja
+        # encontrada mantemos apenas o final do buffer, que pode ser o começo dela
+        pos, binary = self.find_sync()
+        if pos == -1:
+            self.skip(max(len(self) - len(HEX_SYNC) + 1, 0))
+            return None
+
+        self.skip(pos - self.start)
+        frame, frame_length = self.examine(self.start, binary, valid_header)
+
+        if frame is INVALID_HEADER:
+            self.invalid_headers += 1
+            self.discard_sync()
+            return INVALID
+
+        if frame is INVALID:
+            self.checksum_failures += 1
+            self.discard_sync()
+            return INVALID
+
+        # O quadro ainda está chegando, a não ser que o seu length esteja corrompido
+        if frame is None:
+            self.pending = frame_length > 0
+            if self.pending and self.later_frame(valid_header):
+                self.invalid_headers += 1
+                self.discard_sync()
+                return INVALID
+            return None
+
+        self.consume(frame_length)
+        return frame
+
+    def receive(self, sock, deadline, valid_header):
+        """
+            Método que retorna o próximo quadro recebido do socket (ou None caso ele seja
+            inválido), esperando no máximo até o instante ``deadline``. Caso o tempo acabe,
+            a parte do quadro que já chegou continua no buffer.
+        """
+
+        while True:
+            frame = self.poll(valid_header)
+            if frame is INVALID:
+                return None
+            if frame is not None:
+                return frame
+
+            self.fill(sock, deadline)
+
+    def consume(self, n_bytes):
+        """ Método para remover do buffer os n_bytes de um quadro válido que já foi lido """
+
+        self.start += n_bytes
+        self.scan_offset = 0
+        self.pending = False
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def discard_sync(self):
+        """
+            Método chamado quando o quadro que começa na sincronização atual é inválido.
+            Descartamos apenas o primeiro byte, de forma que a próxima busca encontre a
+            sincronização seguinte, mesmo que ela esteja dentro do quadro inválido.
+        """
+
+        self.skip(1)
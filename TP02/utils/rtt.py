@@ -0,0 +1,56 @@
+from collections import deque
+
+from utils import constants
+
+class RttEstimator:
+    """
+        Estimador do tempo de ida e volta (RTT) e do tempo de retransmissão (RTO),
+        seguindo a RFC 6298:
+
+            RTTVAR <- (1 - beta) * RTTVAR + beta * |SRTT - R|
+            SRTT   <- (1 - alpha) * SRTT + alpha * R
+            RTO    <- SRTT + max(G, K * RTTVAR)
+
+        A cada timeout o RTO é dobrado (backoff exponencial). Pela regra de Karn, quem
+        usa o estimador não deve fornecer amostras de quadros retransmitidos, já que
+        não sabemos a qual transmissão o ACK corresponde.
+    """
+
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self, initial_rto=constants.TIMEOUT, min_rto=constants.MIN_RTO,
+                 max_rto=constants.MAX_RTO, history=constants.RTT_HISTORY):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+
+        # Últimas amostras de RTT (em segundos), para inspeção
+        self.samples = deque(maxlen=history)
+
+    def sample(self, rtt):
+        """ Método para atualizar as estimativas com uma nova amostra de RTT """
+
+        self.samples.append(rtt)
+
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+
+        # Uma amostra nova também desfaz o backoff de timeouts anteriores
+        self.rto = self.clamp(self.srtt + self.K * self.rttvar)
+
+    def backoff(self):
+        """ Método chamado a cada timeout, dobrando o RTO """
+
+        self.rto = self.clamp(2 * self.rto)
+
+    def clamp(self, rto):
+        return min(max(rto, self.min_rto), self.max_rto)
@@ -1,126 +1,148 @@
+import json
 import socket
+import multiprocessing
 from struct import unpack
 
 from utils import constants
 from utils.base import BaseNode
+from utils.checkpoint import resume_reply
+from utils.compression import accepted_methods
+from utils.options import agree_options
+from utils.striping import peer_offset, stripe_range, wait_count
 
 class Server(BaseNode):
     """ Classe para modelar a ponta passiva da comunicação. """
 
-    def __init__(self, host, input_file, output_file):
-        super().__init__(input_file, output_file)
+    def __init__(self, host, input_file, output_file, **options):
+        # Por padrão a ponta passiva aceita qualquer janela pedida pela ponta ativa
+        # (e os ACKs de carona, o formato binário, qualquer compressão suportada, os streams e a FEC, caso pedidos)
+        options.setdefault('window', constants.MAX_WINDOW)
+        options.setdefault('piggyback', True)
+        options.setdefault('binary', True)
+        options.setdefault('streams', True)
+        options.setdefault('fec', True)
+        super().__init__(input_file, output_file, **options)
+        self.metrics.labels['role'] = 'server'
+
+        # Opções usadas para criar as pontas que atendem os enlaces de uma transferência dividida
+        self.node_options = options
+
+        # Opções acordadas no primeiro HELLO, repetidas nas respostas às suas retransmissões
+        self.agreed_options = None
+
+        # Criando o socket do servidor (ponta passiva). Sem host a ponta atende uma
+        # conexão já aceita (um enlace de uma transferência dividida, ver ``serve``)
+        if host is not None:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind(('', int(host)))
+            self.socket.listen()
+
+    def accept_options(self, conn):
+        """
+            Método para esperar o primeiro quadro da ponta ativa. Caso ele seja um HELLO
+            respondemos com as opções acordadas, caso contrário a ponta ativa não negocia
+            opções e o quadro será processado normalmente no modo pare-e-espere.
+        """
+
+        frame = None
+        while frame is None:
+            try:
+                frame = self.search_frame(conn, constants.TIMEOUT)
+            except socket.timeout:
+                continue
 
-        # Criando o socket do servidor (ponta passiva)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.socket.bind(('', int(host)))
-        self.socket.listen()
+        header = unpack(constants.HEADER_FORMAT, frame[:14])
+        if header[5] == constants.FLAG_HELLO:
+            self.handle_hello(conn, frame)
+        else:
+            self.pending_frames.append(frame)
+
+    def handle_hello(self, sock, frame):
+        """ Método para responder um HELLO com as opções acordadas """
+
+        # O HELLO pode ser uma retransmissão, então só acordamos (e aplicamos) as opções uma
+        # vez. Isso também é necessário na retomada, já que o checkpoint muda durante a comunicação
+        if self.agreed_options is None:
+            requested = json.loads(frame[14:])
+            options = agree_options(requested, {'window': self.window, 'piggyback': self.piggyback, 'binary': self.binary,
+                                                'compression': accepted_methods(self.compression),
+                                                'streams': self.streams, 'stripes': self.stripes, 'fec': bool(self.fec)})
+
+            # A posição do nosso trecho depende do tamanho da entrada, então é acrescentada aqui
+            if options['stripe']:
+                stripe = options['stripe']
+                stripe['offset'] = stripe_range(self.send_frames.size, stripe['index'], stripe['count'])[0]
+
+            if self.resume and isinstance(requested.get('resume'), dict):
+                options['resume'] = resume_reply(requested['resume'], self.input_file, self.output_file)
+
+            self.apply_options(options)
+            if options.get('resume'):
+                resume = options['resume']
+                self.apply_resume(resume['passive_offset'], resume['active_offset'], requested['resume'].get('source'))
+            if options['stripe']:
+                self.apply_stripe(options['stripe']['index'], options['stripe']['count'], peer_offset(requested['stripe']))
+
+            self.agreed_options = options
+
+        self.send_hello_frame(sock, self.agreed_options)
+
+    def serve(self, conn, results=None):
+        """
+            Método para atender uma conexão já aceita. Em uma transferência dividida, a
+            quantidade de enlaces acordada é informada na fila ``results`` (caso dada).
+        """
+
+        try:
+            self.accept_options(conn)
+        except RuntimeError:
+            return
+        finally:
+            if results is not None:
+                results.put(self.stripe[1] if self.stripe else 1)
+
+        self.transfer(conn)
 
     def run(self):
-        # print('Devemos enviar {} quadros'.format(len(self.send_frames)))
+        if self.stripes > 1:
+            self.run_striped()
+            return
 
         conn, addr = self.socket.accept()
-        # print('connected by:', addr)
+        self.serve(conn)
 
-        # Laço para enviarmos e receber alguns dados da outra ponta
-        while True:
-            # Enviando o quadro de dados atual
-            # print('enviando quadro', self.send_idx)
-            self.send_data_frame(conn)
+    def run_striped(self):
+        """
+            Método para atender uma transferência que pode ser dividida em até ``stripes``
+            enlaces: cada conexão é atendida por um processo próprio e, após a negociação
+            do primeiro enlace, aceitamos as conexões dos demais.
+        """
 
-            # Recebendo algo da outra ponta
-            try:
-                frame = self.search_frame(conn, self.last_chksum, self.last_id)
-            except socket.timeout:
-                # print('timeout!')
-                continue
-            except RuntimeError:
-                # print('erro na conexão, encerrando...')
-                self.close_node = True
-                break
+        # Os enlaces escrevem os seus trechos no mesmo arquivo de saída, sem truncá-lo
+        open(self.output_file, 'wb').close()
 
-            # Verificando se conseguimos encontrar um quadro válido
-            if frame is None:
-                continue
+        results = multiprocessing.Queue()
+        conn, addr = self.socket.accept()
+        workers = [self.start_worker(conn, results)]
 
-            # Extraíndo o cabeçalho do quadro recebido
-            header = unpack(constants.HEADER_FORMAT, frame[:14])
-            # print('recebi quadro com header:', header)
-
-            # Verificando se recebemos um quadro de confirmação
-            if header[5] == 0x80 and (self.send_idx % 2) == header[4]:
-                # print('recebi um ACK do quadro {}, mandando próximo quadro'.format(self.send_idx))
-                
-                # Se estamos no último quadro (END) não iremos mais mandar dados
-                self.send_idx += 1
-                if self.send_idx == len(self.send_frames):
-                    # print('recebi meu ACK do END')
-                    break
-
-            # Verificando se recebemos um quadro duplicado
-            elif header[3] == self.last_chksum and header[4] == self.last_id:
-                # print('recebemos um quadro duplicado! enviando ack')
-                self.send_ack_frame(conn, self.last_id)
-
-            # Se nenhuma condição for satisfeita, então teremos um quadro com dados!
-            else:
-                # Caso o id seja igual (i.e quadro repetido) mas com checksum diferente
-                # significa que recebemos um quadro com algum erro!
-                if header[3] != self.last_chksum and header[4] == self.last_id:
-                    continue
-
-                # Iremos salvar o quadro e enviar um quadro de confirmação
-                self.last_chksum, self.last_id = header[3], header[4]
-                self.recv_frames.append(frame)
-
-                # print('recebi dado... enviando ack!')
-                self.send_ack_frame(conn, header[4])
-
-        # print('todos os dados de entrada foram enviados')
-
-        # Executando loop para verificar se precisamos receber mais alguma coisa
-        while not self.close_node:
-            try:
-                frame = self.search_frame(conn, self.last_chksum, self.last_id)
-            except socket.timeout:
-                # print('timeout, posso finalizar!')
-                self.close_node = True
-                continue
-            except RuntimeError:
-                # print('erro na conexão, encerrando...')
-                break
+        for _ in range(wait_count(results, workers[0]) - 1):
+            conn, addr = self.socket.accept()
+            workers.append(self.start_worker(conn))
 
-            # Verificando se conseguimos encontrar um quadro válido
-            if frame is None:
-                continue
+        for worker in workers:
+            worker.join()
 
-            # Extraíndo o cabeçalho do quadro recebido
-            header = unpack(constants.HEADER_FORMAT, frame[:14])
+    def start_worker(self, conn, results=None):
+        """ Método para atender uma conexão em um processo próprio """
 
-            # Caso recebermos um quadro de ACK podemos desconsiderar
-            # uma vez que já enviamos todos os dados necessários.
-            if header[5] == 0x80:
-                continue
+        worker = multiprocessing.Process(target=serve_stripe,
+                                         args=(conn, self.input_file, self.output_file, self.node_options, results))
+        worker.start()
+        conn.close()
+
+        return worker
+
+def serve_stripe(conn, input_file, output_file, options, results=None):
+    """ Função executada pelo processo que atende cada enlace de uma transferência dividida """
 
-            # Verificando se recebemos um quadro duplicado
-            if header[3] == self.last_chksum and header[4] == self.last_id:
-                # print('recebemos um quadro duplicado!')
-                self.send_ack_frame(conn, self.last_id)
-
-            # Se nenhuma condição for satisfeita, então teremos um quadro com dados!
-            # Iremos salvar o quadro e enviar um quadro de confirmação
-            else:
-                # Caso o id seja igual (i.e quadro repetido) mas com checksum diferente
-                # significa que recebemos um quadro com algum erro!
-                if header[3] != self.last_chksum and header[4] == self.last_id:
-                    continue
-
-                self.last_chksum, self.last_id = header[3], header[4]
-                self.recv_frames.append(frame)
-
-                # print('enviando ack!')
-                self.send_ack_frame(conn, header[4])
-
-        # Escrevendo os dados recebidos pela outra ponta e encerrando
-        with open(self.output_file, 'wb') as outfile:
-            data = b''.join([frame[14:] for frame in self.recv_frames])
-            outfile.write(data)
\ No newline at end of file
+    Server(None, input_file, output_file, **options).serve(conn, results)
@@ -0,0 +1,78 @@
+import os
+
+class OutputSink:
+    """
+        Destino dos dados recebidos da outra ponta.
+
+        Cada payload aceito é escrito diretamente no arquivo de saída, de forma que a
+        memória usada não depende do tamanho do arquivo recebido e os dados já
+        confirmados não são perdidos caso o processo termine no meio da comunicação.
+
+        A política de escrita é configurável: ``flush_bytes`` define a cada quantos bytes
+        o buffer do arquivo é enviado ao sistema operacional (0 para todo quadro) e
+        ``fsync`` define se, nesse momento, também forçamos a escrita no disco.
+
+        Na retomada de uma transferência (ver utils/checkpoint.py) os ``offset`` bytes
+        iniciais do arquivo já existente são mantidos e a escrita continua depois deles.
+        Com um ``checkpoint``, a posição escrita é registrada a cada descarga.
+
+        Sem ``truncate`` a escrita é posicional: o arquivo (criado caso não exista) não é
+        truncado e os dados são escritos a partir de ``offset``, então vários processos
+        podem escrever trechos diferentes do mesmo arquivo (ver utils/striping.py).
+    """
+
+    def __init__(self, output_file, flush_bytes=2**20, fsync=False, offset=0, checkpoint=None, truncate=True):
+        if not truncate:
+            self.file = os.fdopen(os.open(output_file, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+            self.file.seek(offset)
+        elif offset > 0:
+            self.file = open(output_file, 'r+b')
+            self.file.truncate(offset)
+            self.file.seek(offset)
+        else:
+            self.file = open(output_file, 'wb')
+
+        self.flush_bytes = flush_bytes
+        self.fsync = fsync
+        self.offset = offset
+        self.checkpoint = checkpoint
+
+        self.bytes_written = 0
+        self.pending_bytes = 0
+
+        # Registrando desde já de onde a escrita continua (substituindo um checkpoint antigo)
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.offset)
+
+    def write(self, payload):
+        """ Método para escrever os dados de um quadro no arquivo de saída """
+
+        if len(payload) == 0:
+            return
+
+        self.file.write(payload)
+        self.bytes_written += len(payload)
+        self.pending_bytes += len(payload)
+
+        if self.pending_bytes >= self.flush_bytes:
+            self.flush()
+
+    def flush(self):
+        """ Método para enviar ao sistema operacional (e ao disco, caso pedido) os dados escritos """
+
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+        # O checkpoint é atualizado depois dos dados, então nunca indica bytes não escritos
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.offset + self.bytes_written)
+
+        self.pending_bytes = 0
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        self.flush()
+        self.file.close()
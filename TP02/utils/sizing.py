@@ -0,0 +1,47 @@
+from utils import constants
+
+class FrameSizer:
+    """
+        Escolha adaptativa do tamanho dos dados de cada quadro.
+
+        Em um enlace com erros, um único dígito trocado faz o quadro inteiro ser
+        retransmitido, então quadros menores desperdiçam menos banda. Em um enlace limpo,
+        quadros maiores amortizam melhor o cabeçalho e o ACK de cada quadro.
+
+        O tamanho é reduzido à metade a cada sinal de erro (timeout ou quadro inválido
+        recebido) e dobrado após ``grow_after`` ACKs seguidos de quadros que não foram
+        retransmitidos, sempre entre ``min_length`` e ``max_length``. Como apenas a ponta
+        que envia escolhe o tamanho (o campo length já descreve cada quadro), a outra
+        ponta não precisa negociar nada.
+    """
+
+    def __init__(self, min_length=constants.MIN_FRAME_LENGTH, max_length=constants.MAX_LENGTH,
+                 grow_after=constants.FRAME_GROW_AFTER):
+        self.min_length = max(min(int(min_length), constants.MAX_LENGTH), 1)
+        self.max_length = min(max(int(max_length), self.min_length), constants.MAX_LENGTH)
+        self.grow_after = grow_after
+
+        # Começamos com quadros grandes, que são os melhores em um enlace limpo
+        self.length = self.max_length
+        self.clean_acks = 0
+
+        # Quantas vezes o tamanho foi reduzido e aumentado
+        self.shrinks = 0
+        self.grows = 0
+
+    def shrink(self):
+        """ Método chamado a cada sinal de erro no enlace """
+
+        self.clean_acks = 0
+        if self.length > self.min_length:
+            self.length = max(self.length // 2, self.min_length)
+            self.shrinks += 1
+
+    def success(self):
+        """ Método chamado a cada ACK de um quadro que não foi retransmitido """
+
+        self.clean_acks += 1
+        if self.clean_acks >= self.grow_after and self.length < self.max_length:
+            self.length = min(self.length * 2, self.max_length)
+            self.clean_acks = 0
+            self.grows += 1
@@ -0,0 +1,295 @@
+"""
+    Streams: vários arquivos enviados no mesmo enlace DCCNET (opção ``streams``).
+
+    Com a opção negociada, cada ponta envia todos os arquivos da sua entrada (um diretório,
+    ou um único arquivo) como streams lógicos. Os quadros de um stream são quadros de
+    dados com o bit ``FLAG_STREAM`` e cujos dados começam com o prefixo ``STREAM_FORMAT``
+    (id do stream, tipo do quadro):
+
+        OPEN:  abre o stream, com o nome (relativo) e o tamanho do arquivo em JSON
+        DATA:  um trecho do arquivo (que pode estar comprimido, sem o prefixo)
+        CLOSE: o arquivo terminou
+
+    Até ``MAX_OPEN_STREAMS`` arquivos são enviados ao mesmo tempo, com os quadros de
+    dados intercalados entre eles (um de cada vez), de forma que um arquivo grande não
+    atrasa os pequenos. Os quadros continuam numerados em uma única sequência (a janela,
+    os ACKs e as retransmissões não mudam), então os quadros de cada stream são entregues
+    em ordem e quem recebe apenas direciona cada um para o arquivo do seu stream, dentro
+    do diretório de saída.
+"""
+
+import os
+import json
+import mmap
+from struct import pack, unpack_from
+
+from utils import constants
+from utils.frame_source import FrameSource, map_file
+from utils.sink import OutputSink
+
+# Tipos dos quadros de um stream
+STREAM_DATA, STREAM_OPEN, STREAM_CLOSE = range(3)
+
+# Os ids dos streams são reutilizados depois de 2**16 arquivos (o stream anterior com
+# o mesmo id já foi fechado, já que os quadros são entregues em ordem)
+STREAM_ID_SPACE = 2**16
+
+def list_stream_files(input_path):
+    """
+        Retorna a lista de (nome, caminho) dos arquivos a serem enviados: todos os arquivos
+        de um diretório (com os nomes relativos a ele, separados por '/'), ou o próprio arquivo.
+    """
+
+    if not os.path.isdir(input_path):
+        return [(os.path.basename(input_path), input_path)]
+
+    files = []
+    for root, dirs, names in os.walk(input_path):
+        dirs.sort()
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            files.append((os.path.relpath(path, input_path).replace(os.sep, '/'), path))
+
+    return files
+
+def split_stream(payload):
+    """ Separa os dados de um quadro de stream em (id do stream, tipo do quadro, restante dos dados) """
+
+    stream, kind = unpack_from(constants.STREAM_FORMAT, payload)
+    return stream, kind, payload[constants.STREAM_PREFIX_LENGTH:]
+
+def safe_path(name):
+    """ Retorna o caminho relativo de um nome recebido, ou None caso ele saia do diretório de saída """
+
+    parts = [part for part in str(name).replace('\\', '/').split('/') if part not in ('', '.')]
+    if not parts or '..' in parts:
+        return None
+
+    return os.path.join(*parts)
+
+class OutgoingStream:
+    """ Um arquivo sendo enviado: o arquivo mapeado em memória e até onde ele já foi dividido em quadros """
+
+    def __init__(self, id, name, path):
+        self.id = id
+        self.name = name
+        self.size, self.mmap, self.data = map_file(path)
+
+        self.offset = 0
+        self.released_offset = 0
+
+    def release(self, offset):
+        """ Avisa o sistema que as páginas anteriores a offset não serão mais lidas """
+
+        offset -= offset % mmap.PAGESIZE
+        if self.mmap is not None and hasattr(mmap, 'MADV_DONTNEED') and offset > self.released_offset:
+            self.mmap.madvise(mmap.MADV_DONTNEED, self.released_offset, offset - self.released_offset)
+            self.released_offset = offset
+
+    def close(self):
+        self.data.release()
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError:
+                # Algum segmento ainda está em uso; o mapeamento é desfeito quando ele for liberado
+                pass
+
+class StreamSource(FrameSource):
+    """
+        Fonte de quadros de envio com os arquivos da entrada ``input_path`` em streams
+        (ver o início do arquivo). Assim como na ``FrameSource``, os quadros são definidos
+        sob demanda e ``len(source)`` é uma estimativa até que todos os arquivos tenham
+        sido divididos. Não há suporte à retomada (``seek``).
+    """
+
+    def __init__(self, input_path, max_length=constants.MAX_LENGTH, lookahead=4, id_space=2, sizer=None,
+                 max_open=constants.MAX_OPEN_STREAMS):
+        self.max_open = max_open
+
+        # Arquivos que ainda não foram abertos e streams abertos (na ordem em que se intercalam)
+        self.pending = [(name, path, os.path.getsize(path)) for name, path in reversed(list_stream_files(input_path))]
+        self.active = []
+        self.turn = 0
+        self.n_opened = 0
+
+        super().__init__(input_path, max_length, lookahead, id_space, sizer)
+
+        # Bytes e quadros de controle (OPEN e CLOSE) que ainda não foram definidos
+        self.remaining_bytes = self.size
+        self.remaining_control = 2 * len(self.pending)
+
+        # Quadros já definidos: posição -> (stream, tipo, início, fim)
+        self.schedule = {}
+
+        # Streams já confirmados por completo (quadro de CLOSE confirmado)
+        self.completed_streams = 0
+
+    def map_input(self, input_path):
+        """ Os arquivos são mapeados um a um, quando o seu stream é aberto (ver ``OutgoingStream``) """
+
+        return sum(size for name, path, size in self.pending), None, memoryview(b'')
+
+    @property
+    def n_data_frames(self):
+        """ Número de quadros de streams (estimado enquanto houver arquivos a serem divididos) """
+
+        length = self.chunk_length()
+        return self.n_assigned + self.remaining_control + (self.remaining_bytes + length - 1) // length
+
+    def chunk_length(self):
+        """ Método que retorna quantos bytes do arquivo cabem no próximo quadro de dados (além do prefixo) """
+
+        return max(self.frame_length() - constants.STREAM_PREFIX_LENGTH, 1)
+
+    def assign(self, idx):
+        """ Método para definir os quadros até a posição idx, intercalando os streams abertos """
+
+        while self.n_assigned <= idx and (self.active or self.pending):
+            # Abrindo o próximo arquivo caso ainda caiba mais um stream
+            if self.pending and len(self.active) < self.max_open:
+                name, path, size = self.pending.pop()
+                stream = OutgoingStream(self.n_opened % STREAM_ID_SPACE, name, path)
+                self.remaining_bytes += stream.size - size
+                self.n_opened += 1
+                self.active.append(stream)
+                self.remaining_control -= 1
+                self.schedule[self.n_assigned] = (stream, STREAM_OPEN, 0, 0)
+
+            else:
+                self.turn %= len(self.active)
+                stream = self.active[self.turn]
+
+                if stream.offset < stream.size:
+                    begin = stream.offset
+                    stream.offset = min(begin + self.chunk_length(), stream.size)
+                    self.remaining_bytes -= stream.offset - begin
+                    self.schedule[self.n_assigned] = (stream, STREAM_DATA, begin, stream.offset)
+                    self.turn += 1
+
+                # O próximo stream passa a ocupar a posição deste na vez
+                else:
+                    self.active.pop(self.turn)
+                    self.remaining_control -= 1
+                    self.schedule[self.n_assigned] = (stream, STREAM_CLOSE, stream.size, stream.size)
+
+            self.n_assigned += 1
+
+    def build_segments(self, idx):
+        """ Método para construir os segmentos (cabeçalho, prefixo do stream e dados) do quadro de posição idx """
+
+        self.assign(idx)
+
+        # O último quadro é o END que demarca o fim de comunicação
+        if idx not in self.schedule:
+            return self.frame_segments(idx, constants.FLAG_END)
+
+        stream, kind, begin, end = self.schedule[idx]
+        prefix = pack(constants.STREAM_FORMAT, stream.id, kind)
+
+        flags, payload = constants.FLAG_DATA, b''
+        if kind == STREAM_OPEN:
+            payload = json.dumps({'name': stream.name, 'size': stream.size}).encode()
+        elif kind == STREAM_DATA:
+            payload = stream.data[begin:end]
+            if self.compress is not None:
+                payload, flags = self.compress_payload(payload)
+
+        return self.frame_segments(idx, flags | constants.FLAG_STREAM, prefix, payload)
+
+    def seek(self, offset, end=None):
+        raise ValueError('a retomada e a divisão em enlaces não são suportadas com streams')
+
+    def set_pipeline(self, pipeline):
+        """ Os quadros de streams são sempre preparados na thread de envio (o pipeline não é usado) """
+
+        pass
+
+    def release(self, idx):
+        """ Método para descartar os quadros anteriores a idx, fechando os arquivos já confirmados """
+
+        for i in [i for i in list(self.frames) if i < idx]:
+            del self.frames[i]
+        self.release_blocks(idx)
+
+        for i in sorted(i for i in list(self.schedule) if i < idx):
+            stream, kind, begin, end = self.schedule.pop(i)
+            if kind == STREAM_CLOSE:
+                stream.close()
+                self.completed_streams += 1
+            else:
+                stream.release(end)
+
+    def close(self):
+        for stream, kind, begin, end in self.schedule.values():
+            if kind == STREAM_CLOSE:
+                stream.close()
+
+        for stream in self.active:
+            stream.close()
+
+        self.schedule.clear()
+        self.active.clear()
+        super().close()
+
+class StreamSink:
+    """
+        Destino dos dados recebidos em streams: cada stream é escrito (com um ``OutputSink``)
+        em um arquivo com o seu nome dentro do diretório ``output_dir``.
+    """
+
+    def __init__(self, output_dir, flush_bytes=2**20, fsync=False):
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.flush_bytes = flush_bytes
+        self.fsync = fsync
+
+        # Streams abertos: id -> OutputSink
+        self.streams = {}
+        self.completed_streams = 0
+        self.closed_bytes = 0
+
+    @property
+    def bytes_written(self):
+        return self.closed_bytes + sum(sink.bytes_written for sink in self.streams.values())
+
+    def receive(self, stream, kind, payload):
+        """ Método para processar os dados (sem o prefixo) de um quadro do stream ``stream`` """
+
+        if kind == STREAM_OPEN:
+            self.open(stream, payload)
+
+        elif kind == STREAM_DATA and stream in self.streams:
+            self.streams[stream].write(payload)
+
+        elif kind == STREAM_CLOSE and stream in self.streams:
+            sink = self.streams.pop(stream)
+            sink.close()
+            self.closed_bytes += sink.bytes_written
+            self.completed_streams += 1
+
+    def open(self, stream, payload):
+        try:
+            name = json.loads(bytes(payload))['name']
+        except (ValueError, KeyError, TypeError):
+            name = None
+
+        # Nomes que sairiam do diretório de saída são trocados pelo id do stream
+        path = safe_path(name) if name is not None else None
+        if path is None:
+            path = 'stream-{}'.format(stream)
+
+        path = os.path.join(self.output_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        if stream in self.streams:
+            self.streams.pop(stream).close()
+        self.streams[stream] = OutputSink(path, self.flush_bytes, self.fsync)
+
+    def close(self):
+        # Streams incompletos (comunicação interrompida) mantêm os dados já recebidos
+        for sink in self.streams.values():
+            sink.close()
+            self.closed_bytes += sink.bytes_written
+
+        self.streams.clear()
@@ -0,0 +1,78 @@
+"""
+    Transferências divididas em vários enlaces paralelos (opção ``stripe``).
+
+    A ponta ativa abre ``count`` conexões DCCNET, cada uma atendida por um processo próprio
+    nas duas pontas. Cada ponta divide o seu arquivo de entrada em ``count`` trechos
+    contíguos (``stripe_range``) e o enlace ``index`` leva apenas o trecho ``index`` em cada
+    direção. Quem recebe escreve cada trecho diretamente na sua posição do arquivo de saída
+    (escrita posicional, ver utils/sink.py), então o arquivo é remontado sem cópias entre
+    os processos.
+
+    O primeiro enlace negocia a quantidade de enlaces no HELLO (a ponta passiva aceita até
+    o seu limite ``stripes``) e os demais são abertos em seguida, já com a quantidade
+    acordada. Cada ponta informa a posição do seu trecho:
+
+        ponta ativa:  {'index': i, 'count': quantidade pedida, 'offset': início do seu trecho i}
+        ponta passiva: {'index': i, 'count': quantidade acordada, 'offset': início do seu trecho i}
+
+    Como o trecho 0 sempre começa na posição 0, o primeiro enlace não depende da
+    quantidade acordada. Uma ponta passiva que não aceita a opção responde sem ela, e a
+    transferência inteira segue apenas no primeiro enlace.
+"""
+
+import queue
+
+def stripe_range(size, index, count):
+    """ Retorna o trecho (início, fim) de um arquivo com ``size`` bytes levado pelo enlace ``index`` de ``count`` """
+
+    return size * index // count, size * (index + 1) // count
+
+def stripe_request(index, count, size):
+    """ Retorna o pedido da ponta ativa (enlace ``index`` de ``count``, com uma entrada de ``size`` bytes) """
+
+    return {'index': index, 'count': count, 'offset': stripe_range(size, index, count)[0]}
+
+def agree_stripe(requested, stripes):
+    """
+        Retorna o enlace e a quantidade de enlaces acordados ({'index': ..., 'count': ...}) a
+        partir do pedido da ponta ativa e do limite ``stripes`` da passiva, ou None caso a
+        transferência não seja dividida.
+    """
+
+    if stripes <= 1 or not isinstance(requested, dict):
+        return None
+
+    try:
+        index, count = int(requested['index']), min(int(requested['count']), stripes)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if count <= 1 or not 0 <= index < count:
+        return None
+
+    return {'index': index, 'count': count}
+
+def peer_offset(stripe):
+    """ Retorna a posição do trecho informada pela outra ponta (0 caso inválida) """
+
+    offset = stripe.get('offset') if isinstance(stripe, dict) else None
+    return offset if isinstance(offset, int) and offset >= 0 else 0
+
+def wait_count(results, process, poll_interval=0.1):
+    """
+        Espera o primeiro enlace informar (pela fila ``results``) a quantidade de enlaces
+        acordada. Caso o processo termine antes disso, a transferência tem um único enlace.
+    """
+
+    while True:
+        try:
+            return results.get(timeout=poll_interval)
+        except queue.Empty:
+            if process.is_alive():
+                continue
+
+        # O processo pode ter terminado logo depois de informar a quantidade
+        try:
+            return results.get(timeout=poll_interval)
+        except queue.Empty:
+            return 1
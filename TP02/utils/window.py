@@ -0,0 +1,155 @@
+from utils import constants
+
+class SendWindow:
+    """
+        Janela de envio do modo Selective Repeat.
+
+        Guarda os quadros enviados e ainda não confirmados (com o instante do último
+        envio de cada um) e desliza a base da janela conforme os ACKs chegam.
+        Os quadros são identificados pela sua posição na fonte de quadros e o campo id
+        carrega essa posição módulo ``id_space`` (com janela 1 e id_space 2 temos
+        exatamente o pare-e-espere com bit alternado).
+    """
+
+    def __init__(self, frames, size, id_space=constants.ID_SPACE):
+        self.frames = frames
+        self.size = size
+        self.id_space = id_space
+
+        self.base = 0
+        self.next_idx = 0
+
+        # Quadros em trânsito: posição -> instante do último envio
+        self.outstanding = {}
+        self.acked = set()
+
+        # Instante do primeiro envio de cada quadro em trânsito e quais foram retransmitidos
+        self.first_sent_at = {}
+        self.retransmitted = set()
+
+    def done(self):
+        """ Retorna se todos os quadros (incluindo o END) foram confirmados """
+
+        return self.base == len(self.frames)
+
+    def can_send(self):
+        """ Retorna se existe um quadro novo que cabe na janela """
+
+        return self.next_idx < len(self.frames) and self.next_idx < self.base + self.size
+
+    def mark_sent(self, idx, now):
+        if idx in self.outstanding:
+            self.retransmitted.add(idx)
+        else:
+            self.first_sent_at[idx] = now
+
+        self.outstanding[idx] = now
+        if idx == self.next_idx:
+            self.next_idx += 1
+
+    def restart(self, idx, now):
+        """ Reinicia o temporizador do quadro idx (ainda não confirmado) no instante em que ele terminou de ser enviado """
+
+        if idx not in self.outstanding:
+            return
+
+        self.outstanding[idx] = now
+        if idx not in self.retransmitted:
+            self.first_sent_at[idx] = now
+
+    def expired(self, now, timeout):
+        """ Retorna as posições dos quadros cujo temporizador expirou """
+
+        return [idx for idx, sent_at in self.outstanding.items() if now - sent_at >= timeout]
+
+    def next_deadline(self, timeout):
+        """ Retorna o instante em que o próximo temporizador expira (ou None) """
+
+        if not self.outstanding:
+            return None
+
+        return min(self.outstanding.values()) + timeout
+
+    def ack(self, id, now):
+        """
+            Processa o ACK de um id, retornando (amostra de RTT, latência) do quadro
+            confirmado, onde a latência é o tempo desde o primeiro envio do quadro.
+            Seguindo a regra de Karn, quadros retransmitidos não geram amostra de RTT
+            (a amostra é None). ACKs que não correspondem a nenhum quadro em trânsito
+            retornam None.
+        """
+
+        offset = (id - self.base) % self.id_space
+        idx = self.base + offset
+        if offset >= self.size or idx not in self.outstanding:
+            return None
+
+        del self.outstanding[idx]
+        self.acked.add(idx)
+
+        latency = sample = now - self.first_sent_at.pop(idx)
+        if idx in self.retransmitted:
+            self.retransmitted.remove(idx)
+            sample = None
+
+        # Deslizando a base da janela enquanto os quadros estiverem confirmados
+        while self.base in self.acked:
+            self.acked.remove(self.base)
+            self.base += 1
+
+        self.frames.release(self.base)
+        return sample, latency
+
+class RecvWindow:
+    """
+        Janela de recebimento do modo Selective Repeat.
+
+        Quadros que chegam fora de ordem (mas dentro da janela) são guardados até
+        que os quadros anteriores cheguem, sendo então entregues em ordem.
+    """
+
+    # Resultados possíveis ao receber um quadro
+    NEW, DUPLICATE, OUT_OF_WINDOW = range(3)
+
+    def __init__(self, size, id_space=constants.ID_SPACE):
+        self.size = size
+        self.id_space = id_space
+
+        self.base = 0
+        self.buffer = {}
+
+    def position(self, id):
+        """ Retorna a posição que um quadro novo com o campo id ocupa """
+
+        return self.base + (id - self.base) % self.id_space
+
+    def receive(self, id, frame):
+        """
+            Guarda um quadro recebido, retornando se ele é novo, uma duplicata de um
+            quadro já recebido (que deve ser confirmado novamente) ou se está fora da janela.
+        """
+
+        offset = (id - self.base) % self.id_space
+        if offset < self.size:
+            idx = self.base + offset
+            if idx in self.buffer:
+                return self.DUPLICATE
+
+            self.buffer[idx] = frame
+            return self.NEW
+
+        # Quadros da janela anterior já foram entregues, mas o ACK pode ter se perdido
+        if offset >= self.id_space - self.size:
+            return self.DUPLICATE
+
+        return self.OUT_OF_WINDOW
+
+    def deliver(self):
+        """ Retorna (e remove da janela) os quadros que já podem ser entregues em ordem """
+
+        frames = []
+        while self.base in self.buffer:
+            frames.append(self.buffer.pop(self.base))
+            self.base += 1
+
+        return frames
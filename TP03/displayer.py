@@ -8,7 +8,7 @@ from utils.common import type_encoder, type_decoder
 
 from utils.common import recv_ok_message
 from utils.common import initialize_client
-from utils.common import recv_expected_length
+from utils.common import recv_view, recv_expected_length
 
 from utils.common import send_ok_message
 from utils.common import send_flw_message
@@ -24,11 +24,11 @@ def recv_file_chunks(sock, client_id, n_chunks):
     chunks = []
     for _ in range(n_chunks):
         # Lendo cabeçalho apenas para recuperarmos o número de sequência
-        header = recv_expected_length(sock, 8)
+        header = recv_view(sock, 8)
         _, _, _, seq_number = unpack('!4H', header)
 
         # Lendo os metadados para recuperarmos o tamanho do chunk
-        _, _, len_chunk = unpack('!3H', recv_expected_length(sock, 6))
+        _, _, len_chunk = unpack('!3H', recv_view(sock, 6))
         chunk = recv_expected_length(sock, len_chunk)
 
         # Armazenando chunk e enviando OK
@@ -44,7 +44,7 @@ def run_client(sock, client_id):
     """
 
     while True:
-        header = recv_expected_length(sock, 8)
+        header = recv_view(sock, 8)
         message_type, source_id, _, seq_number = unpack('!4H', header)
 
         if type_decoder[message_type] == 'FLW':
@@ -54,7 +54,7 @@ def run_client(sock, client_id):
 
         elif type_decoder[message_type] == 'MSG':
             # Lendo a mensagem propriamente dita
-            message_length = unpack('!H', recv_expected_length(sock, 2))[0]
+            message_length = unpack('!H', recv_view(sock, 2))[0]
             message_body = recv_expected_length(sock, message_length)
             
             print('< MSG from {}: {}'.format(source_id, message_body.decode('ascii')))
@@ -62,8 +62,8 @@ def run_client(sock, client_id):
 
         elif type_decoder[message_type] == 'CLIST':
             # Lendo a lista de clientes
-            n_clients = unpack('!H', recv_expected_length(sock, 2))[0]
-            client_list = recv_expected_length(sock, 2 * n_clients)
+            n_clients = unpack('!H', recv_view(sock, 2))[0]
+            client_list = recv_view(sock, 2 * n_clients)
 
             fmt = '!{}H'.format(n_clients)
             client_list = unpack(fmt, client_list)
@@ -73,7 +73,7 @@ def run_client(sock, client_id):
 
         elif type_decoder[message_type] == 'FILE':
             # Lendo metadados da mensagem
-            file_id, n_chunks, len_ext = unpack('!3H', recv_expected_length(sock, 6))
+            file_id, n_chunks, len_ext = unpack('!3H', recv_view(sock, 6))
             file_ext = recv_expected_length(sock, len_ext)
             file_ext = file_ext.decode('ascii')
 
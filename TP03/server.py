@@ -6,7 +6,7 @@ from struct import unpack
 from utils.constants import SERVER_ID
 from utils.common import recv_ok_message, type_encoder, type_decoder
 
-from utils.common import recv_expected_length
+from utils.common import recv_view, recv_expected_length
 from utils.common import is_sender, is_displayer
 
 from utils.common import send_ok_message
@@ -45,7 +45,7 @@ def create_client(sock):
     print('< received connection from:', addr)
 
     # Esperamos receber uma mensagem OI para estabelecer conexão
-    header = recv_expected_length(conn, 8)
+    header = recv_view(conn, 8)
     message_type, source_id, dest_id, seq_number = unpack('!4H', header)
 
     # Verificando se temos identificadores disponíveis para esse cliente
@@ -92,7 +92,7 @@ def process_displayer(client_id):
     sock = displayers[client_id]['sock']
     sender_id = displayers[client_id]['sender_id']
 
-    header = recv_expected_length(sock, 8)
+    header = recv_view(sock, 8)
     message_type, source_id, dest_id, seq_number = unpack('!4H', header)
 
     # Verificando se a mensagem recebida é de fato do cliente
@@ -204,7 +204,7 @@ def process_sender_msg_message(sock, client_id, dest_id, seq_number):
     """
 
     # Lendo a mensagem propriamente dita
-    message_length = unpack('!H', recv_expected_length(sock, 2))[0]
+    message_length = unpack('!H', recv_view(sock, 2))[0]
     message_body = recv_expected_length(sock, message_length)
     
     # Recuperando para quais exibidores nós devemos encaminhar a mensagem
@@ -261,7 +261,7 @@ def process_sender_file_message(sock, client_id, dest_id, seq_number):
     """
 
     # Lendo metadados da mensagem
-    file_id, n_chunks, len_ext = unpack('!3H', recv_expected_length(sock, 6))
+    file_id, n_chunks, len_ext = unpack('!3H', recv_view(sock, 6))
     file_ext = recv_expected_length(sock, len_ext)
  
     # Recuperando para quais exibidores nós devemos encaminhar a mensagem
@@ -289,11 +289,11 @@ def process_sender_file_message(sock, client_id, dest_id, seq_number):
     # Iremos repassar N chunks do emissor para os exibidores
     for _ in range(n_chunks):
         # Lendo cabeçalho apenas para recuperarmos o número de sequência
-        chunk_header = recv_expected_length(sock, 8)
+        chunk_header = recv_view(sock, 8)
         _, _, _, seq_number = unpack('!4H', chunk_header)
 
         # Lendo os metadados para recuperarmos o tamanho do chunk
-        chunk_metadata = recv_expected_length(sock, 6)
+        chunk_metadata = recv_view(sock, 6)
         file_id, chunk_id, len_chunk = unpack('!3H', chunk_metadata)
         chunk = recv_expected_length(sock, len_chunk)
 
@@ -318,7 +318,7 @@ def process_sender(client_id):
     sock = senders[client_id]['sock']
     displayer_id = senders[client_id]['displayer_id']
 
-    header = recv_expected_length(sock, 8)
+    header = recv_view(sock, 8)
     message_type, source_id, dest_id, seq_number = unpack('!4H', header)
 
     # Verificando se a mensagem recebida é de fato do cliente
@@ -1,7 +1,7 @@
+import weakref
 from struct import pack, unpack
 
-from .constants import BUFSZ
-from .constants import SERVER_ID
+from .constants import BUFSZ, SERVER_ID
 
 type_encoder = {
     'OK': 1, 'ERRO': 2, 'OI': 3,
@@ -11,39 +11,74 @@ type_encoder = {
 
 type_decoder = {value:key for key, value in type_encoder.items()}
 
+# Buffers de recebimento de cada socket (ver ``socket_buffer``), descartados junto com o socket
+_buffers = weakref.WeakKeyDictionary()
+
 def is_sender(id):
     return id >= 1 and id <= (2**12 - 1)
 
 def is_displayer(id):
     return id >= 2**12 and id <= (2**13 - 1)
 
-def recv_expected_length(sock, expected_length):
+def recv_into_buffer(sock, view):
     """
-        Método auxiliar para lermos uma quantidade esperada de bytes de um recv.
-        O método pode gerar uma excessão ``RuntimeError`` indicando um erro na comunicação.
+        Função auxiliar para preenchermos por completo um buffer (memoryview) com
+        ``recv_into``, sem criarmos objetos intermediários a cada leitura.
+        A função pode gerar uma excessão ``RuntimeError`` indicando um erro na comunicação.
     """
 
-    buffer = b''
     bytes_received = 0
-
-    while bytes_received < expected_length:            
-        data = sock.recv(min(expected_length - bytes_received, BUFSZ))
-        if not data:
+    while bytes_received < len(view):
+        n_bytes = sock.recv_into(view[bytes_received:])
+        if n_bytes == 0:
             raise RuntimeError('connection terminated unexpectedly')
 
-        buffer += data
-        bytes_received = bytes_received + len(data)
+        bytes_received = bytes_received + n_bytes
+
+def socket_buffer(sock, length):
+    """
+        Função auxiliar que retorna o buffer de recebimento do socket, com pelo menos
+        ``length`` bytes. Cada socket tem um único buffer (de BUFSZ bytes, ou do tamanho
+        da maior mensagem recebida), reutilizado em todas as leituras.
+    """
+
+    buffer = _buffers.get(sock)
+    if buffer is None or len(buffer) < length:
+        buffer = bytearray(max(length, BUFSZ))
+        _buffers[sock] = buffer
 
     return buffer
 
+def recv_view(sock, expected_length):
+    """
+        Função auxiliar para lermos uma quantidade esperada de bytes no buffer do socket,
+        sem alocações. A memoryview retornada só é válida até a próxima leitura do mesmo
+        socket, então deve ser usada para dados consumidos na hora (cabeçalhos e metadados).
+        A função pode gerar uma excessão ``RuntimeError`` indicando um erro na comunicação.
+    """
+
+    view = memoryview(socket_buffer(sock, expected_length))[:expected_length]
+    recv_into_buffer(sock, view)
+
+    return view
+
+def recv_expected_length(sock, expected_length):
+    """
+        Método auxiliar para lermos uma quantidade esperada de bytes de um recv.
+        Os bytes são lidos no buffer do socket e copiados uma única vez para o ``bytes``
+        retornado, que pode ser guardado (corpo das mensagens e chunks dos arquivos).
+        O método pode gerar uma excessão ``RuntimeError`` indicando um erro na comunicação.
+    """
+
+    return bytes(recv_view(sock, expected_length))
+
 def recv_ok_message(sock, expected_header):
     """ 
         Função auxiliar para verificarmos se os próximos bytes representam um OK.
         Essa função retornará True caso recebermos um OK válido e False caso contrário
     """
 
-    header = recv_expected_length(sock, 8)
-    header = unpack('!4H', header)
+    header = unpack('!4H', recv_view(sock, 8))
     return header == expected_header
 
 def initialize_client(sock, ip, host, source_id):
@@ -55,8 +90,7 @@ def initialize_client(sock, ip, host, source_id):
     send_oi_message(sock, source_id, 0)
 
     # Verificando se recebemos um OK do servidor
-    header = recv_expected_length(sock, 8)
-    header = unpack('!4H', header)
+    header = unpack('!4H', recv_view(sock, 8))
 
     if type_decoder[header[0]] == 'OK':
         client_id = header[2]